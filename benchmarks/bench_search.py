@@ -0,0 +1,354 @@
+"""
+End-to-end latency and throughput benchmark of /v1/search, offline.
+
+Boots the FastAPI app in this process against local stand-ins (see fakes.py): a fake search provider, a local
+server playing the web (HTML pages with configurable latency and failures) and OpenAI-compatible LLM and
+embedding endpoints, and in-memory cache tiers (or the real Redis and Mongo ones with `--caches real`).
+Requests go straight to the app through an ASGI transport, the real HTTP fetcher, extraction pool, embedding
+batcher, LLM scheduler and coalescing all run. For each concurrency level it runs these scenarios:
+
+- cold: new queries on empty caches, every stage runs (pages are shared between queries, as on the web)
+- warm: the same queries again, answered by the in-process cache
+- warm-query: the same queries with the in-process cache emptied, answered by the query (vector) cache
+
+and reports the p50/p95/p99 latency, requests per second and errors, then a breakdown per pipeline stage
+(count, mean and p95 from the Prometheus histograms) and the hit rate of each cache tier.
+
+Usage (from the repository root):
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --concurrency 1 8 32 --requests 200 --llm-latency-ms 800
+    python benchmarks/bench_search.py --page-failure-rate 0.1 --page-slow-rate 0.02 --deadline-ms 3000
+    REDIS_URL=redis://localhost:6379/0 MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_search.py --caches real
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import time
+import uuid
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from fakes import WORDS, FakeConfig, fake_search_provider, serve_dependencies, use_memory_caches
+
+
+SCENARIOS = ["cold", "warm", "warm-query"]
+STAGES = ["query_cache", "embedding", "page_store", "download", "extraction", "chunk_selection", "llm"]
+TIERS = ["local", "query", "serp", "page", "answer"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_dependencies(config: FakeConfig, port: int) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(target=serve_dependencies, args=(config, port), daemon=True)
+    process.start()
+
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/ping", timeout=1).raise_for_status()
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError("The fake dependencies didn't start")
+
+
+def configure_environment(args: argparse.Namespace, port: int):
+    # read by constants.py when the app is imported
+    os.environ.update({
+        "LLM_URL": f"http://127.0.0.1:{port}/v1",
+        "LLM_API_KEY": "bench",
+        "LLM_MODEL_NAME": "fake-llm",
+        "EMBEDDING_URL": f"http://127.0.0.1:{port}/v1",
+        "EMBEDDING_API_KEY": "bench",
+        "EMBEDDING_MODEL_NAME": "fake-embedding",
+        "EMBEDDING_DIM": str(args.embedding_dim),
+    })
+    os.environ.setdefault("LLM_BASE_MODEL_NAME", "gpt-4o")
+
+    if args.caches == "memory":
+        # the clients are created (without connecting) before being swapped
+        os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1/0")
+        os.environ.setdefault("MONGO_URL", "mongodb://127.0.0.1:1")
+    os.environ.setdefault("MONGO_DB_NAME", "titan_sight_bench")
+    os.environ.setdefault("MONGO_COLLECTION_NAME", "pages")
+
+    # metrics are read from this process' registry
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    # offline, tiktoken can't download its vocabulary: count bytes instead, only the truncation depends on it
+    import tiktoken
+
+    try:
+        tiktoken.encoding_for_model(os.environ["LLM_BASE_MODEL_NAME"])
+    except Exception:
+        print("tiktoken vocabulary unavailable, counting tokens as bytes", file=sys.stderr)
+        encoding = tiktoken.Encoding(
+            name="bytes",
+            pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+            mergeable_ranks={bytes([i]): i for i in range(256)},
+            special_tokens={},
+        )
+        tiktoken.encoding_for_model = lambda model_name: encoding
+
+    # the DuckDuckGo provider is replaced by the fake one, don't build its client
+    import duckduckgo_search
+
+    duckduckgo_search.DDGS = lambda *args, **kwargs: None
+
+
+def make_queries(count: int, seed: str) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{' '.join(rng.choices(WORDS, k=5))} {seed}-{i}" for i in range(count)]
+
+
+# Metrics
+
+def snapshot() -> Dict[Tuple[str, Tuple], float]:
+    from prometheus_client import REGISTRY
+
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for metric in REGISTRY.collect()
+        if metric.name.startswith("titan_sight_")
+        for sample in metric.samples
+    }
+
+
+def delta(before: dict, after: dict) -> dict:
+    return {key: value - before.get(key, 0.0) for key, value in after.items()}
+
+
+def histogram_quantile(deltas: dict, name: str, labels: Dict[str, str], quantile: float) -> Optional[float]:
+    # cumulative bucket counts, interpolated within the bucket holding the quantile
+    buckets = sorted(
+        (float(dict(key_labels)["le"]), value)
+        for (sample_name, key_labels), value in deltas.items()
+        if sample_name == f"{name}_bucket" and all(dict(key_labels).get(k) == v for k, v in labels.items())
+    )
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+
+    rank = quantile * buckets[-1][1]
+    lower, lower_count = 0.0, 0.0
+    for upper, count in buckets:
+        if count >= rank:
+            if upper == float("inf"):
+                return lower
+            return lower + (upper - lower) * (rank - lower_count) / max(count - lower_count, 1e-9)
+        lower, lower_count = upper, count
+    return lower
+
+
+def stage_breakdown(deltas: dict) -> Dict[str, dict]:
+    series = [("titan_sight_stage_duration_seconds", {"stage": stage}, stage) for stage in STAGES]
+    series.append(("titan_sight_serp_duration_seconds", {"provider": "fake"}, "serp"))
+
+    breakdown = {}
+    for name, labels, stage in series:
+        key_labels = tuple(sorted(labels.items()))
+        count = deltas.get((f"{name}_count", key_labels), 0.0)
+        total = deltas.get((f"{name}_sum", key_labels), 0.0)
+        timeouts = deltas.get(("titan_sight_stage_timeouts_total", (("stage", stage),)), 0.0)
+        breakdown[stage] = {
+            "count": int(count),
+            "mean_ms": total / count * 1000 if count else None,
+            "p95_ms": (histogram_quantile(deltas, name, labels, 0.95) or 0) * 1000 if count else None,
+            "timeouts": int(timeouts),
+        }
+    return breakdown
+
+
+def cache_breakdown(deltas: dict) -> Dict[str, dict]:
+    breakdown = {}
+    for tier in TIERS:
+        hits = deltas.get(("titan_sight_cache_lookups_total", (("result", "hit"), ("tier", tier))), 0.0)
+        misses = deltas.get(("titan_sight_cache_lookups_total", (("result", "miss"), ("tier", tier))), 0.0)
+        breakdown[tier] = {
+            "hits": int(hits),
+            "misses": int(misses),
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+    return breakdown
+
+
+# Load
+
+async def run_scenario(client: httpx.AsyncClient, queries: List[str], concurrency: int, params: dict) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    empty = 0
+    results = 0
+    pending = iter(queries)
+
+    async def worker():
+        nonlocal errors, empty, results
+        # the iterator is shared, each worker takes the next query until there are none left
+        for query in pending:
+            start_time = time.perf_counter()
+            try:
+                response = await client.get("/v1/search", params={"query": query, **params})
+                response.raise_for_status()
+                num_results = len(response.json()["results"])
+            except Exception as e:
+                print(f"Error searching '{query}': {e!r}", file=sys.stderr)
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start_time)
+            results += num_results
+            empty += num_results == 0
+
+    before = snapshot()
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start_time
+    deltas = delta(before, snapshot())
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": len(queries),
+        "errors": errors,
+        "empty": empty,
+        "avg_results": results / len(latencies) if latencies else 0.0,
+        "elapsed_s": elapsed,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(latencies_ms, 50)) if latencies else None,
+        "p95_ms": float(np.percentile(latencies_ms, 95)) if latencies else None,
+        "p99_ms": float(np.percentile(latencies_ms, 99)) if latencies else None,
+        "stages": stage_breakdown(deltas),
+        "caches": cache_breakdown(deltas),
+    }
+
+
+def fmt(value: Optional[float], spec: str = ">9.1f") -> str:
+    return format(value, spec) if value is not None else format("-", spec.rstrip("f").split(".")[0] or ">9")
+
+
+def print_report(scenario: str, report: dict):
+    print(
+        f"\n== {scenario}, concurrency {report['concurrency']}: {report['requests']} requests in {report['elapsed_s']:.1f}s, "
+        f"{report['rps']:.1f} req/s, {report['errors']} errors, {report['empty']} empty, {report['avg_results']:.2f} results/response"
+    )
+    print(f"   latency (ms)   p50 {fmt(report['p50_ms'])}   p95 {fmt(report['p95_ms'])}   p99 {fmt(report['p99_ms'])}")
+
+    print(f"   {'stage':<12} {'count':>7} {'mean ms':>9} {'p95 ms':>9} {'timeouts':>9}")
+    for stage, row in report["stages"].items():
+        if row["count"] or row["timeouts"]:
+            print(f"   {stage:<12} {row['count']:>7} {fmt(row['mean_ms'])} {fmt(row['p95_ms'])} {row['timeouts']:>9}")
+
+    print(f"   {'cache':<12} {'hits':>7} {'misses':>9} {'hit rate':>9}")
+    for tier, row in report["caches"].items():
+        if row["hits"] or row["misses"]:
+            print(f"   {tier:<12} {row['hits']:>7} {row['misses']:>9} {fmt(row['hit_rate'], '>9.2f')}")
+
+
+async def run(args: argparse.Namespace, config: FakeConfig, port: int) -> List[dict]:
+    import app as app_module
+    import clients
+    from logs import logger
+    from search import PROVIDERS
+
+    logger.setLevel(args.log_level.upper())
+
+    # the endpoint only accepts the registered provider names, the fake one takes the place of duckduckgo
+    PROVIDERS["duckduckgo"] = fake_search_provider(f"http://127.0.0.{{}}:{port}", config, args.serp_latency_ms, args.serp_results)
+
+    params = {
+        "provider": "duckduckgo",
+        "max_num_result": args.max_num_result,
+        "sumup_page_timeout": args.sumup_page_timeout,
+        "overfetch_factor": args.overfetch_factor,
+    }
+    if args.deadline_ms:
+        params["deadline_ms"] = args.deadline_ms
+
+    reports = []
+    transport = httpx.ASGITransport(app=app_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        try:
+            for concurrency in args.concurrency:
+                if args.caches == "memory":
+                    use_memory_caches()
+                queries = make_queries(args.requests, f"{args.seed}-{concurrency}-{uuid.uuid4().hex[:6]}")
+
+                for scenario in args.scenarios:
+                    if scenario != "cold":
+                        # let the background cache writes of the previous scenario land
+                        await asyncio.sleep(args.settle)
+                    if scenario == "warm-query":
+                        clients.local_cache_client._entries.clear()
+                        clients.local_cache_client.size = 0
+
+                    report = await run_scenario(client, queries, concurrency, params)
+                    report["scenario"] = scenario
+                    print_report(scenario, report)
+                    reports.append(report)
+        finally:
+            await clients.http_fetcher.close()
+            clients.extraction_client.close()
+            if args.caches == "real":
+                await clients.short_term_cache_client.close()
+                clients.long_term_cache_client.close()
+
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--caches", choices=["memory", "real"], default="memory", help="real: REDIS_URL and MONGO_URL from the environment")
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds between two scenarios, for background cache writes")
+    parser.add_argument("--log-level", default="warning", help="of the service, its per-request info logs add up under load")
+    parser.add_argument("--output", help="also write the reports to this JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+
+    request = parser.add_argument_group("requests")
+    request.add_argument("--max-num-result", type=int, default=3)
+    request.add_argument("--sumup-page-timeout", type=int, default=15)
+    request.add_argument("--overfetch-factor", type=float, default=1.0)
+    request.add_argument("--deadline-ms", type=int)
+
+    fakes = parser.add_argument_group("fake dependencies")
+    fakes.add_argument("--serp-latency-ms", type=float, default=300)
+    fakes.add_argument("--serp-results", type=int, default=10)
+    for field, value in asdict(FakeConfig()).items():
+        if field != "seed":
+            fakes.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    config = FakeConfig(**{field: getattr(args, field) for field in asdict(FakeConfig())})
+    port = free_port()
+    dependencies = start_dependencies(config, port)
+
+    try:
+        configure_environment(args, port)
+        reports = asyncio.run(run(args, config, port))
+    finally:
+        dependencies.kill()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {**vars(args)}, "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of the page truncation in LLMClient.summarize_page.
+
+Compares the previous line-by-line routine (one tokenizer call per line, string concatenation)
+with LLMClient.truncate_to_tokens (one tokenizer call per page) on synthetic pages of growing size.
+
+Usage (from the repository root):
+    python benchmarks/bench_truncation.py --base-model gpt-4o
+    python benchmarks/bench_truncation.py --base-model google/gemma-2-9b-it --lines 500 2000 8000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def make_page(num_lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = ["search", "engine", "cache", "page", "query", "result", "latency", "token", "model", "answer",
+             "Hà Nội", "thời tiết", "über", "naïve", "東京", "2024", "$19.99", "https://example.com/a?b=c"]
+    return "\n".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(0, 30)))
+        for _ in range(num_lines)
+    )
+
+
+def truncate_line_by_line(tokenizer, details: str, max_tokens: int) -> str:
+    # the routine summarize_page used before truncate_to_tokens
+    truncated = ""
+    current_num_tokens = 0
+
+    for line in details.split("\n"):
+        line_num_tokens = len(tokenizer.encode(line))
+
+        if current_num_tokens + line_num_tokens > max_tokens:
+            break
+
+        truncated += line + "\n"
+        current_num_tokens += line_num_tokens
+
+    return truncated
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-model", required=True, help="tiktoken model name or Hugging Face tokenizer id")
+    parser.add_argument("--max-tokens", type=int, default=2048)
+    parser.add_argument("--lines", type=int, nargs="+", default=[200, 1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # the clients package builds its clients at import time, they only need to be constructible
+    os.environ["LLM_BASE_MODEL_NAME"] = args.base_model
+    os.environ.setdefault("LLM_API_KEY", "benchmark")
+    os.environ.setdefault("EMBEDDING_API_KEY", "benchmark")
+
+    from clients import llm_client
+
+    print(f"tokenizer: {type(llm_client.tokenizer).__name__}, max tokens: {args.max_tokens}")
+    print(f"{'lines':>8} {'chars':>10} {'tokens':>8} {'line-by-line ms':>16} {'single-pass ms':>15} {'speedup':>8}")
+
+    for num_lines in args.lines:
+        page = make_page(num_lines)
+        num_tokens = len(llm_client.tokenizer.encode(page))
+
+        old = timeit(lambda: truncate_line_by_line(llm_client.tokenizer, page, args.max_tokens), args.repeat)
+        new = timeit(lambda: llm_client.truncate_to_tokens(page, args.max_tokens), args.repeat)
+
+        print(f"{num_lines:>8} {len(page):>10} {num_tokens:>8} {old * 1000:>16.2f} {new * 1000:>15.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Recall and latency benchmark of the query-cache vector index: HNSW against FLAT (exact).
+
+Loads clustered random unit vectors into a Redis Stack instance, indexed by both a FLAT and an HNSW index,
+then runs near-duplicate queries (a stored vector plus noise, like a rephrased cached query) and reports,
+for each size and EF_RUNTIME value, the HNSW recall@k against FLAT and the p50/p95 latency of both.
+Documents are stored as hashes to keep loading fast; the index algorithms behave the same on JSON documents.
+
+Usage (from the repository root, against a disposable Redis Stack; 1M vectors of dim 512 need ~4GB of memory):
+    python benchmarks/bench_vector_index.py --redis-url redis://localhost:6379/0
+    python benchmarks/bench_vector_index.py --sizes 10000 100000 1000000 --m 16 32 --ef-runtime 10 20 50 100
+"""
+
+import argparse
+import time
+
+import numpy as np
+import redis
+from redis.commands.search.field import VectorField
+from redis.commands.search.indexDefinition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+
+PREFIX = "bench:vss:"
+
+
+def make_vectors(rng: np.random.Generator, centers: np.ndarray, count: int) -> np.ndarray:
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.normal(0, 0.3, (count, centers.shape[1]))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def create_index(client: redis.Redis, name: str, algorithm: str, dim: int, m: int = 16, ef_construction: int = 200):
+    attributes = {"TYPE": "FLOAT32", "DIM": dim, "DISTANCE_METRIC": "COSINE"}
+    if algorithm == "HNSW":
+        attributes.update({"M": m, "EF_CONSTRUCTION": ef_construction})
+
+    client.ft(name).create_index(
+        fields=[VectorField("vector", algorithm, attributes)],
+        definition=IndexDefinition(prefix=[PREFIX], index_type=IndexType.HASH),
+    )
+
+
+def wait_indexed(client: redis.Redis, names):
+    for name in names:
+        while float(client.ft(name).info().get("percent_indexed", 1)) < 1:
+            time.sleep(0.5)
+
+
+def knn(client: redis.Redis, name: str, vector: np.ndarray, k: int, ef_runtime: int = None):
+    params = {"vector": vector.tobytes()}
+    if ef_runtime is None:
+        clause = f"KNN {k} @vector $vector AS score"
+    else:
+        clause = f"KNN {k} @vector $vector EF_RUNTIME $ef AS score"
+        params["ef"] = ef_runtime
+
+    query = Query(f"(*)=>[{clause}]").sort_by("score").return_fields("score").paging(0, k).dialect(2)
+
+    start_time = time.perf_counter()
+    docs = client.ft(name).search(query, params).docs
+    return [doc.id for doc in docs], time.perf_counter() - start_time
+
+
+def percentiles(latencies):
+    return np.percentile(np.array(latencies) * 1000, 50), np.percentile(np.array(latencies) * 1000, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/0")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=1, help="the cache looks up the single nearest query")
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-runtime", type=int, nargs="+", default=[10, 20, 50, 100])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(0, 1, (max(args.sizes) // 100, args.dim))
+
+    flat_index = "bench:idx:flat"
+    hnsw_indexes = {m: f"bench:idx:hnsw:m{m}" for m in args.m}
+
+    create_index(client, flat_index, "FLAT", args.dim)
+    for m, name in hnsw_indexes.items():
+        create_index(client, name, "HNSW", args.dim, m=m, ef_construction=args.ef_construction)
+
+    print(f"{'size':>9} {'M':>4} {'ef_rt':>6} {'recall@' + str(args.k):>9} {'flat p50':>9} {'flat p95':>9} {'hnsw p50':>9} {'hnsw p95':>9}  (ms)")
+
+    stored = np.empty((0, args.dim), dtype=np.float32)
+    try:
+        for size in sorted(args.sizes):
+            # add the missing documents, the indexes are updated as they are written
+            new_vectors = make_vectors(rng, centers, size - len(stored))
+            for start in range(0, len(new_vectors), 1000):
+                pipe = client.pipeline(transaction=False)
+                for offset, vector in enumerate(new_vectors[start:start + 1000]):
+                    pipe.hset(f"{PREFIX}{len(stored) + start + offset}", mapping={"vector": vector.tobytes()})
+                pipe.execute()
+            stored = np.concatenate([stored, new_vectors])
+            wait_indexed(client, [flat_index, *hnsw_indexes.values()])
+
+            # near-duplicates of stored vectors
+            queries = stored[rng.integers(0, len(stored), args.queries)] + rng.normal(0, 0.02, (args.queries, args.dim))
+            queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+            exact, flat_latencies = zip(*[knn(client, flat_index, query, args.k) for query in queries])
+            flat_p50, flat_p95 = percentiles(flat_latencies)
+
+            for m, name in hnsw_indexes.items():
+                for ef_runtime in args.ef_runtime:
+                    approx, hnsw_latencies = zip(*[knn(client, name, query, args.k, ef_runtime) for query in queries])
+                    recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(approx, exact) if e])
+                    hnsw_p50, hnsw_p95 = percentiles(hnsw_latencies)
+
+                    print(f"{size:>9} {m:>4} {ef_runtime:>6} {recall:>9.3f} {flat_p50:>9.2f} {flat_p95:>9.2f} {hnsw_p50:>9.2f} {hnsw_p95:>9.2f}")
+    finally:
+        for name in [flat_index, *hnsw_indexes.values()]:
+            client.ft(name).dropindex(delete_documents=False)
+        for start in range(0, len(stored), 10_000):
+            client.delete(*[f"{PREFIX}{i}" for i in range(start, min(start + 10_000, len(stored)))])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,498 @@
+"""
+Local stand-ins for every external dependency of the search service, used by bench_search.py.
+
+- `create_dependency_app`: one HTTP server playing the web (a corpus of HTML pages with configurable latency
+  and failures, honouring If-None-Match) and OpenAI-compatible LLM and embedding endpoints.
+- `FakeSearchProvider`: a search provider returning deterministic links into that corpus.
+- `MemoryQueryCache`, `MemoryPageStore`, `MemoryAnswerCache`, `MemoryNegativeCache`, `MemorySerpCache`: in-memory cache tiers
+  with the interface of the Redis and Mongo clients, swapped in with `use_memory_caches`.
+"""
+
+import asyncio
+import base64
+import hashlib
+import random
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+
+WORDS = (
+    "search engine page cache latency answer query result index vector model token server network "
+    "request response worker process memory storage document content summary language system data "
+    "performance throughput python redis mongo extraction download provider ranking relevance user"
+).split()
+
+
+@dataclass
+class FakeConfig:
+    """
+    Behaviour of the fake dependencies, times in milliseconds.
+    Attributes:
+        num_pages (int): Number of pages in the corpus
+        page_paragraphs (int): Paragraphs per page, ~60 words each
+        page_latency_ms (float): Mean time to first byte of a page
+        page_jitter_ms (float): Standard deviation of the page latency
+        page_failure_rate (float): Fraction of page requests answered with a 503
+        page_slow_rate (float): Fraction of page requests which hang for `page_slow_ms`
+        page_slow_ms (float): Latency of a hanging page, above the fetch timeout to exercise it
+        llm_latency_ms (float): Fixed latency of a completion
+        llm_ms_per_token (float): Added latency per completion token
+        llm_completion_tokens (int): Tokens of each completion
+        embedding_latency_ms (float): Latency of an embedding call, whatever its batch size
+        embedding_dim (int): Dimension of the embeddings
+        num_hosts (int): Pages are spread over 127.0.0.1..127.0.0.<num_hosts>, the fetcher limits concurrency per host
+        seed (int): Seed of the corpus and of the injected latencies and failures
+    """
+    num_pages: int = 2000
+    page_paragraphs: int = 20
+    page_latency_ms: float = 100
+    page_jitter_ms: float = 50
+    page_failure_rate: float = 0.02
+    page_slow_rate: float = 0.0
+    page_slow_ms: float = 15000
+    llm_latency_ms: float = 400
+    llm_ms_per_token: float = 5
+    llm_completion_tokens: int = 60
+    embedding_latency_ms: float = 10
+    embedding_dim: int = 512
+    num_hosts: int = 32
+    seed: int = 0
+
+
+def make_page(page_id: int, paragraphs: int, seed: int = 0) -> str:
+    rng = random.Random(f"{seed}:{page_id}")
+    title = " ".join(rng.choices(WORDS, k=6)).capitalize()
+    body = "\n".join(
+        f"<p>{' '.join(rng.choices(WORDS, k=60)).capitalize()}.</p>"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<!DOCTYPE html><html><head><title>{title}</title></head><body>"
+        f"<nav><a href='/'>Home</a> <a href='/about'>About</a></nav>"
+        f"<article><h1>{title}</h1>\n{body}\n</article>"
+        f"<footer>Page {page_id}</footer></body></html>"
+    )
+
+
+def fake_embedding(text: str, dim: int) -> np.ndarray:
+    # a random unit vector seeded by the text: identical texts match, different ones are ~orthogonal
+    seed = int.from_bytes(hashlib.sha256(text.strip().lower().encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(0, 1, dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def create_dependency_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+
+    async def sleep_ms(mean: float, jitter: float = 0):
+        await asyncio.sleep(max(0.0, rng.gauss(mean, jitter) if jitter else mean) / 1000)
+
+    # The web
+    @app.get("/pages/{page_id}")
+    async def page(page_id: int, request: Request):
+        if not 0 <= page_id < config.num_pages:
+            return Response(status_code=404)
+
+        roll = rng.random()
+        if roll < config.page_slow_rate:
+            await sleep_ms(config.page_slow_ms)
+        else:
+            await sleep_ms(config.page_latency_ms, config.page_jitter_ms)
+
+        if roll > 1 - config.page_failure_rate:
+            return Response(status_code=503)
+
+        etag = f'"{config.seed}-{page_id}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        return HTMLResponse(make_page(page_id, config.page_paragraphs, config.seed), headers={"ETag": etag})
+
+    # LLM
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "".join(message.get("content") or "" for message in body.get("messages", []))
+
+        await sleep_ms(config.llm_latency_ms + config.llm_ms_per_token * config.llm_completion_tokens)
+
+        words = random.Random(prompt).choices(WORDS, k=config.llm_completion_tokens)
+        prompt_tokens = len(prompt) // 4
+        return JSONResponse({
+            "id": f"chatcmpl-{hashlib.sha256(prompt.encode()).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": config.llm_completion_tokens,
+                "total_tokens": prompt_tokens + config.llm_completion_tokens,
+            },
+        })
+
+    # Embedding
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+
+        await sleep_ms(config.embedding_latency_ms)
+
+        # the openai client asks for base64 (float32 bytes) when numpy is installed
+        data = []
+        for i, text in enumerate(texts):
+            vector = fake_embedding(str(text), config.embedding_dim)
+            embedding = base64.b64encode(vector.tobytes()).decode() if body.get("encoding_format") == "base64" else vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        return JSONResponse({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    @app.get("/ping")
+    def ping():
+        return {"status": "Healthy"}
+
+    return app
+
+
+def serve_dependencies(config: FakeConfig, port: int):
+    """
+    Run the fake dependencies until killed, meant to be the target of a separate process so they don't
+    share the event loop (and the CPU time) of the service being measured.
+    """
+    import uvicorn
+
+    # every 127.0.0.x address, see `num_hosts`
+    uvicorn.run(create_dependency_app(config), host="0.0.0.0", port=port, log_level="warning", access_log=False)
+
+
+# Search provider
+
+# imported lazily: the service modules read their settings from the environment when imported
+def fake_search_provider(base_url_template: str, config: FakeConfig, serp_latency_ms: float = 300, serp_results: int = 10):
+    """
+    A search provider returning, for each query, `serp_results` pages of the corpus chosen from a hash of the query.
+    Queries share pages (the corpus is finite), so the page store warms up across different queries.
+    `base_url_template` is formatted with the host index, e.g. "http://127.0.0.{}:8100".
+    """
+    from schemas import SearchResult
+    from search import SearchProvider
+    from utils import normalize_query
+
+    class FakeSearchProvider(SearchProvider):
+        name = "fake"
+
+        async def get_link_results(self, query: str, num_results: int, newest_first: bool = False) -> List[SearchResult]:
+            await asyncio.sleep(serp_latency_ms / 1000)
+
+            rng = random.Random(normalize_query(query))
+            page_ids = rng.sample(range(config.num_pages), min(max(num_results, serp_results), config.num_pages))
+
+            return [
+                SearchResult(
+                    title=f"Page {page_id}",
+                    url=f"{base_url_template.format(1 + page_id % config.num_hosts)}/pages/{page_id}",
+                    content=" ".join(rng.choices(WORDS, k=20)),
+                )
+                for page_id in page_ids[:num_results]
+            ]
+
+    return FakeSearchProvider()
+
+
+# Cache tiers
+
+class MemoryQueryCache:
+    """
+    In-memory stand-in of ShortTermCacheClient: brute-force cosine search over the stored query embeddings,
+    with the same expiry, stale window, similarity threshold, hit counts and lease semantics.
+    Parameters:
+        embedding_client (EmbeddingClient): Embedding client of the service
+        sim_threshold (float): Cosine similarity above which a stored query is a hit
+        expire_time (int): Seconds an entry is fresh
+        stale_time (int): Seconds an expired entry is still served while it is refreshed
+    """
+
+    def __init__(self, embedding_client, sim_threshold: float, expire_time: int, stale_time: int = 0):
+        self.embedding_client = embedding_client
+        self.sim_threshold = sim_threshold
+        self.expire_time = expire_time
+        self.stale_time = stale_time
+
+        # key -> [normalized embedding, response, fresh until, search params, hits]
+        self._entries: Dict[str, list] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    async def set(self, obj, search_params: Optional[dict] = None, replaces: Optional[str] = None):
+        embedding = np.asarray(await self.embedding_client.get_embedding(obj.query), dtype=np.float32)
+        key = hashlib.sha256(obj.model_dump_json().encode()).hexdigest()
+        # an identical entry keeps its hits, a refreshed one counts them from zero again
+        hits = self._entries[key][4] if key in self._entries and not replaces else 0
+        if replaces and replaces != key:
+            self._entries.pop(replaces, None)
+        self._entries[key] = [embedding / np.linalg.norm(embedding), obj, time.monotonic() + self.expire_time, search_params, hits]
+        obj._cache_key = key
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def get(self, query: str):
+        response, _ = await self.get_with_ttl(query)
+        return response
+
+    async def get_with_ttl(self, query: str, deadline=None):
+        from metrics import STAGE_DURATION
+
+        with STAGE_DURATION.labels("query_cache").time():
+            now = time.monotonic()
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[2] + self.stale_time > now}
+            if not self._entries:
+                self.misses += 1
+                return None, 0
+
+            embedding = np.asarray(await self.embedding_client.get_embedding(query), dtype=np.float32)
+            embedding /= np.linalg.norm(embedding)
+
+            keys = list(self._entries)
+            scores = np.stack([self._entries[key][0] for key in keys]) @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.sim_threshold:
+                self.misses += 1
+                return None, 0
+
+            self.hits += 1
+            entry = self._entries[keys[best]]
+            entry[4] += 1
+            _, response, fresh_until, search_params, _ = entry
+            response._cache_key = keys[best]
+            response._search_params = search_params
+            response._stale = fresh_until <= now
+            if response._stale:
+                self.stale_hits += 1
+            return response, max(int(fresh_until - now), 0)
+
+    def count_hit(self, key: str):
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry[4] += 1
+
+    async def flush_hits(self):
+        pass
+
+    async def refresh_candidates(self, ahead: float, min_hits: int, limit: int = 100) -> List[Tuple[str, str, dict]]:
+        now = time.monotonic()
+        return [
+            (key, entry[1].query, entry[3])
+            for key, entry in self._entries.items()
+            if entry[3] is not None and entry[4] >= min_hits and now < entry[2] + self.stale_time and entry[2] <= now + ahead
+        ][:limit]
+
+    async def acquire_lease(self, name: str, ttl: float) -> Optional[str]:
+        lease = self._leases.get(name)
+        if lease is not None and lease[1] > time.monotonic():
+            return None
+        token = hashlib.sha256(f"{name}:{time.monotonic()}".encode()).hexdigest()
+        self._leases[name] = (token, time.monotonic() + ttl)
+        return token
+
+    async def release_lease(self, name: str, token: str):
+        if self._leases.get(name, ("",))[0] == token:
+            del self._leases[name]
+
+    async def lease_exists(self, name: str) -> bool:
+        lease = self._leases.get(name)
+        return lease is not None and lease[1] > time.monotonic()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    async def close(self):
+        pass
+
+
+class MemoryPageStore:
+    """
+    In-memory stand-in of LongTermCacheClient, keeping the pages (with their validators) by URL.
+    """
+
+    def __init__(self):
+        self._pages: Dict[str, object] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def set(self, search_response):
+        await self.set_pages({
+            result.url: result._page
+            for result in search_response.results
+            if result._page is not None and not result._page._from_store
+        })
+
+    async def set_pages(self, pages: Dict[str, object]):
+        for url, page in pages.items():
+            self._pages[url] = page.model_copy()
+
+    async def get_pages(self, urls: List[str], deadline=None) -> Dict[str, object]:
+        from metrics import STAGE_DURATION
+
+        with STAGE_DURATION.labels("page_store").time():
+            pages = {}
+            for url in urls:
+                page = self._pages.get(url)
+                if page is not None:
+                    page = page.model_copy()
+                    page._from_store = True
+                    pages[url] = page
+
+            self.hits += len(pages)
+            self.misses += len(urls) - len(pages)
+            return pages
+
+    async def get_many(self, urls: List[str]) -> Dict[str, str]:
+        return {url: page.details for url, page in (await self.get_pages(urls)).items()}
+
+    async def get(self, url: str) -> Optional[str]:
+        return (await self.get_many([url])).get(url)
+
+    async def storage_stats(self) -> dict:
+        return {"pages": len(self._pages)}
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "pages": len(self._pages)}
+
+    def close(self):
+        pass
+
+
+class MemoryAnswerCache:
+    """
+    In-memory stand-in of SummaryCacheClient, exact matches only.
+    """
+
+    def __init__(self):
+        self._answers: Dict[Tuple[str, str, str], str] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, url: str, details: Optional[str]) -> Tuple[str, str, str]:
+        from utils import normalize_query
+
+        return normalize_query(query), url, hashlib.sha256((details or "").encode()).hexdigest()
+
+    async def get(self, query: str, url: str, details: Optional[str], deadline=None) -> Optional[str]:
+        answer = self._answers.get(self._key(query, url, details))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    async def set(self, query: str, url: str, details: Optional[str], answer: str):
+        self._answers[self._key(query, url, details)] = answer
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._answers)}
+
+
+class MemoryNegativeCache:
+    """
+    In-memory stand-in of NegativeCacheClient.
+    """
+
+    def __init__(self, expire_time: int):
+        self.expire_time = expire_time
+        self._urls: Dict[str, float] = {}
+
+    async def contains(self, url: str, deadline=None) -> bool:
+        return self._urls.get(url, 0.0) > time.monotonic()
+
+    async def add(self, url: str):
+        self._urls[url] = time.monotonic() + self.expire_time
+
+    def stats(self) -> dict:
+        return {"urls": len(self._urls)}
+
+
+class MemorySerpCache:
+    """
+    In-memory stand-in of SerpCacheClient, with a single expiry for every provider.
+    """
+
+    def __init__(self, expire_time: int, num_results: int):
+        self.expire_time = expire_time
+        self.num_results = num_results
+        # (provider, normalized query, newest_first) -> (links, complete, expires at)
+        self._entries: Dict[tuple, tuple] = {}
+
+    def enabled(self, provider: str) -> bool:
+        return self.expire_time > 0
+
+    async def get(self, provider: str, query: str, num_results: int, newest_first: bool, deadline=None):
+        from utils import normalize_query
+
+        results, complete, expires_at = self._entries.get((provider, normalize_query(query), newest_first), ([], False, 0.0))
+        if expires_at > time.monotonic() and (complete or len(results) >= num_results):
+            return [result.model_copy() for result in results[:num_results]]
+        return None
+
+    async def set(self, provider: str, query: str, newest_first: bool, results, complete: bool):
+        from utils import normalize_query
+
+        if self.enabled(provider) and results:
+            links = [result.model_copy(update={"details": None, "answer": None}) for result in results]
+            self._entries[(provider, normalize_query(query), newest_first)] = (links, complete, time.monotonic() + self.expire_time)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries)}
+
+
+def use_memory_caches():
+    """
+    Replace the Redis and Mongo cache clients by in-memory ones in every loaded module which imported them,
+    and empty the in-process cache. Returns the new clients by name.
+    """
+    import clients
+    from constants import CACHE_STALE_TIME, EXPIRE_TIME, NEGATIVE_CACHE_EXPIRE_TIME, SERP_CACHE_EXPIRE_TIME, SERP_CACHE_NUM_RESULTS, SIM_THRESHOLD
+
+    replacements = {
+        "short_term_cache_client": MemoryQueryCache(clients.embedding_client, SIM_THRESHOLD, EXPIRE_TIME, CACHE_STALE_TIME),
+        "long_term_cache_client": MemoryPageStore(),
+        "summary_cache_client": MemoryAnswerCache(),
+        "negative_cache_client": MemoryNegativeCache(NEGATIVE_CACHE_EXPIRE_TIME),
+        "serp_cache_client": MemorySerpCache(SERP_CACHE_EXPIRE_TIME, SERP_CACHE_NUM_RESULTS),
+    }
+
+    for name, replacement in replacements.items():
+        original = getattr(clients, name)
+        for module in list(sys.modules.values()):
+            if getattr(module, name, None) is original:
+                setattr(module, name, replacement)
+
+    clients.request_coalescer.cache_client = replacements["short_term_cache_client"]
+    clients.local_cache_client._entries.clear()
+    clients.local_cache_client.size = 0
+
+    return replacements
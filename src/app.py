@@ -1,10 +1,19 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.trustedhost import TrustedHostMiddleware
-from search import PROVIDERS
+from search import PROVIDERS, cache_warmer
+from clients import local_cache_client, short_term_cache_client, long_term_cache_client, summary_cache_client, negative_cache_client, serp_cache_client, provider_rate_limiter, circuit_breaker, llm_scheduler, chunk_selector, http_fetcher, extraction_client, embedding_client, request_coalescer
+from clients.rate_limit_clients import RateLimitExceededError
 from logs import logger
+from utils import Deadline
+import metrics
+from schemas import BatchSearchRequest, BatchSearchResponse
+from constants import CACHE_WARMER_ENABLED, OVERFETCH_MAX_FACTOR
+import json
+import math
 import time
-from typing import Literal
+from typing import Literal, Optional
 
 
 logger.info(f"Available search providers: {list(PROVIDERS.keys())}")
@@ -32,33 +41,169 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def startup():
+    if CACHE_WARMER_ENABLED:
+        cache_warmer.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    await cache_warmer.stop()
+    await short_term_cache_client.close()
+    long_term_cache_client.close()
+    await http_fetcher.close()
+    extraction_client.close()
+
+# A throttled provider without a fallback
+@app.exception_handler(RateLimitExceededError)
+async def rate_limit_exceeded(request: Request, e: RateLimitExceededError):
+    headers = {"Retry-After": str(math.ceil(e.retry_after))} if e.retry_after else None
+    return JSONResponse(status_code=429, content={"detail": str(e)}, headers=headers)
+
 # Ping
 @app.get("/ping")
 def ping(req: Request):
     return {"status": "Healthy"}
 
+# Stats
+@app.get("/v1/stats")
+def stats_v1():
+    return {
+        "local_cache": local_cache_client.stats(),
+        "short_term_cache": short_term_cache_client.stats(),
+        "long_term_cache": long_term_cache_client.stats(),
+        "summary_cache": summary_cache_client.stats(),
+        "http_fetcher": http_fetcher.stats(),
+        "extraction": extraction_client.stats(),
+        "embedding": embedding_client.stats(),
+        "coalescing": request_coalescer.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "chunk_selection": chunk_selector.stats(),
+        "negative_cache": negative_cache_client.stats(),
+        "serp_cache": serp_cache_client.stats(),
+        "rate_limits": provider_rate_limiter.stats(),
+        "auto_provider": PROVIDERS["auto"].stats() if "auto" in PROVIDERS else None,
+        "circuit_breaker": circuit_breaker.stats(),
+        "cache_warmer": cache_warmer.stats(),
+    }
+
+# Per-host circuit breaker states of this worker, only the hosts with recent failures
+@app.get("/v1/stats/circuits")
+def circuits_v1(state: Optional[Literal["closed", "open", "half_open"]] = None):
+    return {
+        "circuits": circuit_breaker.circuits(state),
+    }
+
+# Prometheus metrics, aggregated across workers in multiprocess mode
+@app.get("/metrics", include_in_schema=False)
+def metrics_v1():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
+@app.get("/v1/stats/storage")
+async def storage_stats_v1():
+    return {
+        "long_term_cache": await long_term_cache_client.storage_stats(),
+    }
+
 # Version 1
 @app.get("/v1/search", description=f"Available search providers: {list(PROVIDERS.keys())}")
 async def search_v1(
     query: str,
-    provider: Literal["searxng", "google", "duckduckgo"] = "duckduckgo",
+    provider: Literal["searxng", "google", "duckduckgo", "auto"] = "duckduckgo",
     max_num_result: int = 3,
     enable_cache: bool = True,
     newest_first: bool = False,
     sumup_page_timeout: int = 15,
+    overfetch_factor: float = Query(1.0, ge=1.0, le=OVERFETCH_MAX_FACTOR, description="Fetch this many times max_num_result candidates and return the first max_num_result which succeed"),
+    result_order: Literal["rank", "completion"] = "rank",
+    deadline_ms: Optional[int] = Query(None, gt=0, description="Answer within this many milliseconds, with the results which are ready by then"),
 ):
     
     start_time = time.time()
+    deadline = Deadline.from_ms(deadline_ms)
 
     # Get the provider
     search_provider = PROVIDERS[provider]
 
     # Search
     if enable_cache:
-        result = await search_provider.search_in_cache(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout)
+        result = await search_provider.search_in_cache(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout, overfetch_factor=overfetch_factor, result_order=result_order, deadline=deadline)
     else:
-        result = await search_provider.search(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout)
+        result = await search_provider.search(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout, overfetch_factor=overfetch_factor, result_order=result_order, deadline=deadline)
 
     logger.info(f"Search for '{query}' returned {len(result.results)} results in {time.time() - start_time:.2f} seconds")
     
     return result
+
+
+# Streaming version of /v1/search
+@app.get("/v1/search/stream", description="Stream the link list, then each result as soon as it is ready, then a summary. "
+                                          "Events are `{\"event\": ..., \"data\": ...}` lines (ndjson) or server-sent events (sse).")
+async def search_stream_v1(
+    query: str,
+    provider: Literal["searxng", "google", "duckduckgo", "auto"] = "duckduckgo",
+    max_num_result: int = 3,
+    enable_cache: bool = True,
+    newest_first: bool = False,
+    sumup_page_timeout: int = 15,
+    overfetch_factor: float = Query(1.0, ge=1.0, le=OVERFETCH_MAX_FACTOR, description="Fetch this many times max_num_result candidates and stop after the first max_num_result which succeed"),
+    format: Literal["ndjson", "sse"] = "ndjson",
+):
+
+    start_time = time.time()
+
+    # Get the provider
+    search_provider = PROVIDERS[provider]
+
+    def format_event(event: dict) -> str:
+        if format == "sse":
+            return f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        return json.dumps(event, ensure_ascii=False) + "\n"
+
+    async def stream():
+        num_results = 0
+        events = search_provider.search_stream(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout, enable_cache=enable_cache, overfetch_factor=overfetch_factor)
+        try:
+            async for event in events:
+                num_results += event["event"] == "result"
+                yield format_event(event)
+        except RateLimitExceededError as e:
+            # the response has started already, a throttled provider ends the stream with an error event
+            yield format_event({"event": "error", "data": {"status": 429, "detail": str(e), "retry_after": e.retry_after}})
+        except Exception as e:
+            # so does any other failure, instead of cutting the response off
+            logger.error(f"Error streaming search for '{query}': {e!r}")
+            yield format_event({"event": "error", "data": {"status": 500, "detail": "Internal Server Error"}})
+        finally:
+            await events.aclose()
+
+        logger.info(f"Streamed search for '{query}' returned {num_results} results in {time.time() - start_time:.2f} seconds")
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream" if format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Batch version of /v1/search
+@app.post("/v1/search/batch", response_model=BatchSearchResponse, description="Search several queries at once, fetching each unique page only once across the batch.")
+async def search_batch_v1(request: BatchSearchRequest):
+
+    start_time = time.time()
+
+    # Get the provider
+    search_provider = PROVIDERS[request.provider]
+
+    responses = await search_provider.search_batch(
+        request.queries,
+        request.max_num_result,
+        newest_first=request.newest_first,
+        sumup_page_timeout=request.sumup_page_timeout,
+        enable_cache=request.enable_cache,
+    )
+
+    logger.info(f"Batch search for {len(request.queries)} queries returned {sum(len(response.results) for response in responses)} results in {time.time() - start_time:.2f} seconds")
+
+    return BatchSearchResponse(responses=responses)
@@ -1,26 +1,129 @@
 from .llm_clients import LLMClient
 from .embedding_clients import EmbeddingClient
-from .cache_clients import ShortTermCacheClient, LongTermCacheClient
+from .cache_clients import LocalCacheClient, ShortTermCacheClient, LongTermCacheClient, SummaryCacheClient, NegativeCacheClient, SerpCacheClient
+from .http_clients import HTTPFetcher
+from .extraction_clients import ExtractionClient
+from .coalescing_clients import RequestCoalescer
+from .scheduling_clients import AdmissionScheduler
+from .chunking_clients import ChunkSelector
+from .health_clients import DomainCircuitBreaker
+from .rate_limit_clients import ProviderRateLimiter, RateLimitExceededError
 
 from constants import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_DNS_CACHE_TTL,
+    HTTP_TIMEOUT,
+    HTTP_MAX_PAGE_BYTES,
+
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_COOLDOWN,
+    CIRCUIT_MAX_COOLDOWN,
+    NEGATIVE_CACHE_EXPIRE_TIME,
+
+    EXTRACTION_MAX_WORKERS,
+    EXTRACTION_TIMEOUT,
+    EXTRACTION_START_METHOD,
+
     REDIS_URL,
     EXPIRE_TIME,
     SIM_THRESHOLD,
     EMBEDDING_DIM,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+    REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_INDEX_ALGORITHM,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_RUNTIME,
+    CACHE_STALE_TIME,
+
+    SERP_CACHE_EXPIRE_TIME,
+    SERP_CACHE_EXPIRE_TIMES,
+    SERP_CACHE_NUM_RESULTS,
+
+    PROVIDER_RATE_LIMITS,
+    PROVIDER_DAILY_QUOTAS,
+    RATE_LIMIT_BURST_SECONDS,
+    RATE_LIMIT_MAX_WAIT,
+
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_CACHE_MAX_BYTES,
+    LOCAL_CACHE_TTL,
+
+    COALESCE_LEASE_TTL,
+    COALESCE_WAIT_TIMEOUT,
+    COALESCE_POLL_INTERVAL,
+
+    SUMMARY_CACHE_EXPIRE_TIME,
+    SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_SIM_THRESHOLD,
 
     MONGO_URL,
     MONGO_DB_NAME,
     MONGO_COLLECTION_NAME,
+    LONG_TERM_CACHE_TTL,
+    LONG_TERM_CACHE_MAX_PAGES,
+    LONG_TERM_CACHE_COMPRESSION_LEVEL,
+    LONG_TERM_CACHE_DICT_SIZE,
+    LONG_TERM_CACHE_DICT_SAMPLES,
+    LONG_TERM_CACHE_SWEEP_INTERVAL,
 
     EMBEDDING_URL,
     EMBEDDING_API_KEY,
     EMBEDDING_MODEL_NAME,
+    EMBEDDING_MAX_BATCH_SIZE,
+    EMBEDDING_MAX_WAIT_MS,
+    EMBEDDING_CACHE_SIZE,
 
     LLM_URL,
     LLM_API_KEY,
     LLM_MODEL_NAME,
     LLM_BASE_MODEL_NAME,
+    LLM_MIN_COMPLETION_TIME,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_QUEUE_SIZE,
+    LLM_MAX_QUEUE_WAIT,
     HF_TOKEN,
+
+    CHUNK_SELECTION,
+    CHUNK_TOKENS,
+    CHUNK_MAX_CHUNKS,
+    CHUNK_MAX_EMBEDDED_CHUNKS,
+    CHUNK_BM25_WEIGHT,
+    CHUNK_EMBEDDING_TIMEOUT,
+)
+
+http_fetcher = HTTPFetcher(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    max_connections_per_host=HTTP_MAX_CONNECTIONS_PER_HOST,
+    dns_cache_ttl=HTTP_DNS_CACHE_TTL,
+    timeout=HTTP_TIMEOUT,
+    max_page_bytes=HTTP_MAX_PAGE_BYTES,
+)
+
+circuit_breaker = DomainCircuitBreaker(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    cooldown=CIRCUIT_COOLDOWN,
+    max_cooldown=CIRCUIT_MAX_COOLDOWN,
+)
+
+extraction_client = ExtractionClient(
+    max_workers=EXTRACTION_MAX_WORKERS,
+    task_timeout=EXTRACTION_TIMEOUT,
+    start_method=EXTRACTION_START_METHOD,
+)
+
+llm_scheduler = AdmissionScheduler(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    max_queue_size=LLM_MAX_QUEUE_SIZE,
+    max_queue_wait=LLM_MAX_QUEUE_WAIT,
+    min_run_time=LLM_MIN_COMPLETION_TIME,
 )
 
 llm_client = LLMClient(
@@ -29,12 +132,34 @@ llm_client = LLMClient(
     model_name=LLM_MODEL_NAME,
     base_model_name=LLM_BASE_MODEL_NAME,
     hf_token=HF_TOKEN,
+    min_completion_time=LLM_MIN_COMPLETION_TIME,
+    scheduler=llm_scheduler,
 )
 
 embedding_client = EmbeddingClient(
     base_url=EMBEDDING_URL,
     api_key=EMBEDDING_API_KEY,
     embedding_model_name=EMBEDDING_MODEL_NAME,
+    max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+    max_wait_ms=EMBEDDING_MAX_WAIT_MS,
+    cache_size=EMBEDDING_CACHE_SIZE,
+)
+
+chunk_selector = ChunkSelector(
+    llm_client=llm_client,
+    embedding_client=embedding_client,
+    method=CHUNK_SELECTION,
+    chunk_tokens=CHUNK_TOKENS,
+    max_chunks=CHUNK_MAX_CHUNKS,
+    max_embedded_chunks=CHUNK_MAX_EMBEDDED_CHUNKS,
+    bm25_weight=CHUNK_BM25_WEIGHT,
+    embedding_timeout=CHUNK_EMBEDDING_TIMEOUT,
+)
+
+local_cache_client = LocalCacheClient(
+    max_entries=LOCAL_CACHE_MAX_ENTRIES,
+    max_bytes=LOCAL_CACHE_MAX_BYTES,
+    ttl=LOCAL_CACHE_TTL,
 )
 
 short_term_cache_client = ShortTermCacheClient(
@@ -42,13 +167,63 @@ short_term_cache_client = ShortTermCacheClient(
     expire_time=EXPIRE_TIME,
     sim_threshold=SIM_THRESHOLD,
     embedding_client=embedding_client,
-    embedding_dim=EMBEDDING_DIM
+    embedding_dim=EMBEDDING_DIM,
+    stale_time=CACHE_STALE_TIME,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    pool_timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+    index_algorithm=REDIS_INDEX_ALGORITHM,
+    hnsw_m=HNSW_M,
+    hnsw_ef_construction=HNSW_EF_CONSTRUCTION,
+    hnsw_ef_runtime=HNSW_EF_RUNTIME,
+)
+
+summary_cache_client = SummaryCacheClient(
+    client=short_term_cache_client.client,
+    embedding_client=embedding_client,
+    embedding_dim=EMBEDDING_DIM,
+    expire_time=SUMMARY_CACHE_EXPIRE_TIME,
+    max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+    sim_threshold=SUMMARY_CACHE_SIM_THRESHOLD,
+)
+
+negative_cache_client = NegativeCacheClient(
+    client=short_term_cache_client.client,
+    expire_time=NEGATIVE_CACHE_EXPIRE_TIME,
+)
+
+serp_cache_client = SerpCacheClient(
+    client=short_term_cache_client.client,
+    expire_times=SERP_CACHE_EXPIRE_TIMES,
+    default_expire_time=SERP_CACHE_EXPIRE_TIME,
+    num_results=SERP_CACHE_NUM_RESULTS,
 )
 
+provider_rate_limiter = ProviderRateLimiter(
+    client=short_term_cache_client.client,
+    rates=PROVIDER_RATE_LIMITS,
+    daily_quotas=PROVIDER_DAILY_QUOTAS,
+    burst_seconds=RATE_LIMIT_BURST_SECONDS,
+    max_wait=RATE_LIMIT_MAX_WAIT,
+)
 
 long_term_cache_client = LongTermCacheClient(
     mongo_url=MONGO_URL,
     db_name=MONGO_DB_NAME,
     collection_name=MONGO_COLLECTION_NAME,
+    ttl=LONG_TERM_CACHE_TTL,
+    max_pages=LONG_TERM_CACHE_MAX_PAGES,
+    compression_level=LONG_TERM_CACHE_COMPRESSION_LEVEL,
+    dict_size=LONG_TERM_CACHE_DICT_SIZE,
+    dict_samples=LONG_TERM_CACHE_DICT_SAMPLES,
+    sweep_interval=LONG_TERM_CACHE_SWEEP_INTERVAL,
 )
 
+request_coalescer = RequestCoalescer(
+    cache_client=short_term_cache_client,
+    sim_threshold=SIM_THRESHOLD,
+    lease_ttl=COALESCE_LEASE_TTL,
+    wait_timeout=COALESCE_WAIT_TIMEOUT,
+    poll_interval=COALESCE_POLL_INTERVAL,
+)
@@ -1,18 +1,147 @@
-import redis
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
 from redis.commands.search.field import (
+    TagField,
     VectorField,
 )
 
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 from redis.commands.search.query import Query
 import numpy as np
+import zstandard as zstd
 
 from .embedding_clients import EmbeddingClient
-from pymongo import MongoClient, errors
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, errors
+from typing import Dict, List, Optional, Set, Tuple
 
-from schemas import SearchResponse
+from schemas import PageDetails, SearchResponse, SearchResult
 
 from logs import logger
+from stats import LatencyStats
+from metrics import STAGE_DURATION, STAGE_TIMEOUTS
+from utils import NO_DEADLINE, Deadline, make_key, normalize_query
+
+
+class LocalCacheClient:
+    """
+    An in-process, exact-match cache of search responses, checked before the Redis vector cache.
+    Entries are keyed on the normalized query and search parameters, expire after `ttl` seconds (never
+    later than the Redis entry they were read from), and the least recently used entries are evicted
+    once `max_entries` or `max_bytes` (estimated from the JSON size of the responses) is exceeded.
+    Parameters:
+        max_entries (int): Maximum number of cached responses
+        max_bytes (int): Maximum estimated size of the cached responses
+        ttl (float): Maximum time in seconds an entry is served
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # key -> (expiry time, size, response)
+        self._entries: "OrderedDict[str, Tuple[float, int, SearchResponse]]" = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, key: str) -> Optional[SearchResponse]:
+        entry = self._entries.get(key)
+
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+
+    def set(self, key: str, response: SearchResponse, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+
+        size = len(response.model_dump_json())
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (time.monotonic() + ttl, size, response)
+        self.size += size
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+        }
+
+
+
+class TrackingConnectionPool(redis.BlockingConnectionPool):
+    """
+    A blocking connection pool which keeps track of the connections checked out and of the callers
+    waiting for one, for the stats.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checked_out = set()
+        self.waiting = 0
+        self.wait_timeouts = 0
+
+    async def get_connection(self, *args, **kwargs):
+        self.waiting += 1
+        try:
+            connection = await super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            if "No connection available" in str(e):
+                self.wait_timeouts += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.checked_out.add(connection)
+        return connection
+
+    async def release(self, connection):
+        self.checked_out.discard(connection)
+        await super().release(connection)
+
 
 
 class ShortTermCacheClient:
@@ -21,8 +150,15 @@ class ShortTermCacheClient:
     This class implements a caching mechanism using Redis as the backend storage, specifically designed
     for storing and retrieving search results based on vector similarity searches. It utilizes Redis JSON
     and RediSearch for efficient storage and querying of vector embeddings.
+    All Redis calls go through a non-blocking `redis.asyncio` client backed by a bounded, blocking
+    connection pool, so a slow round-trip only suspends the calling request instead of the event loop.
+    Entries are fresh for `expire_time` seconds, then served as stale (`_stale` is set on the response)
+    for `stale_time` more seconds while they're refreshed. Each entry counts its hits, and the entries
+    stored with their search parameters are indexed by expiry, so popular ones can be refreshed before
+    they expire (see `refresh_candidates`).
     Attributes:
-        client (redis.Redis): Redis client instance
+        client (redis.asyncio.Redis): Async Redis client instance
+        pool (TrackingConnectionPool): Connection pool shared by all cache operations
         expire_time (int): Time in seconds after which cache entries expire
         sim_threshold (float): Similarity threshold for vector matching
         index_name (str): Name of the Redis search index
@@ -31,6 +167,16 @@ class ShortTermCacheClient:
         expire_time (int): Cache expiration time in seconds
         sim_threshold (float): Threshold for vector similarity matching
         embedding_dim (int): Dimension of the vector embeddings
+        stale_time (int): Seconds an entry is still served after `expire_time`, while it's refreshed
+        max_connections (int): Maximum number of pooled connections
+        pool_timeout (float): Seconds to wait for a free connection before failing
+        socket_timeout (float): Seconds to wait for a Redis reply
+        health_check_interval (int): Seconds of idleness after which a connection is pinged before reuse
+        index_algorithm (str): Vector index algorithm, "HNSW" or "FLAT"; an existing index built with other
+            parameters is dropped (keeping the documents) and rebuilt
+        hnsw_m (int): HNSW maximum number of edges per node
+        hnsw_ef_construction (int): HNSW candidate list size while building the graph
+        hnsw_ef_runtime (int): HNSW candidate list size while searching
     """
 
     def __init__(
@@ -40,106 +186,715 @@ class ShortTermCacheClient:
         sim_threshold: float,
         embedding_client: EmbeddingClient,
         embedding_dim: int,
+        stale_time: int = 0,
+        max_connections: int = 64,
+        pool_timeout: float = 5,
+        socket_timeout: float = 5,
+        health_check_interval: int = 30,
+        index_algorithm: str = "HNSW",
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_runtime: int = 10,
     ):
-        self.client = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.pool = TrackingConnectionPool.from_url(
+            redis_url,
+            decode_responses=True,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+            socket_keepalive=True,
+            health_check_interval=health_check_interval,
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
 
         self.expire_time = expire_time
+        self.stale_time = stale_time
         self.sim_threshold = sim_threshold
 
         self.embedding_client = embedding_client
         self.embedding_dim = embedding_dim
 
         self.index_name: str="idx:search_vss"
-        self._create_index()
+        self.index_algorithm = index_algorithm.upper()
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_runtime = hnsw_ef_runtime
+        self._index_ready = False
+        self._index_lock = asyncio.Lock()
 
+        # entry key -> time it stops being fresh, of the entries which can be refreshed
+        self.refresh_index_key: str="search:refresh"
+        # hits served from another tier (e.g. the in-process cache), added to the entries on the next flush
+        self._pending_hits: Dict[str, int] = {}
 
-    def _create_index(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
 
-        schema = (
-            VectorField(
-                "$.query_embedding",
-                "FLAT",
-                {
-                    "TYPE": "FLOAT32",
-                    "DIM": self.embedding_dim,
-                    "DISTANCE_METRIC": "COSINE",
-                },
-                as_name="vector",
-            )
-        )
+        # latency of each Redis round-trip, used to size the pool
+        self.latency = {
+            "search": LatencyStats(),
+            "get": LatencyStats(),
+            "set": LatencyStats(),
+        }
+
+
+    def _index_config(self) -> dict:
+        # EF_RUNTIME is passed with each query, so changing it doesn't need a new index
+        config = {
+            "algorithm": self.index_algorithm,
+            "TYPE": "FLOAT32",
+            "DIM": self.embedding_dim,
+            "DISTANCE_METRIC": "COSINE",
+        }
+        if self.index_algorithm == "HNSW":
+            config["M"] = self.hnsw_m
+            config["EF_CONSTRUCTION"] = self.hnsw_ef_construction
+        return config
+
+
+    async def _create_index(self):
 
-        definition = IndexDefinition(prefix=["search:"], index_type=IndexType.JSON)
+        config = self._index_config()
+        signature = json.dumps(config, sort_keys=True)
 
         try:
-            status = self.client.ft(self.index_name).create_index(fields=schema, definition=definition)
+            await self.client.ft(self.index_name).info()
+            exists = True
+        except ResponseError:
+            exists = False
+
+        # the index was created by an older version or with other parameters
+        if exists and await self.client.get(f"{self.index_name}:config") == signature:
+            return
+
+        # only one worker creates or migrates the index
+        lease = await self.acquire_lease(f"{self.index_name}:create", ttl=30)
+        if lease is None:
+            return
+
+        try:
+            if exists:
+                # the cached documents are kept, RediSearch indexes them again in the background
+                logger.info(f"Migrating index {self.index_name} to {signature}")
+                await self.client.ft(self.index_name).dropindex(delete_documents=False)
+
+            schema = (
+                VectorField(
+                    "$.query_embedding",
+                    self.index_algorithm,
+                    {key: value for key, value in config.items() if key != "algorithm"},
+                    as_name="vector",
+                )
+            )
+
+            definition = IndexDefinition(prefix=["search:"], index_type=IndexType.JSON)
+
+            status = await self.client.ft(self.index_name).create_index(fields=schema, definition=definition)
+            await self.client.set(f"{self.index_name}:config", signature)
             logger.info(f"Index created: {status}")
         except Exception as e:
             logger.error(f"Error creating index: {e}")
-    
-        
+        finally:
+            await self.release_lease(f"{self.index_name}:create", lease)
+
+
+    async def _ensure_index(self):
+        # the index can only be created once the event loop is running
+        if self._index_ready:
+            return
+
+        async with self._index_lock:
+            if not self._index_ready:
+                await self._create_index()
+                self._index_ready = True
+
 
     async def set(
         self,
-        obj: SearchResponse,
+        response: SearchResponse,
+        search_params: Optional[dict] = None,
+        replaces: Optional[str] = None,
     ):
+        """
+        Cache `response`, with the parameters of its search (provider, max_num_result, ...) to be able to refresh it.
+        With `replaces`, the key of the entry it refreshes, the old entry is deleted once the new one is written,
+        and the hits are counted from zero again: an entry is only refreshed again if it's still popular.
+        """
         
         # validate the object
-        obj = obj.model_dump()
+        obj = response.model_dump()
+
+        # generate a key from the content of the object, format "search:<sha256>", the same in every worker
+        key = f"search:{make_key(obj)}"
 
         # get the embedding for the object
         obj["query_embedding"] = await self.embedding_client.get_embedding(obj["query"])
+        obj["hits"] = 0
+        if search_params:
+            obj["search_params"] = search_params
 
-        # generate a unique key for the object, format "seach:<id>"
-        id = str(hash(str(obj)))
-        key = f"search:{id}"
+        await self._ensure_index()
 
-        # set the object in the cache if it doesn't already exist
-        set_ojb = self.client.json().set(key, "$", obj, nx=True)
+        # set the object if it doesn't already exist (an identical one keeps its hits, unless it's refreshed, only
+        # its search parameters are updated) and renew its expiration time, in a single round-trip
+        with self.latency["set"].measure():
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.json().set(key, "$", obj, nx=True)
+                if replaces:
+                    pipe.json().set(key, "$.hits", 0, xx=True)
+                if search_params:
+                    pipe.json().set(key, "$.search_params", search_params, xx=True)
+                pipe.expire(key, self.expire_time + self.stale_time)
+                if search_params:
+                    pipe.zadd(self.refresh_index_key, {key: time.time() + self.expire_time})
+                set_ojb, *_ = await pipe.execute()
 
-        # set the expiration time
-        set_ex = self.client.expire(key, self.expire_time)
+        # only once it's written: a failed write keeps the entry it replaces
+        response._cache_key = key
+        if replaces and replaces != key:
+            await self.delete(replaces)
 
-        return set_ojb, set_ex
+        return set_ojb
+
+
+    async def delete(self, key: str):
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.delete(key)
+            pipe.zrem(self.refresh_index_key, key)
+            await pipe.execute()
     
     async def get(self, query: str) -> SearchResponse:
-        
+        response, _ = await self.get_with_ttl(query)
+        return response
+
+    async def get_with_ttl(self, query: str, deadline: Deadline = NO_DEADLINE) -> Tuple[Optional[SearchResponse], int]:
+        """
+        Same as `get`, also returns the remaining time to live of the entry in seconds.
+        A lookup which can't finish before `deadline` is a miss.
+        """
+        if deadline.expired():
+            self.misses += 1
+            return None, 0
+
+        try:
+            with STAGE_DURATION.labels("query_cache").time():
+                return await asyncio.wait_for(self._get_with_ttl(query), timeout=deadline.timeout())
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels("query_cache").inc()
+            logger.warning(f"Query cache lookup for '{query}' ran out of time")
+            self.misses += 1
+            return None, 0
+
+    async def _get_with_ttl(self, query: str) -> Tuple[Optional[SearchResponse], int]:
+
         # get the embedding for the query
         query_embedding = await self.embedding_client.get_embedding(query)
 
+        await self._ensure_index()
 
         # create a query to search for similar embeddings
+        query_params = {
+            "query_vector": np.array(query_embedding, dtype=np.float32).tobytes()
+        }
+        if self.index_algorithm == "HNSW":
+            knn = 'KNN 1 @vector $query_vector EF_RUNTIME $ef_runtime AS vector_score'
+            query_params["ef_runtime"] = self.hnsw_ef_runtime
+        else:
+            knn = 'KNN 1 @vector $query_vector AS vector_score'
+
         query = (
-            Query('(*)=>[KNN 1 @vector $query_vector AS vector_score]')
+            Query(f'(*)=>[{knn}]')
             .sort_by('vector_score')
             .return_fields('vector_score', 'id')
             .dialect(2)
         )
 
         # search for similar embeddings
-        docs = self.client.ft(self.index_name).search(
-            query,
-            {
-                "query_vector": np.array(query_embedding, dtype=np.float32).tobytes()
-            }
-        ).docs
+        try:
+            with self.latency["search"].measure():
+                docs = (await self.client.ft(self.index_name).search(query, query_params)).docs
+        except ResponseError as e:
+            # the index is missing, e.g. another worker is still migrating it, check it again on the next call
+            logger.warning(f"Error searching index {self.index_name}: {e}")
+            self._index_ready = False
+            self.misses += 1
+            return None, 0
 
         if not docs:
-            return None
+            self.misses += 1
+            return None, 0
         
         # get the first document
         doc = docs[0]
 
         # return null if the similarity score is below the threshold
         if (1 - float(doc.vector_score)) < self.sim_threshold:
-            return None
+            self.misses += 1
+            return None, 0
+
+        # get the object from the cache and its remaining time to live, and count the hit, in a single round-trip
+        with self.latency["get"].measure():
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.json().get(doc.id)
+                pipe.ttl(doc.id)
+                pipe.json().numincrby(doc.id, "$.hits", 1)
+                obj, ttl, _ = await pipe.execute(raise_on_error=False)
 
-        # get the object from the cache
-        obj = self.client.json().get(doc.id)
+        # the entry may have expired between the search and the get
+        if not obj or isinstance(obj, Exception):
+            self.misses += 1
+            return None, 0
+
+        self.hits += 1
 
         # log the query which was found
-        logger.info(f"Found similar query: {query}")
+        logger.info(f"Found similar query: {obj['query']}")
+
+        response = SearchResponse(**obj)
+        response._cache_key = doc.id
+        response._search_params = obj.get("search_params")
+
+        # the time to live returned is the time left fresh (-1: the entry has no expiry)
+        if isinstance(ttl, int) and ttl >= 0:
+            ttl = max(ttl - self.stale_time, 0)
+            response._stale = ttl == 0
+            self.stale_hits += response._stale
+
+        return response, ttl
+
+
+    def count_hit(self, key: str):
+        # a hit served without reading the entry, counted on the next `flush_hits`
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+
+    async def flush_hits(self):
+        pending, self._pending_hits = self._pending_hits, {}
+        if not pending:
+            return
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, hits in pending.items():
+                pipe.json().numincrby(key, "$.hits", hits)
+            # entries which expired since are just skipped
+            await pipe.execute(raise_on_error=False)
+
+
+    async def refresh_candidates(self, ahead: float, min_hits: int, limit: int = 100) -> List[Tuple[str, str, dict]]:
+        """
+        The entries with at least `min_hits` hits which stop being fresh within `ahead` seconds (or already did), as
+        (key, query, search parameters). Expired entries, and the ones which weren't popular by the time they went
+        stale, are dropped from the index.
+        """
+        now = time.time()
+        entries = await self.client.zrangebyscore(self.refresh_index_key, "-inf", now + ahead, start=0, num=limit, withscores=True)
+        if not entries:
+            return []
+
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, _ in entries:
+                pipe.json().get(key, "$.query", "$.search_params", "$.hits")
+            docs = await pipe.execute(raise_on_error=False)
+
+        candidates, dropped = [], []
+        for (key, fresh_until), doc in zip(entries, docs):
+            if not isinstance(doc, dict) or not doc.get("$.query") or not doc.get("$.search_params"):
+                dropped.append(key)
+            elif (doc.get("$.hits") or [0])[0] >= min_hits:
+                candidates.append((key, doc["$.query"][0], doc["$.search_params"][0]))
+            elif fresh_until <= now:
+                dropped.append(key)
+
+        if dropped:
+            await self.client.zrem(self.refresh_index_key, *dropped)
+
+        return candidates
+
+
+    async def acquire_lease(self, name: str, ttl: float) -> Optional[str]:
+        """
+        Try to take a lease shared by all workers, returns its token if taken, None if another worker holds it.
+        """
+        token = uuid.uuid4().hex
+        acquired = await self.client.set(f"lease:{name}", token, nx=True, px=int(ttl * 1000))
+        return token if acquired else None
+
+    async def release_lease(self, name: str, token: str):
+        # only delete the lease if it is still ours, it may have expired and been taken by another worker
+        await self.client.eval(
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end",
+            1, f"lease:{name}", token,
+        )
+
+    async def lease_exists(self, name: str) -> bool:
+        return bool(await self.client.exists(f"lease:{name}"))
+
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "pool": {
+                "max_connections": self.pool.max_connections,
+                "in_use_connections": len(self.pool.checked_out),
+                "waiting": self.pool.waiting,
+                "wait_timeouts": self.pool.wait_timeouts,
+            },
+            "latency": {name: latency.to_dict() for name, latency in self.latency.items()},
+        }
+
+
+    async def close(self):
+        await self.client.aclose()
+
+
+
+class SummaryCacheClient:
+    """
+    A Redis-based cache of the LLM answers generated for a page.
+    Answers are keyed on (URL, hash of the page details, normalized query), so a page whose content changed
+    is summarized again. Optionally, a query whose embedding is above `sim_threshold` to a cached query
+    for the same page content reuses its answer. Entries expire `expire_time` seconds after they were last
+    used and the least recently used ones are evicted beyond `max_entries`.
+    Parameters:
+        client (redis.asyncio.Redis): Async Redis client, shared with the query cache
+        embedding_client (EmbeddingClient): Client used to embed queries for similarity matching
+        embedding_dim (int): Dimension of the vector embeddings
+        expire_time (int): Cache expiration time in seconds
+        max_entries (int): Maximum number of cached answers
+        sim_threshold (float): Similarity threshold for reusing the answer of another query, 0 disables it
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        embedding_client: EmbeddingClient,
+        embedding_dim: int,
+        expire_time: int,
+        max_entries: int,
+        sim_threshold: float = 0,
+    ):
+        self.client = client
+        self.embedding_client = embedding_client
+        self.embedding_dim = embedding_dim
+        self.expire_time = expire_time
+        self.max_entries = max_entries
+        self.sim_threshold = sim_threshold
+
+        self.index_name: str="idx:summary_vss"
+        self.lru_key: str="summary:lru"
+        self._index_ready = False
+
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+
+    async def _ensure_index(self):
+        if self._index_ready:
+            return
+
+        # a page only has a few cached queries, a filtered FLAT search over them is exact and cheap
+        schema = (
+            TagField("$.page", as_name="page"),
+            VectorField(
+                "$.query_embedding",
+                "FLAT",
+                {
+                    "TYPE": "FLOAT32",
+                    "DIM": self.embedding_dim,
+                    "DISTANCE_METRIC": "COSINE",
+                },
+                as_name="vector",
+            ),
+        )
+
+        definition = IndexDefinition(prefix=["summary:entry:"], index_type=IndexType.JSON)
+
+        try:
+            await self.client.ft(self.index_name).create_index(fields=schema, definition=definition)
+            logger.info(f"Index created: {self.index_name}")
+        except ResponseError as e:
+            if "already exists" not in str(e):
+                logger.error(f"Error creating index: {e}")
+
+        self._index_ready = True
+
+
+    def _keys(self, query: str, url: str, details: Optional[str]) -> Tuple[str, str]:
+        page = make_key(url, hashlib.sha256((details or "").encode("utf-8")).hexdigest())
+        return page, f"summary:entry:{make_key(page, normalize_query(query))}"
+
+
+    async def get(self, query: str, url: str, details: Optional[str], deadline: Deadline = NO_DEADLINE) -> Optional[str]:
+        # a lookup which can't finish in time is a miss
+        if not deadline.expired():
+            try:
+                return await asyncio.wait_for(self._get(query, url, details), timeout=deadline.timeout())
+            except asyncio.TimeoutError:
+                logger.warning(f"Answer cache lookup for {url} ran out of time")
+
+        self.misses += 1
+        return None
+
+
+    async def _get(self, query: str, url: str, details: Optional[str]) -> Optional[str]:
+        page, key = self._keys(query, url, details)
+
+        # a hit renews the entry, so it expires exactly `expire_time` seconds after its score in the LRU set
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.json().get(key, "$.answer")
+            pipe.expire(key, self.expire_time)
+            pipe.zadd(self.lru_key, {key: time.time()}, xx=True)
+            answer, *_ = await pipe.execute()
+
+        if answer:
+            self.hits += 1
+            return answer[0]
+
+        # an entry which expired since it was last used leaves the LRU set
+        await self.client.zrem(self.lru_key, key)
+
+        if self.sim_threshold > 0:
+            answer = await self._get_similar(query, page)
+            if answer:
+                self.hits += 1
+                self.similar_hits += 1
+                return answer
+
+        self.misses += 1
+        return None
+
+
+    async def _get_similar(self, query: str, page: str) -> Optional[str]:
+        query_embedding = await self.embedding_client.get_embedding(query)
+
+        await self._ensure_index()
+
+        search_query = (
+            Query(f'(@page:{{{page}}})=>[KNN 1 @vector $query_vector AS vector_score]')
+            .sort_by('vector_score')
+            .return_fields('vector_score', '$.answer')
+            .dialect(2)
+        )
+
+        try:
+            docs = (await self.client.ft(self.index_name).search(
+                search_query,
+                {"query_vector": np.array(query_embedding, dtype=np.float32).tobytes()},
+            )).docs
+        except ResponseError as e:
+            logger.warning(f"Error searching index {self.index_name}: {e}")
+            self._index_ready = False
+            return None
+
+        if not docs or (1 - float(docs[0].vector_score)) < self.sim_threshold:
+            return None
+
+        return getattr(docs[0], "$.answer", None)
+
+
+    async def set(self, query: str, url: str, details: Optional[str], answer: str):
+        page, key = self._keys(query, url, details)
+
+        obj = {"page": page, "query": query, "answer": answer}
+        if self.sim_threshold > 0:
+            obj["query_embedding"] = await self.embedding_client.get_embedding(query)
+            await self._ensure_index()
+
+        # the entries which expired are dropped from the LRU set first, so only live entries are counted
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.json().set(key, "$", obj)
+            pipe.expire(key, self.expire_time)
+            pipe.zadd(self.lru_key, {key: now})
+            pipe.zremrangebyscore(self.lru_key, "-inf", now - self.expire_time)
+            pipe.zcard(self.lru_key)
+            *_, size = await pipe.execute()
+
+        # evict the least recently used entries
+        if size > self.max_entries:
+            evicted = await self.client.zpopmin(self.lru_key, size - self.max_entries)
+            if evicted:
+                await self.client.delete(*[member for member, _ in evicted])
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+
+class NegativeCacheClient:
+    """
+    A short-lived Redis set of URLs which just failed to fetch or extract, shared by every worker, so a
+    failing page isn't fetched again by each query (and each worker) until `expire_time` has passed.
+    Lookups are bounded by `timeout`, a slow or failing Redis is a miss.
+    Parameters:
+        client (redis.asyncio.Redis): Async Redis client, shared with the query cache
+        expire_time (int): Seconds a failing URL is skipped, 0 disables the cache
+        timeout (float): Maximum seconds of a lookup
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        expire_time: int = 300,
+        timeout: float = 0.25,
+    ):
+        self.client = client
+        self.expire_time = expire_time
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+        self.added = 0
+
 
-        return SearchResponse(**obj)
+    @staticmethod
+    def _key(url: str) -> str:
+        return f"negative:{make_key(url)}"
+
+
+    async def contains(self, url: str, deadline: Deadline = NO_DEADLINE) -> bool:
+        if self.expire_time <= 0:
+            return False
+
+        try:
+            found = await asyncio.wait_for(self.client.exists(self._key(url)), timeout=deadline.timeout(self.timeout))
+        except Exception as e:
+            logger.warning(f"Error looking up {url} in the negative cache: {e!r}")
+            found = False
+
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return bool(found)
+
+
+    async def add(self, url: str):
+        if self.expire_time <= 0:
+            return
+
+        try:
+            await self.client.set(self._key(url), 1, ex=self.expire_time)
+            self.added += 1
+        except Exception as e:
+            logger.error(f"Error adding {url} to the negative cache: {e}")
+
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "added": self.added,
+        }
+
+
+
+class SerpCacheClient:
+    """
+    A Redis cache of the link lists returned by the search providers, shared by every worker, keyed on the
+    provider, the normalized query and `newest_first`. On a miss at least `num_results` links are fetched and
+    stored, so a request for fewer or more links (up to the number stored) is served without calling the
+    provider again. A list shorter than requested is all the provider has, and serves any number of links.
+    Lookups are bounded by `timeout`, a slow or failing Redis is a miss.
+    Parameters:
+        client (redis.asyncio.Redis): Async Redis client, shared with the query cache
+        expire_times (Dict[str, int]): Seconds the links of each provider are kept, 0 disables the cache for it
+        default_expire_time (int): Seconds the links of the other providers are kept
+        num_results (int): Minimum number of links fetched and stored on a miss
+        timeout (float): Maximum seconds of a lookup
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        expire_times: Optional[Dict[str, int]] = None,
+        default_expire_time: int = 3600,
+        num_results: int = 10,
+        timeout: float = 0.25,
+    ):
+        self.client = client
+        self.expire_times = expire_times or {}
+        self.default_expire_time = default_expire_time
+        self.num_results = num_results
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+
+    def expire_time(self, provider: str) -> int:
+        return self.expire_times.get(provider, self.default_expire_time)
+
+
+    def enabled(self, provider: str) -> bool:
+        return self.expire_time(provider) > 0
+
+
+    @staticmethod
+    def _key(provider: str, query: str, newest_first: bool) -> str:
+        return f"serp:{make_key(provider, normalize_query(query), newest_first)}"
+
+
+    async def get(self, provider: str, query: str, num_results: int, newest_first: bool, deadline: Deadline = NO_DEADLINE) -> Optional[List[SearchResult]]:
+        """
+        The first `num_results` cached links of `query`, or None if fewer links than that are cached.
+        """
+        if not self.enabled(provider):
+            return None
+
+        try:
+            with STAGE_DURATION.labels("serp_cache").time():
+                value = await asyncio.wait_for(self.client.get(self._key(provider, query, newest_first)), timeout=deadline.timeout(self.timeout))
+        except Exception as e:
+            logger.warning(f"Error looking up the links of '{query}' in the SERP cache: {e!r}")
+            value = None
+
+        if value:
+            entry = json.loads(value)
+            if entry["complete"] or len(entry["results"]) >= num_results:
+                self.hits += 1
+                return [SearchResult(**result) for result in entry["results"][:num_results]]
+
+        self.misses += 1
+        return None
+
+
+    async def set(self, provider: str, query: str, newest_first: bool, results: List[SearchResult], complete: bool):
+        """
+        Cache the links of `query`, `complete` when the provider returned fewer links than requested.
+        """
+        if not self.enabled(provider) or not results:
+            return
+
+        entry = {
+            "results": [result.model_dump(include={"title", "url", "content"}) for result in results],
+            "complete": complete,
+        }
+        try:
+            await self.client.set(self._key(provider, query, newest_first), json.dumps(entry), ex=self.expire_time(provider))
+            self.stored += 1
+        except Exception as e:
+            logger.error(f"Error caching the links of '{query}': {e}")
+
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+        }
 
 
 
@@ -147,16 +902,39 @@ class LongTermCacheClient:
     """
     A cache client for long-term storage using MongoDB.
     This class provides caching functionality using MongoDB as the backend storage system.
-    It stores search results with their associated URLs for long-term persistence.
+    Pages are split in two collections: `collection_name` maps each URL to the hash of its details and its
+    fetch metadata (fetch time, ETag, Last-Modified), and `{collection_name}_contents` holds each distinct
+    details text once, zstd-compressed. Once enough pages were seen, a zstd dictionary is trained on them and
+    stored in `{collection_name}_dictionaries`, which compresses the many small, similar pages much better.
+    Only one worker trains the dictionary, under a lease in `{collection_name}_dictionaries`, the others
+    pick it up from there.
+    Pages expire `ttl` seconds after they were last fetched or revalidated and the least recently validated
+    ones are evicted beyond `max_pages`. The contents a page no longer points to are deleted when it's
+    rewritten or evicted, and every `sweep_interval` seconds the contents no page points to are swept.
+    Documents written before the split (a URL with its raw `details`) are still read.
+    All calls go through the async Motor driver; lookups for a whole result list are a single
+    `$in` query per collection and writes are a single unordered `bulk_write` per collection.
     Attributes:
-        collection: MongoDB collection object for storing cache entries
+        collection: MongoDB collection of the pages
+        contents: MongoDB collection of the compressed details, keyed by content hash
+        dictionaries: MongoDB collection of the trained zstd dictionaries, keyed by dictionary id
     Args:
         mongo_url (str): MongoDB connection URL
         db_name (str): Name of the MongoDB database to use
         collection_name (str): Name of the collection to store cache entries
+        ttl (int): Seconds a page is kept after it was last validated, 0 keeps it forever
+        max_pages (int): Maximum number of pages, 0 doesn't limit it
+        compression_level (int): zstd compression level
+        dict_size (int): Size in bytes of the trained dictionary, 0 disables the dictionary
+        dict_samples (int): Number of pages to train the dictionary on
+        sweep_interval (float): Seconds between two sweeps of the unreferenced contents, 0 disables the sweep
     Methods:
         set(search_response): Stores search results in the cache
+        set_pages(pages): Stores pages with their metadata, e.g. after a revalidation
         get(url): Retrieves cached details for a given URL
+        get_many(urls): Retrieves cached details for several URLs in one round-trip
+        get_pages(urls): Same as get_many, with the fetch metadata of each page
+        storage_stats(): Reports the number of pages and contents and their raw and stored sizes
     Raises:
         errors.ConnectionFailure: If connection to MongoDB fails
     """
@@ -167,42 +945,473 @@ class LongTermCacheClient:
         mongo_url: str,
         db_name: str,
         collection_name: str,
+        ttl: int = 0,
+        max_pages: int = 0,
+        compression_level: int = 3,
+        dict_size: int = 64 * 1024,
+        dict_samples: int = 500,
+        sweep_interval: float = 3600,
     ):
         try:
-            mongo_client = MongoClient(mongo_url)
+            mongo_client = AsyncIOMotorClient(mongo_url)
         except errors.ConnectionFailure as error:
             logger.info(f"Error: {error}")
             raise error
         db = mongo_client[db_name]
 
+        self.client = mongo_client
         self.collection = db[collection_name]
+        self.contents = db[f"{collection_name}_contents"]
+        self.dictionaries = db[f"{collection_name}_dictionaries"]
+
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self.compression_level = compression_level
+        self.dict_size = dict_size
+        self.dict_samples = dict_samples
+        self.sweep_interval = sweep_interval
+
+        self._index_ready = False
+        self._index_lock = asyncio.Lock()
+
+        # the dictionary new contents are compressed with (id 0: none), and every dictionary seen
+        self._dict_id = 0
+        self._dictionaries: Dict[int, Optional[zstd.ZstdCompressionDict]] = {0: None}
+        # zstd (de)compressors aren't thread-safe: each thread of asyncio.to_thread builds its own
+        self._local = threading.local()
+        self._samples: List[bytes] = []
+        self._training = False
+
+        self._last_eviction = 0.0
+        self._last_sweep = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.raw_bytes_written = 0
+        self.compressed_bytes_written = 0
+        self.deduplicated = 0
+        self.orphans_deleted = 0
+
+        self.latency = {
+            "get": LatencyStats(),
+            "set": LatencyStats(),
+        }
+
+
+    async def _ensure_index(self):
+        # create the indexes and load the latest dictionary if it wasn't done yet
+        if self._index_ready:
+            return
 
-        # create an index on the URL field if it doesn't exist
-        if "url_1" not in self.collection.index_information():
-            self.collection.create_index("url", unique=True)
+        async with self._index_lock:
+            if self._index_ready:
+                return
+
+            await self.collection.create_index("url", unique=True)
+            await self.collection.create_index("validated_at")
+            await self.collection.create_index("content_hash")
+
+            # mongo removes the documents once `expires_at` is in the past
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            await self.contents.create_index("expires_at", expireAfterSeconds=0)
+
+            if self.dict_size > 0:
+                await self._load_dictionary()
+
+            self._index_ready = True
+
+
+    async def _load_dictionary(self) -> bool:
+        # the latest dictionary, trained by any worker (the training lease has no data)
+        async for doc in self.dictionaries.find({"data": {"$exists": True}}).sort("created_at", -1).limit(1):
+            if doc["_id"] != self._dict_id:
+                self._use_dictionary(doc["_id"], doc["data"])
+            return True
+        return False
+
+
+    async def _take_training_lease(self) -> bool:
+        # a single worker trains the dictionary, the lease expires in case it dies while training
+        now = datetime.now(timezone.utc)
+        try:
+            await self.dictionaries.find_one_and_update(
+                {"_id": "training", "expires_at": {"$lt": now}},
+                {"$set": {"expires_at": now + timedelta(minutes=10)}},
+                upsert=True,
+            )
+        except errors.DuplicateKeyError:
+            return False
+        return True
+
+
+    def _use_dictionary(self, dict_id: int, data: bytes):
+        dictionary = self._dictionaries[dict_id] = zstd.ZstdCompressionDict(data)
+        dictionary.precompute_compress(level=self.compression_level)
+        self._dict_id = dict_id
+        self._samples = []
+
+
+    async def _load_dictionaries(self, dict_ids: Set[int]) -> Set[int]:
+        # contents may have been written by another worker, with a dictionary this one hasn't loaded yet
+        for dict_id in dict_ids - self._dictionaries.keys():
+            doc = await self.dictionaries.find_one({"_id": dict_id, "data": {"$exists": True}})
+            if doc is None:
+                logger.error(f"Missing zstd dictionary {dict_id}")
+                continue
+            self._dictionaries[dict_id] = zstd.ZstdCompressionDict(doc["data"])
+
+        return dict_ids & self._dictionaries.keys()
+
+
+    def _compressor(self, dict_id: int) -> zstd.ZstdCompressor:
+        # called from the worker threads only
+        compressors = self._local.__dict__.setdefault("compressors", {})
+        if dict_id not in compressors:
+            compressors[dict_id] = zstd.ZstdCompressor(level=self.compression_level, dict_data=self._dictionaries[dict_id])
+        return compressors[dict_id]
+
+
+    def _decompressor(self, dict_id: int) -> zstd.ZstdDecompressor:
+        # called from the worker threads only
+        decompressors = self._local.__dict__.setdefault("decompressors", {})
+        if dict_id not in decompressors:
+            decompressors[dict_id] = zstd.ZstdDecompressor(dict_data=self._dictionaries[dict_id])
+        return decompressors[dict_id]
+
+
+    async def _train_dictionary(self, samples: List[bytes]):
+        try:
+            # another worker may have trained one already, or be training it: this one samples again meanwhile
+            if await self._load_dictionary() or not await self._take_training_lease():
+                return
+
+            try:
+                dictionary = await asyncio.to_thread(zstd.train_dictionary, self.dict_size, samples, level=self.compression_level)
+                await self.dictionaries.insert_one({
+                    "_id": dictionary.dict_id(),
+                    "data": dictionary.as_bytes(),
+                    "created_at": datetime.now(timezone.utc),
+                })
+            except errors.DuplicateKeyError:
+                pass
+            finally:
+                await self.dictionaries.delete_one({"_id": "training"})
+        except Exception as e:
+            logger.error(f"Error training the page store dictionary: {e}")
+            return
+        finally:
+            self._training = False
+
+        self._use_dictionary(dictionary.dict_id(), dictionary.as_bytes())
+        logger.info(f"Trained a {len(dictionary.as_bytes())} bytes page store dictionary on {len(samples)} pages")
+
+
+    def _sample(self, data: bytes):
+        # keep the first pages until there are enough to train the dictionary
+        if self.dict_size <= 0 or self._dict_id or self._training:
+            return
+
+        self._samples.append(data)
+        if len(self._samples) >= self.dict_samples:
+            self._training = True
+            samples, self._samples = self._samples, []
+            asyncio.create_task(self._train_dictionary(samples))
 
 
     async def set(self, search_response: SearchResponse):
 
+        # one entry per URL, with the fetch metadata when the details were just fetched
+        pages: Dict[str, PageDetails] = {}
         for result in search_response.results:
+            if not result.details:
+                continue
 
-            if result.details:
-                self.collection.update_one(
-                    {"url": result.url},
-                    {"$set": {"url": result.url, "details": result.details}},
-                    upsert=True
-                )
-        
+            if result._page is None or result._page.details != result.details:
+                pages[result.url] = PageDetails(details=result.details, fetched_at=datetime.now(timezone.utc))
+            elif not result._page._from_store:
+                # pages served from the store are left alone, a background revalidation may have updated them since
+                pages[result.url] = result._page
 
+        return await self.set_pages(pages)
 
-    async def get(self, url: str) -> str:
-        # get the object from the collection
-        doc = self.collection.find_one({"url": url})
 
-        if not doc:
+    async def set_pages(self, pages: Dict[str, PageDetails]):
+        if not pages:
             return None
-        
-        # log the url which was found
-        logger.info(f"Found details for URL: {url}")
 
-        return doc["details"]
\ No newline at end of file
+        await self._ensure_index()
+
+        with self.latency["set"].measure():
+            raw = {url: page.details.encode("utf-8") for url, page in pages.items()}
+            hashes = {url: hashlib.sha256(data).hexdigest() for url, data in raw.items()}
+            unique = {hashes[url]: data for url, data in raw.items()}
+
+            dict_id = self._dict_id
+            compressed = await asyncio.to_thread(self._compress, unique, dict_id)
+
+            for data in unique.values():
+                self._sample(data)
+
+            # the contents the pages pointed to until now, deleted below if no page points to them anymore
+            previous = await self.collection.find(
+                {"url": {"$in": list(pages)}, "content_hash": {"$exists": True}}, {"_id": 0, "content_hash": 1}
+            ).to_list(length=None)
+            replaced = {doc["content_hash"] for doc in previous} - set(unique)
+
+            # contents first, so a page never points to a missing content; a content lives as long as its last page
+            page_operations = []
+            content_expiry: Dict[str, Optional[datetime]] = {}
+            for url, page in pages.items():
+                fetched_at = page.fetched_at or datetime.now(timezone.utc)
+                validated_at = page.validated_at or fetched_at
+                expires_at = validated_at + timedelta(seconds=self.ttl) if self.ttl > 0 else None
+                content_expiry[hashes[url]] = max(filter(None, [content_expiry.get(hashes[url]), expires_at]), default=None)
+
+                page_operations.append(UpdateOne(
+                    {"url": url},
+                    {
+                        "$set": {
+                            "url": url,
+                            "content_hash": hashes[url],
+                            "fetched_at": fetched_at,
+                            "validated_at": validated_at,
+                            "etag": page.etag,
+                            "last_modified": page.last_modified,
+                            "expires_at": expires_at,
+                        },
+                        # drop the raw details of a document written before the split
+                        "$unset": {"details": ""},
+                    },
+                    upsert=True,
+                ))
+
+            content_operations = []
+            for content_hash, expires_at in content_expiry.items():
+                content_update = {
+                    "$setOnInsert": {
+                        "data": compressed[content_hash],
+                        "dict_id": dict_id,
+                        "size": len(unique[content_hash]),
+                        "compressed_size": len(compressed[content_hash]),
+                    },
+                    # a content written to a moment ago isn't an orphan, its page is being written
+                    "$set": {"written_at": datetime.now(timezone.utc)},
+                }
+                if expires_at:
+                    content_update["$max"] = {"expires_at": expires_at}
+                content_operations.append(UpdateOne({"_id": content_hash}, content_update, upsert=True))
+
+            try:
+                content_result = await self.contents.bulk_write(content_operations, ordered=False)
+                result = await self.collection.bulk_write(page_operations, ordered=False)
+            except errors.BulkWriteError as error:
+                # concurrent upserts of the same URL may race on the unique index, the other writes still apply
+                logger.warning(f"Some long-term cache writes failed: {error.details.get('writeErrors', [])[:1]}")
+                return None
+
+        new_contents = set(content_result.upserted_ids.values())
+        self.deduplicated += len(pages) - len(new_contents)
+        self.raw_bytes_written += sum(len(unique[content_hash]) for content_hash in new_contents)
+        self.compressed_bytes_written += sum(len(compressed[content_hash]) for content_hash in new_contents)
+
+        await self._delete_orphans(replaced)
+        await self._evict()
+        await self._sweep()
+
+        return result
+
+
+    async def _delete_orphans(self, hashes: Set[str]):
+        # the contents of `hashes` no page points to anymore, unless they were just written for a page not written yet
+        if not hashes:
+            return
+
+        still_used = await self.collection.distinct("content_hash", {"content_hash": {"$in": list(hashes)}})
+        orphans = list(hashes - set(still_used))
+        if orphans:
+            recent = datetime.now(timezone.utc) - timedelta(minutes=5)
+            result = await self.contents.delete_many({"_id": {"$in": orphans}, "written_at": {"$not": {"$gte": recent}}})
+            self.orphans_deleted += result.deleted_count
+
+
+    async def _sweep(self):
+        # the contents no page points to, e.g. left behind by a worker which died between its writes
+        if self.sweep_interval <= 0 or time.monotonic() - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = time.monotonic()
+
+        docs = await self.contents.aggregate([
+            {"$lookup": {"from": self.collection.name, "localField": "_id", "foreignField": "content_hash", "as": "pages"}},
+            {"$match": {"pages": {"$size": 0}}},
+            {"$project": {"_id": 1}},
+        ]).to_list(length=None)
+        await self._delete_orphans({doc["_id"] for doc in docs})
+
+        if docs:
+            logger.info(f"Swept {len(docs)} unreferenced contents from the long-term cache")
+
+
+    async def _evict(self):
+        # count the pages at most once a minute, the TTL index takes care of the rest
+        if self.max_pages <= 0 or time.monotonic() - self._last_eviction < 60:
+            return
+        self._last_eviction = time.monotonic()
+
+        excess = await self.collection.estimated_document_count() - self.max_pages
+        if excess <= 0:
+            return
+
+        # the least recently validated pages go first, documents without a fetch time (written before the split) before them
+        docs = await self.collection.find({}, {"_id": 1, "content_hash": 1}).sort("validated_at", 1).limit(excess).to_list(length=None)
+        await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        self.evicted += len(docs)
+
+        # then the contents no page points to anymore
+        await self._delete_orphans({doc["content_hash"] for doc in docs if doc.get("content_hash")})
+
+        logger.info(f"Evicted {len(docs)} pages from the long-term cache")
+
+
+    async def get(self, url: str) -> str:
+        details = await self.get_many([url])
+        return details.get(url)
+
+
+    async def get_many(self, urls: List[str]) -> Dict[str, str]:
+        pages = await self.get_pages(urls)
+        return {url: page.details for url, page in pages.items()}
+
+
+    async def get_pages(self, urls: List[str], deadline: Deadline = NO_DEADLINE) -> Dict[str, PageDetails]:
+        if not urls:
+            return {}
+
+        # a lookup which can't finish in time is a miss for every page
+        if not deadline.expired():
+            try:
+                with STAGE_DURATION.labels("page_store").time():
+                    return await asyncio.wait_for(self._get_pages(urls), timeout=deadline.timeout())
+            except asyncio.TimeoutError:
+                STAGE_TIMEOUTS.labels("page_store").inc()
+                logger.warning(f"Page store lookup for {len(urls)} URLs ran out of time")
+
+        self.misses += len(set(urls))
+        return {}
+
+
+    async def _get_pages(self, urls: List[str]) -> Dict[str, PageDetails]:
+        await self._ensure_index()
+
+        # get all the pages, then all their contents, in a single query each
+        with self.latency["get"].measure():
+            cursor = self.collection.find(
+                {"url": {"$in": list(set(urls))}},
+                {"_id": 0, "url": 1, "details": 1, "content_hash": 1, "fetched_at": 1, "validated_at": 1, "etag": 1, "last_modified": 1, "expires_at": 1},
+            )
+            docs = await cursor.to_list(length=None)
+
+            # the TTL monitor only runs every minute
+            now = datetime.now(timezone.utc)
+            fresh_docs = [doc for doc in docs if not doc.get("expires_at") or doc["expires_at"].replace(tzinfo=timezone.utc) > now]
+            self.expired += len(docs) - len(fresh_docs)
+
+            hashes = list({doc["content_hash"] for doc in fresh_docs if doc.get("content_hash")})
+            contents = {}
+            if hashes:
+                cursor = self.contents.find({"_id": {"$in": hashes}}, {"data": 1, "dict_id": 1})
+                contents = {doc["_id"]: doc for doc in await cursor.to_list(length=None)}
+
+            dict_ids = await self._load_dictionaries({doc.get("dict_id", 0) for doc in contents.values()})
+
+            details = await asyncio.to_thread(self._decompress, fresh_docs, contents, dict_ids)
+
+        pages = {}
+        for doc in fresh_docs:
+            if not details.get(doc["url"]):
+                continue
+
+            page = pages[doc["url"]] = PageDetails(
+                details=details[doc["url"]],
+                fetched_at=doc["fetched_at"].replace(tzinfo=timezone.utc) if doc.get("fetched_at") else None,
+                validated_at=doc["validated_at"].replace(tzinfo=timezone.utc) if doc.get("validated_at") else None,
+                etag=doc.get("etag"),
+                last_modified=doc.get("last_modified"),
+            )
+            page._from_store = True
+
+        self.hits += len(pages)
+        self.misses += len(set(urls)) - len(pages)
+
+        # log the urls which were found
+        for url in pages:
+            logger.info(f"Found details for URL: {url}")
+
+        return pages
+
+
+    def _compress(self, unique: Dict[str, bytes], dict_id: int) -> Dict[str, bytes]:
+        compressor = self._compressor(dict_id)
+        return {content_hash: compressor.compress(data) for content_hash, data in unique.items()}
+
+
+    def _decompress(self, docs: List[dict], contents: Dict[str, dict], dict_ids: Set[int]) -> Dict[str, str]:
+        details = {}
+        for doc in docs:
+            # a document written before the split
+            if doc.get("details"):
+                details[doc["url"]] = doc["details"]
+                continue
+
+            content = contents.get(doc.get("content_hash"))
+            if content is None or content.get("dict_id", 0) not in dict_ids:
+                continue
+
+            try:
+                details[doc["url"]] = self._decompressor(content.get("dict_id", 0)).decompress(content["data"]).decode("utf-8")
+            except zstd.ZstdError as e:
+                logger.error(f"Error decompressing the details of {doc['url']}: {e}")
+
+        return details
+
+
+    async def storage_stats(self) -> dict:
+        """
+        Number of pages and distinct contents, and the size of the contents before and after compression.
+        """
+        await self._ensure_index()
+
+        sizes = await self.contents.aggregate([
+            {"$group": {"_id": None, "count": {"$sum": 1}, "size": {"$sum": "$size"}, "compressed_size": {"$sum": "$compressed_size"}}},
+        ]).to_list(length=None)
+        sizes = sizes[0] if sizes else {"count": 0, "size": 0, "compressed_size": 0}
+
+        return {
+            "pages": await self.collection.estimated_document_count(),
+            "legacy_pages": await self.collection.count_documents({"details": {"$exists": True}}),
+            "contents": sizes["count"],
+            "raw_bytes": sizes["size"],
+            "compressed_bytes": sizes["compressed_size"],
+            "compression_ratio": round(sizes["size"] / sizes["compressed_size"], 2) if sizes["compressed_size"] else 0.0,
+            "dictionaries": await self.dictionaries.count_documents({"data": {"$exists": True}}),
+        }
+
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "deduplicated": self.deduplicated,
+            "orphans_deleted": self.orphans_deleted,
+            "dictionary_id": self._dict_id,
+            "raw_bytes_written": self.raw_bytes_written,
+            "compressed_bytes_written": self.compressed_bytes_written,
+            "latency": {name: latency.to_dict() for name, latency in self.latency.items()},
+        }
+
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import math
+import re
+from collections import Counter
+from typing import List, Literal, Optional, Tuple
+
+import numpy as np
+
+from logs import logger
+from stats import LatencyStats
+from metrics import STAGE_DURATION
+from utils import NO_DEADLINE, Deadline
+
+from .embedding_clients import EmbeddingClient
+from .llm_clients import LLMClient
+
+
+ChunkSelectionMethod = Literal["none", "bm25", "embedding", "hybrid"]
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class ChunkSelector:
+    """
+    Picks the parts of a page relevant to a query, instead of its first tokens, to fill the LLM prompt.
+    Pages longer than the token budget are split into chunks of consecutive lines, the chunks are scored
+    against the query and the best ones which fit in the budget are kept, in page order. Scoring is lexical
+    (`bm25`, Okapi BM25 with the chunks of the page as the corpus), semantic (`embedding`, cosine similarity
+    of batched chunk embeddings) or both (`hybrid`, the BM25 candidates reranked by a weighted sum of both
+    scores). When the embeddings fail or are too slow, the BM25 scores are used (or the first tokens in
+    `embedding` mode).
+    Parameters:
+        llm_client (LLMClient): Client whose tokenizer measures the chunks
+        embedding_client (EmbeddingClient): Client embedding the query and the chunks
+        method (str): none, bm25, embedding or hybrid
+        chunk_tokens (int): Target size of a chunk in tokens
+        max_chunks (int): Maximum number of chunks scored per page, the rest of the page is ignored
+        max_embedded_chunks (int): Maximum number of chunks embedded per page
+        bm25_weight (float): Weight of the (max-normalized) BM25 score in hybrid mode, the cosine similarity gets the rest
+        embedding_timeout (float): Maximum seconds waited for the chunk embeddings
+    """
+
+    def __init__(
+        self,
+        llm_client: LLMClient,
+        embedding_client: EmbeddingClient,
+        method: ChunkSelectionMethod = "none",
+        chunk_tokens: int = 128,
+        max_chunks: int = 256,
+        max_embedded_chunks: int = 64,
+        bm25_weight: float = 0.3,
+        embedding_timeout: float = 2,
+    ):
+        self.llm_client = llm_client
+        self.embedding_client = embedding_client
+        self.method = method
+        self.chunk_tokens = chunk_tokens
+        self.max_chunks = max_chunks
+        self.max_embedded_chunks = max_embedded_chunks
+        self.bm25_weight = bm25_weight
+        self.embedding_timeout = embedding_timeout
+
+        self.pages = 0
+        self.selected_pages = 0
+        self.embedding_fallbacks = 0
+        self.tokens_scored = 0
+        self.tokens_selected = 0
+        self.latency = LatencyStats()
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.method != "none"
+
+
+    def _split(self, details: str) -> List[Tuple[str, int]]:
+        # group consecutive lines into chunks of about chunk_tokens tokens, a longer line is a chunk on its own
+        # the page is tokenized once, a line has the tokens which start in it (line by line without offsets)
+        offsets = self.llm_client.token_offsets(details)
+
+        chunks = []
+        lines, num_tokens = [], 0
+        position = 0
+        for line in details.split("\n"):
+            start, end = position, position + len(line)
+            position = end + 1
+            if not line.strip():
+                continue
+
+            if offsets is None:
+                line_tokens = self.llm_client.num_tokens(line)
+            else:
+                line_tokens = bisect.bisect_left(offsets, end) - bisect.bisect_left(offsets, start)
+            if lines and num_tokens + line_tokens > self.chunk_tokens:
+                chunks.append(("\n".join(lines), num_tokens))
+                lines, num_tokens = [], 0
+                if len(chunks) >= self.max_chunks:
+                    return chunks
+
+            lines.append(line)
+            num_tokens += line_tokens
+
+        if lines:
+            chunks.append(("\n".join(lines), num_tokens))
+        return chunks
+
+
+    @staticmethod
+    def _bm25(query: str, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+        terms = set(WORD_PATTERN.findall(query.lower()))
+        documents = [Counter(WORD_PATTERN.findall(chunk.lower())) for chunk in chunks]
+
+        lengths = np.array([sum(document.values()) for document in documents], dtype=np.float32)
+        avg_length = float(lengths.mean()) or 1.0
+
+        scores = np.zeros(len(chunks), dtype=np.float32)
+        for term in terms:
+            frequencies = np.array([document.get(term, 0) for document in documents], dtype=np.float32)
+            num_documents = int((frequencies > 0).sum())
+            if not num_documents:
+                continue
+
+            idf = math.log(1 + (len(chunks) - num_documents + 0.5) / (num_documents + 0.5))
+            scores += idf * frequencies * (k1 + 1) / (frequencies + k1 * (1 - b + b * lengths / avg_length))
+
+        return scores
+
+
+    def _prepare(self, query: str, details: str, max_tokens: int) -> Tuple[Optional[str], List[Tuple[str, int]], Optional[np.ndarray]]:
+        # the details if they fit, otherwise their chunks and, unless only embeddings are used, their BM25 scores
+        truncated = self.llm_client.truncate_to_tokens(details, max_tokens)
+        if truncated == details:
+            return details, [], None
+
+        chunks = self._split(details)
+        if self.method == "embedding":
+            return truncated, chunks, None
+        return truncated, chunks, self._bm25(query, [chunk for chunk, _ in chunks])
+
+
+    async def _similarities(self, query: str, chunks: List[str], deadline: Deadline) -> Optional[np.ndarray]:
+        try:
+            # chunk embeddings are used once, keep them out of the embedding cache
+            embeddings = await asyncio.wait_for(
+                asyncio.gather(
+                    self.embedding_client.get_embedding(query),
+                    *[self.embedding_client.get_embedding(chunk, cache=False) for chunk in chunks],
+                ),
+                timeout=deadline.timeout(self.embedding_timeout),
+            )
+        except Exception as e:
+            logger.warning(f"Error embedding {len(chunks)} chunks for '{query}': {e!r}")
+            self.embedding_fallbacks += 1
+            return None
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+        return vectors[1:] @ vectors[0]
+
+
+    def _join(self, chunks: List[Tuple[str, int]], scores: np.ndarray, max_tokens: int) -> Tuple[str, int]:
+        # best chunks first (earlier ones on ties) while they fit, then back in page order; the budget is
+        # approximate, lines are tokenized separately and the gap markers aren't counted
+        order = sorted(range(len(chunks)), key=lambda i: (-float(scores[i]), i))
+
+        selected, num_tokens = [], 0
+        for i in order:
+            if num_tokens + chunks[i][1] <= max_tokens:
+                selected.append(i)
+                num_tokens += chunks[i][1]
+
+        if not selected:
+            return self.llm_client.truncate_to_tokens(chunks[order[0]][0], max_tokens), max_tokens
+
+        # mark the gaps, so the model doesn't read two distant chunks as one passage
+        selected.sort()
+        parts = [chunks[selected[0]][0]]
+        for previous, i in zip(selected, selected[1:]):
+            parts.append(("\n" if i == previous + 1 else "\n[...]\n") + chunks[i][0])
+        return "".join(parts), num_tokens
+
+
+    async def select(self, query: str, details: Optional[str], max_tokens: int, deadline: Deadline = NO_DEADLINE) -> Optional[str]:
+        """
+        The chunks of `details` most relevant to `query` within `max_tokens` tokens, or the details themselves if they fit.
+        """
+        if not details:
+            return details
+
+        if not self.enabled:
+            return await asyncio.to_thread(self.llm_client.truncate_to_tokens, details, max_tokens)
+
+        self.pages += 1
+
+        with self.latency.measure(), STAGE_DURATION.labels("chunk_selection").time():
+            # tokenizing and BM25 are CPU-bound, off the event loop
+            truncated, chunks, scores = await asyncio.to_thread(self._prepare, query, details, max_tokens)
+            if not chunks:
+                return truncated
+
+            if self.method in ("embedding", "hybrid"):
+                # embed the first chunks, or the best BM25 candidates
+                if scores is None:
+                    candidates = list(range(min(len(chunks), self.max_embedded_chunks)))
+                else:
+                    candidates = sorted(range(len(chunks)), key=lambda i: (-float(scores[i]), i))[:self.max_embedded_chunks]
+
+                similarities = await self._similarities(query, [chunks[i][0] for i in candidates], deadline)
+
+                if similarities is None and scores is None:
+                    return truncated
+
+                if similarities is not None:
+                    lexical = scores / (scores.max() or 1.0) if scores is not None else np.zeros(len(chunks), dtype=np.float32)
+                    weight = self.bm25_weight if scores is not None else 0.0
+
+                    # chunks which weren't embedded rank below the embedded ones
+                    combined = np.full(len(chunks), -np.inf, dtype=np.float32)
+                    combined[candidates] = weight * lexical[candidates] + (1 - weight) * similarities
+                    scores = combined
+
+            selected, num_tokens = self._join(chunks, scores, max_tokens)
+
+        self.selected_pages += 1
+        self.tokens_scored += sum(chunk_tokens for _, chunk_tokens in chunks)
+        self.tokens_selected += num_tokens
+
+        return selected
+
+
+    def stats(self) -> dict:
+        return {
+            "method": self.method,
+            "pages": self.pages,
+            "selected_pages": self.selected_pages,
+            "embedding_fallbacks": self.embedding_fallbacks,
+            "tokens_scored": self.tokens_scored,
+            "tokens_selected": self.tokens_selected,
+            "latency": self.latency.to_dict(),
+        }
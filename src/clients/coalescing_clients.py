@@ -0,0 +1,158 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from .cache_clients import ShortTermCacheClient
+
+from logs import logger
+from utils import NO_DEADLINE, Deadline
+
+
+class RequestCoalescer:
+    """
+    Single-flight for identical searches.
+    Within a worker, concurrent requests with the same key (or, within the same parameter group,
+    a query embedding above `sim_threshold`) share one in-flight computation. Across workers, a
+    Redis lease lets one worker compute while the others wait for its result to land in the
+    query cache.
+    Parameters:
+        cache_client (ShortTermCacheClient): Query cache holding the leases and the shared results
+        sim_threshold (float): Cosine similarity above which two in-flight queries are considered identical
+        lease_ttl (float): Seconds a lease is held at most, in case its worker dies
+        wait_timeout (float): Seconds a worker waits for another worker's lease before computing itself
+        poll_interval (float): Seconds between two checks of another worker's lease
+    """
+
+    def __init__(
+        self,
+        cache_client: ShortTermCacheClient,
+        sim_threshold: float,
+        lease_ttl: float = 60,
+        wait_timeout: float = 30,
+        poll_interval: float = 0.25,
+    ):
+        self.cache_client = cache_client
+        self.sim_threshold = sim_threshold
+        self.lease_ttl = lease_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+        # (key, parameter group) -> (task, parameter group, normalized query embedding)
+        self._inflight: Dict[Tuple[str, Hashable], Tuple[asyncio.Task, Hashable, Optional[np.ndarray]]] = {}
+
+        self.leaders = 0
+        self.coalesced = 0
+        self.semantic_coalesced = 0
+        self.remote_coalesced = 0
+        self.lease_timeouts = 0
+
+
+    def _find(self, key: str, group: Hashable, embedding: Optional[np.ndarray]) -> Optional[asyncio.Task]:
+        inflight = self._inflight.get((key, group))
+        if inflight is not None:
+            self.coalesced += 1
+            return inflight[0]
+
+        if embedding is None:
+            return None
+
+        for task, inflight_group, inflight_embedding in self._inflight.values():
+            if inflight_group == group and inflight_embedding is not None \
+                    and float(np.dot(embedding, inflight_embedding)) >= self.sim_threshold:
+                self.coalesced += 1
+                self.semantic_coalesced += 1
+                return task
+
+        return None
+
+
+    async def run(
+        self,
+        key: str,
+        group: Hashable,
+        embedding: Optional[List[float]],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Return the result of `compute()`, sharing it with concurrent calls for the same key or a similar query,
+        within the same parameter group.
+        """
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding /= np.linalg.norm(embedding) or 1.0
+
+        task = self._find(key, group, embedding)
+
+        if task is None:
+            self.leaders += 1
+
+            # run in its own task, so a cancelled caller doesn't cancel it for the others
+            task = asyncio.create_task(compute())
+            self._inflight[(key, group)] = (task, group, embedding)
+            task.add_done_callback(lambda _: self._inflight.pop((key, group), None))
+
+        return await asyncio.shield(task)
+
+
+    async def acquire(self, key: str) -> Optional[str]:
+        """
+        Take the cross-worker lease for `key`, returns its token, or None if another worker is computing it.
+        Lease errors never block a search: without Redis the caller just computes.
+        """
+        try:
+            token = await self.cache_client.acquire_lease(key, self.lease_ttl)
+        except Exception as e:
+            logger.error(f"Error acquiring lease {key}: {e}")
+            return ""
+
+        return token
+
+    async def release(self, key: str, token: str):
+        if not token:
+            return
+
+        try:
+            await self.cache_client.release_lease(key, token)
+        except Exception as e:
+            logger.error(f"Error releasing lease {key}: {e}")
+
+
+    async def wait_for_remote(self, key: str, get_cached: Callable[[], Awaitable[Any]], deadline: Deadline = NO_DEADLINE) -> Any:
+        """
+        Wait until the worker holding the lease for `key` is done, then return its cached result (None if there is none).
+        Waits at most `wait_timeout` seconds, or what's left of `deadline`.
+        """
+        wait_until = time.monotonic() + deadline.timeout(self.wait_timeout)
+
+        try:
+            while time.monotonic() < wait_until:
+                await asyncio.sleep(min(self.poll_interval, wait_until - time.monotonic()))
+                if not await self.cache_client.lease_exists(key):
+                    break
+            else:
+                self.lease_timeouts += 1
+                logger.warning(f"Timeout while waiting for lease {key}")
+                return None
+
+            result = await get_cached()
+        except Exception as e:
+            logger.error(f"Error waiting for lease {key}: {e}")
+            return None
+
+        if result is not None:
+            self.remote_coalesced += 1
+
+        return result
+
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "semantic_coalesced": self.semantic_coalesced,
+            "remote_coalesced": self.remote_coalesced,
+            "lease_timeouts": self.lease_timeouts,
+        }
@@ -1,13 +1,39 @@
+import asyncio
+from collections import OrderedDict
 from openai import AsyncOpenAI
-from typing import List
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from logs import logger
+from stats import LatencyStats
+from metrics import STAGE_DURATION
 
 
 class EmbeddingClient:
+    """
+    An embedding client that coalesces concurrent requests into batched calls.
+    Texts requested within `max_wait_ms` of each other are sent together in one
+    `embeddings.create(input=[...])` call of at most `max_batch_size` texts, identical
+    texts in flight share one request, and recent embeddings are kept in a bounded LRU
+    so the same query (e.g. the cache `get` followed by `set`) is only embedded once.
+    Parameters:
+        base_url (str): Base URL of the OpenAI-compatible embedding server
+        api_key (str): API key of the embedding server
+        embedding_model_name (str): Name of the embedding model
+        max_batch_size (int): Maximum number of texts per request
+        max_wait_ms (float): Maximum time a text waits for other texts to join its batch
+        cache_size (int): Number of recent embeddings kept in memory, 0 disables the cache
+    """
+
     def __init__(
         self,
         base_url: str,
         api_key: str,
         embedding_model_name: str,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5,
+        cache_size: int = 1024,
     ):
         self.client = AsyncOpenAI(
             base_url=base_url,
@@ -16,11 +42,123 @@ class EmbeddingClient:
 
         self.embedding_model_name = embedding_model_name
 
-    async def get_embedding(self, text: str) -> List[float]:
-        response = await self.client.embeddings.create(
-            model=self.embedding_model_name,
-            input=text,
-        )
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.cache_size = cache_size
+
+        # stored as float32 arrays, a list of python floats takes ~8 times more memory
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # (text, future, whether its embedding goes to the cache)
+        self._pending: List[Tuple[str, asyncio.Future, bool]] = []
+        self._flush_handle = None
+
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.latency = LatencyStats()
+
+
+    def _cache_get(self, text: str):
+        embedding = self._cache.get(text)
+        if embedding is not None:
+            self._cache.move_to_end(text)
+        return embedding
+
+    def _cache_set(self, text: str, embedding: List[float]):
+        if self.cache_size <= 0:
+            return
+
+        self._cache[text] = np.asarray(embedding, dtype=np.float32)
+        self._cache.move_to_end(text)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.create_task(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future, bool]]):
+        texts = [text for text, _, _ in batch]
+
+        self.batches += 1
+        self.batched_texts += len(texts)
+
+        try:
+            with self.latency.measure(), STAGE_DURATION.labels("embedding").time():
+                response = await self.client.embeddings.create(
+                    model=self.embedding_model_name,
+                    input=texts,
+                )
+        except Exception as e:
+            logger.error(f"Error getting embeddings for a batch of {len(texts)} texts: {e}")
+            for text, future, _ in batch:
+                self._inflight.pop(text, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for item in response.data:
+            text, future, cache = batch[item.index]
+            self._inflight.pop(text, None)
+            if cache:
+                self._cache_set(text, item.embedding)
+            if not future.done():
+                future.set_result(item.embedding)
+
+        # the server returned fewer embeddings than texts
+        for text, future, _ in batch:
+            if not future.done():
+                self._inflight.pop(text, None)
+                future.set_exception(ValueError(f"No embedding returned for text: {text[:50]}"))
+
+
+    async def get_embedding(self, text: str, cache: bool = True) -> List[float]:
+        # cache=False for texts embedded once (e.g. page chunks), so they don't evict the queries
+        self.requests += 1
+
+        embedding = self._cache_get(text)
+        if embedding is not None:
+            self.cache_hits += 1
+            return embedding.tolist()
+
+        future = self._inflight.get(text)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[text] = future
+            self._pending.append((text, future, cache))
+
+            # send a full batch right away, otherwise wait a little for more texts to join
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+        # shield the shared future, so a cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(future)
+
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.gather(*[self.get_embedding(text) for text in texts])
+
 
-        return response.data[0].embedding
-    
\ No newline at end of file
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_texts / self.batches, 2) if self.batches else 0.0,
+            "cache_size": len(self._cache),
+            "latency": self.latency.to_dict(),
+        }
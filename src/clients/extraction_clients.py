@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+
+from extraction_worker import init_worker, run_task
+
+from logs import logger
+from stats import LatencyStats
+from metrics import STAGE_DURATION, STAGE_TIMEOUTS
+
+
+class ExtractionClient:
+    """
+    Runs trafilatura extraction in a dedicated process pool, so CPU-bound extraction of several
+    pages runs in parallel instead of serializing on the GIL of the API worker.
+    Raw HTML bytes are sent to the workers as-is (no decoding in the API process; bytes pickle as
+    a single buffer copy). A task that exceeds `task_timeout` retires the pool: new tasks go to a fresh
+    pool while the tasks of the old one finish, then the process of the stuck task is killed (a worker
+    tells which process runs each task). A pool whose worker crashed is replaced; tasks that time out
+    while still queued are just cancelled.
+    Parameters:
+        max_workers (int): Number of worker processes, the number of cpus by default (divide it by the
+            number of API workers, each has its own pool)
+        task_timeout (float): Seconds allowed for a single extraction
+        start_method (str): Multiprocessing start method of the workers
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        task_timeout: float = 5,
+        start_method: str = "forkserver",
+    ):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.task_timeout = task_timeout
+        self.mp_context = multiprocessing.get_context(start_method)
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        # the process each task runs in, and the tasks in flight (and those stuck) in each pool
+        self._started = self.mp_context.Queue()
+        self._task_ids = itertools.count()
+        self._pending_ids: Set[int] = set()
+        self._pids: Dict[int, int] = {}
+        self._inflight: Dict[ProcessPoolExecutor, Set[Future]] = {}
+        self._stuck: Dict[ProcessPoolExecutor, Dict[Future, Optional[int]]] = {}
+
+        self.pending = 0
+        self.timeouts = 0
+        self.restarts = 0
+
+        # time spent extracting inside the worker, and end-to-end time including queueing
+        self.extraction_time = LatencyStats()
+        self.total_time = LatencyStats()
+
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.mp_context,
+                initializer=init_worker,
+                initargs=(self._started,),
+            )
+            self._inflight[self._executor] = set()
+        return self._executor
+
+
+    def _read_started(self):
+        while True:
+            try:
+                task_id, pid = self._started.get_nowait()
+            except queue.Empty:
+                return
+            # a task which is already over doesn't need its process anymore
+            if task_id in self._pending_ids:
+                self._pids[task_id] = pid
+
+
+    def _retire(self, executor: ProcessPoolExecutor):
+        # new tasks go to a fresh pool, the tasks already sent to this one still run there
+        if self._executor is executor:
+            self._executor = None
+            self.restarts += 1
+            logger.warning("Replacing the extraction process pool")
+            executor.shutdown(wait=False)
+
+
+    async def _reap(self, executor: ProcessPoolExecutor):
+        # once the other tasks of a retired pool are done, kill the processes of its stuck tasks
+        while any(not future.done() and future not in self._stuck[executor] for future in self._inflight[executor]):
+            await asyncio.sleep(0.1)
+
+        for pid in filter(None, self._stuck.pop(executor).values()):
+            try:
+                os.kill(pid, signal.SIGKILL)
+                logger.warning(f"Killed the stuck extraction process {pid}")
+            except ProcessLookupError:
+                pass
+        self._inflight.pop(executor, None)
+
+
+    def _stuck_task(self, executor: ProcessPoolExecutor, future: Future, task_id: int):
+        self._read_started()
+        pid = self._pids.pop(task_id, None)
+        if pid is None:
+            logger.error("Couldn't find the process of a stuck extraction")
+
+        self._retire(executor)
+        if executor not in self._stuck:
+            self._stuck[executor] = {}
+            asyncio.create_task(self._reap(executor))
+        self._stuck[executor][future] = pid
+
+
+    async def _submit(self, html: bytes) -> Optional[str]:
+        executor = self._get_executor()
+        task_id = next(self._task_ids)
+        self._pending_ids.add(task_id)
+        future = None
+
+        try:
+            future = executor.submit(run_task, task_id, html)
+            self._inflight[executor].add(future)
+            details, duration = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.task_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            STAGE_TIMEOUTS.labels("extraction").inc()
+            # a task still waiting in the queue is simply cancelled, only a running one means a stuck worker
+            if not future.cancel():
+                self._stuck_task(executor, future, task_id)
+            raise
+        except BrokenProcessPool:
+            # a worker crashed, every task of the pool failed with it
+            self._retire(executor)
+            raise
+        finally:
+            self._read_started()
+            self._pending_ids.discard(task_id)
+            self._pids.pop(task_id, None)
+
+            # the tasks of a pool with stuck tasks are dropped by its reaper, a retired pool goes with its last task
+            inflight = self._inflight.get(executor)
+            if future is not None and inflight is not None and executor not in self._stuck:
+                inflight.discard(future)
+                if not inflight and executor is not self._executor:
+                    del self._inflight[executor]
+
+        self.extraction_time.record(duration)
+        return details
+
+
+    async def extract(self, html: bytes) -> Optional[str]:
+        if not html:
+            return None
+
+        self.pending += 1
+        try:
+            with self.total_time.measure(), STAGE_DURATION.labels("extraction").time():
+                try:
+                    return await self._submit(html)
+                except BrokenProcessPool:
+                    # the pool crashed or was restarted under this task, retry once on a fresh pool
+                    return await self._submit(html)
+        finally:
+            self.pending -= 1
+
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "pending": self.pending,
+            "queue_depth": max(0, self.pending - self.max_workers),
+            "timeouts": self.timeouts,
+            "restarts": self.restarts,
+            "retired_pools": len(self._stuck),
+            "extraction_time": self.extraction_time.to_dict(),
+            "total_time": self.total_time.to_dict(),
+        }
+
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
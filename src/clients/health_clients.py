@@ -0,0 +1,143 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Literal, Optional
+
+
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+@dataclass
+class _Circuit:
+    failures: int = 0
+    state: CircuitState = "closed"
+    # when an open circuit lets a probe through
+    retry_at: float = 0.0
+    cooldown: float = 0.0
+    probing: bool = False
+    last_failure: float = 0.0
+
+
+class DomainCircuitBreaker:
+    """
+    Per-host circuit breaker of the page fetches, in this worker.
+    After `failure_threshold` consecutive failures (timeouts, HTTP errors, empty extractions) the circuit
+    of the host opens and its pages are skipped for `cooldown` seconds. Then a single fetch is let through
+    (half open): a success closes the circuit, a failure opens it again for twice as long, up to `max_cooldown`.
+    Only hosts with failures are tracked, at most `max_hosts` of them.
+    Parameters:
+        failure_threshold (int): Consecutive failures which open the circuit, 0 disables the breaker
+        cooldown (float): Seconds a circuit stays open after it first opens
+        max_cooldown (float): Maximum seconds a circuit stays open
+        max_hosts (int): Maximum number of tracked hosts, closed circuits are forgotten first
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 60,
+        max_cooldown: float = 600,
+        max_hosts: int = 10_000,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_hosts = max_hosts
+
+        self._circuits: Dict[str, _Circuit] = {}
+
+        self.opened = 0
+        self.skipped = 0
+
+
+    def allow(self, host: str) -> bool:
+        """
+        Whether a fetch from `host` may start, the caller then reports its outcome with `record_success`,
+        `record_failure` or, if it gave up for a reason unrelated to the host, `release`.
+        """
+        circuit = self._circuits.get(host)
+        if circuit is None or circuit.state == "closed":
+            return True
+
+        # one probe at a time once the cooldown is over
+        if circuit.probing or time.monotonic() < circuit.retry_at:
+            self.skipped += 1
+            return False
+
+        circuit.state = "half_open"
+        circuit.probing = True
+        return True
+
+
+    def record_success(self, host: str):
+        self._circuits.pop(host, None)
+
+
+    def record_failure(self, host: str):
+        if self.failure_threshold <= 0:
+            return
+
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            if len(self._circuits) >= self.max_hosts:
+                self._forget_closed()
+            circuit = self._circuits[host] = _Circuit()
+
+        circuit.failures += 1
+        circuit.last_failure = time.time()
+        circuit.probing = False
+
+        if circuit.state == "half_open":
+            circuit.cooldown = min(circuit.cooldown * 2, self.max_cooldown)
+        elif circuit.state == "closed" and circuit.failures >= self.failure_threshold:
+            circuit.cooldown = self.cooldown
+            self.opened += 1
+        else:
+            return
+
+        circuit.state = "open"
+        circuit.retry_at = time.monotonic() + circuit.cooldown
+
+
+    def _forget_closed(self):
+        # the hosts which failed least recently first, until a tenth of the room is free
+        closed = sorted((circuit.last_failure, host) for host, circuit in self._circuits.items() if circuit.state == "closed")
+        for _, host in closed[:max(1, self.max_hosts // 10)]:
+            del self._circuits[host]
+
+
+    def release(self, host: str):
+        # the fetch was abandoned (e.g. the request ran out of time), let another probe through
+        circuit = self._circuits.get(host)
+        if circuit is not None and circuit.probing:
+            circuit.probing = False
+            circuit.state = "open"
+
+
+    def state(self, host: str) -> CircuitState:
+        circuit = self._circuits.get(host)
+        return circuit.state if circuit else "closed"
+
+
+    def circuits(self, state: Optional[CircuitState] = None) -> Dict[str, dict]:
+        now = time.monotonic()
+        return {
+            host: {
+                "state": circuit.state,
+                "failures": circuit.failures,
+                "last_failure": circuit.last_failure,
+                "retry_in": round(max(0.0, circuit.retry_at - now), 1) if circuit.state != "closed" else 0.0,
+            }
+            for host, circuit in self._circuits.items()
+            if state is None or circuit.state == state
+        }
+
+
+    def stats(self) -> dict:
+        states = [circuit.state for circuit in self._circuits.values()]
+        return {
+            "tracked_hosts": len(states),
+            "open": states.count("open"),
+            "half_open": states.count("half_open"),
+            "opened": self.opened,
+            "skipped": self.skipped,
+        }
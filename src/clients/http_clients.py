@@ -0,0 +1,369 @@
+import asyncio
+import contextlib
+import ipaddress
+import socket
+import time
+import urllib.request
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+
+from logs import logger
+from stats import LatencyStats
+from metrics import PAGE_BYTES_DOWNLOADED, STAGE_DURATION
+
+
+class DNSCacheNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    An httpcore network backend that caches DNS resolutions for `ttl` seconds.
+    Connections are opened against the resolved IP while TLS still uses the original host name
+    for SNI and certificate checks, since httpcore passes the origin host to `start_tls`.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._backend = httpcore.AnyIOBackend()
+        self._cache: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def _resolve(self, host: str, port: int) -> List[str]:
+        # IP literals don't need a lookup
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+
+        key = (host, port)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+
+        # keep the resolver's order, without duplicates
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._cache[key] = (time.monotonic() + self.ttl, addresses)
+
+        return addresses
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addresses = await self._resolve(host, port)
+
+        error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(
+                    address, port, timeout=timeout, local_address=local_address, socket_options=socket_options
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+
+        # none of the cached addresses work anymore, resolve again next time
+        self._cache.pop((host, port), None)
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float):
+        await self._backend.sleep(seconds)
+
+
+# httpcore errors as the httpx errors callers expect, the most specific first
+HTTPCORE_ERRORS = [
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+]
+
+
+@contextlib.contextmanager
+def httpx_errors():
+    try:
+        yield
+    except Exception as e:
+        for httpcore_error, httpx_error in HTTPCORE_ERRORS:
+            if isinstance(e, httpcore_error):
+                raise httpx_error(str(e)) from e
+        raise
+
+
+class PoolResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with httpx_errors():
+            async for chunk in self._stream:
+                yield chunk
+
+    async def aclose(self):
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """
+    An httpx transport over an httpcore connection pool built by the caller, e.g. with its own network backend.
+    """
+
+    def __init__(self, pool: httpcore.AsyncConnectionPool):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with httpx_errors():
+            core_response = await self.pool.handle_async_request(core_request)
+
+        return httpx.Response(
+            status_code=core_response.status,
+            headers=core_response.headers,
+            stream=PoolResponseStream(core_response.stream),
+            extensions=core_response.extensions,
+        )
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+
+def proxy_mounts() -> Dict[str, Optional[httpx.AsyncBaseTransport]]:
+    # httpx only honours HTTP(S)_PROXY / ALL_PROXY / NO_PROXY without a custom transport, they are mounted here instead
+    proxies = urllib.request.getproxies()
+    mounts: Dict[str, Optional[httpx.AsyncBaseTransport]] = {}
+    for scheme in ("http", "https"):
+        proxy = proxies.get(scheme) or proxies.get("all")
+        if proxy:
+            mounts[f"{scheme}://"] = httpx.AsyncHTTPTransport(proxy=proxy, http2=True, retries=1)
+
+    if not mounts:
+        return mounts
+
+    # the hosts of NO_PROXY go through the DNS-caching transport (None), as httpx would send them directly
+    for host in filter(None, (host.strip() for host in proxies.get("no", "").split(","))):
+        if host == "*":
+            return {}
+        if "://" in host:
+            mounts[host] = None
+        elif host.lower() == "localhost" or host.replace(".", "").isdigit():
+            mounts[f"all://{host}"] = None
+        else:
+            mounts[f"all://*{host}"] = None
+
+    return mounts
+
+
+@dataclass
+class FetchedPage:
+    content: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # the server answered 304 to a conditional request, `content` is empty
+    not_modified: bool = False
+
+
+class HTTPFetcher:
+    """
+    A process-wide async HTTP client shared by the search providers and the page fetcher.
+    It keeps a single keep-alive (and HTTP/2 when the server supports it) connection pool,
+    caches DNS lookups and limits the number of concurrent requests per host, so a handful
+    of slow sites can't take every connection of the pool. The proxies of the environment
+    (HTTP_PROXY, HTTPS_PROXY, ALL_PROXY, NO_PROXY) are used as httpx would, without the DNS cache.
+    Parameters:
+        max_connections (int): Maximum number of open connections
+        max_keepalive_connections (int): Maximum number of idle connections kept alive
+        keepalive_expiry (float): Seconds an idle connection is kept alive
+        max_connections_per_host (int): Maximum number of concurrent requests to the same host
+        dns_cache_ttl (float): Seconds a DNS resolution is cached
+        timeout (float): Connect/read/write/pool timeout in seconds
+        max_page_bytes (int): Pages larger than this are dropped while downloading
+        user_agent (str): User-Agent header sent with every request
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30,
+        max_connections_per_host: int = 6,
+        dns_cache_ttl: float = 300,
+        timeout: float = 5,
+        max_page_bytes: int = 10_000_000,
+        user_agent: str = "Mozilla/5.0 (compatible; TitanSight/0.1)",
+    ):
+        self.network_backend = DNSCacheNetworkBackend(ttl=dns_cache_ttl)
+
+        transport = PoolTransport(httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+            http1=True,
+            http2=True,
+            retries=1,
+            network_backend=self.network_backend,
+        ))
+
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            mounts=proxy_mounts(),
+            timeout=httpx.Timeout(timeout),
+            follow_redirects=True,
+            headers={"User-Agent": user_agent},
+        )
+
+        self.max_connections_per_host = max_connections_per_host
+        self.max_page_bytes = max_page_bytes
+
+        # host -> [semaphore, number of requests using it]
+        self._host_limits: Dict[str, list] = {}
+
+        self.latency = LatencyStats()
+        self.bytes_downloaded = 0
+        self.conditional_requests = 0
+        self.not_modified = 0
+
+
+    async def _acquire_host(self, host: str) -> asyncio.Semaphore:
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = [asyncio.Semaphore(self.max_connections_per_host), 0]
+        limit[1] += 1
+
+        try:
+            await limit[0].acquire()
+        except BaseException:
+            self._release_host(host, acquired=False)
+            raise
+
+        return limit[0]
+
+    def _release_host(self, host: str, acquired: bool = True):
+        limit = self._host_limits[host]
+        if acquired:
+            limit[0].release()
+
+        # drop the semaphore once nobody is using it, so the dict doesn't grow with every host ever seen
+        limit[1] -= 1
+        if limit[1] == 0:
+            del self._host_limits[host]
+
+
+    async def get(self, url: str, limit_per_host: bool = True, **kwargs) -> httpx.Response:
+        """
+        GET `url`. The calls to the APIs of the search providers pass `limit_per_host=False`: the limit per host
+        keeps slow sites from taking the pool, it would only queue the searches behind each other.
+        """
+        host = urlsplit(url).hostname or ""
+
+        if limit_per_host:
+            await self._acquire_host(host)
+        try:
+            with self.latency.measure():
+                response = await self.client.get(url, **kwargs)
+        finally:
+            if limit_per_host:
+                self._release_host(host)
+
+        self.bytes_downloaded += len(response.content)
+        PAGE_BYTES_DOWNLOADED.inc(len(response.content))
+        return response
+
+
+    async def fetch_page(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[FetchedPage]:
+        """
+        Download a page and return its raw bytes with its validators, or None if the page is unavailable or too large.
+        With `etag` or `last_modified`, the request is conditional and an unchanged page comes back as `not_modified`.
+        """
+        host = urlsplit(url).hostname or ""
+
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        if headers:
+            self.conditional_requests += 1
+
+        await self._acquire_host(host)
+        try:
+            with self.latency.measure(), STAGE_DURATION.labels("download").time():
+                async with self.client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and headers:
+                        self.not_modified += 1
+                        return FetchedPage(
+                            content=b"",
+                            etag=response.headers.get("etag", etag),
+                            last_modified=response.headers.get("last-modified", last_modified),
+                            not_modified=True,
+                        )
+
+                    if response.status_code != 200:
+                        logger.warning(f"Fetching {url} returned status {response.status_code}")
+                        return None
+
+                    chunks = []
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_page_bytes:
+                            logger.warning(f"Page {url} is larger than {self.max_page_bytes} bytes, skipping")
+                            return None
+                        chunks.append(chunk)
+
+                    etag = response.headers.get("etag")
+                    last_modified = response.headers.get("last-modified")
+        finally:
+            self._release_host(host)
+
+        self.bytes_downloaded += size
+        PAGE_BYTES_DOWNLOADED.inc(size)
+        return FetchedPage(content=b"".join(chunks), etag=etag, last_modified=last_modified)
+
+
+    def stats(self) -> dict:
+        return {
+            "active_hosts": len(self._host_limits),
+            "bytes_downloaded": self.bytes_downloaded,
+            "conditional_requests": self.conditional_requests,
+            "not_modified": self.not_modified,
+            "dns_cache": {
+                "hits": self.network_backend.hits,
+                "misses": self.network_backend.misses,
+                "size": len(self.network_backend._cache),
+            },
+            "latency": self.latency.to_dict(),
+        }
+
+
+    async def close(self):
+        await self.client.aclose()
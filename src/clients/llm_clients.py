@@ -1,12 +1,17 @@
+import asyncio
 from openai import AsyncOpenAI
 from transformers import AutoTokenizer
 import tiktoken
 
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from schemas import SearchResult
 
 from prompt_template import CONCISE_ANSWER_PROMPT
 from constants import MAX_PAGE_DETAILS_LENGTH, MAX_ANSWER_TOKEN_PER_PAGE
+from utils import NO_DEADLINE, Deadline
+from metrics import LLM_TOKENS, STAGE_DURATION
+
+from .scheduling_clients import AdmissionScheduler, Priority
 
 class LLMClient:
     def __init__(
@@ -16,6 +21,8 @@ class LLMClient:
         model_name: str,
         base_model_name: str,
         hf_token: Optional[str]=None,
+        min_completion_time: float=0.5,
+        scheduler: Optional[AdmissionScheduler]=None,
     ):
         self.client = AsyncOpenAI(
             base_url=base_url,
@@ -24,6 +31,12 @@ class LLMClient:
 
         self.model_name = model_name
 
+        # don't start a completion with less time than this left before the deadline, it wouldn't finish
+        self.min_completion_time = min_completion_time
+
+        # completions wait for a slot of the scheduler, if any
+        self.scheduler = scheduler
+
         try:
             # Use the tokenizer from tiktoken if available
             self.tokenizer = tiktoken.encoding_for_model(base_model_name)
@@ -32,49 +45,129 @@ class LLMClient:
             self.tokenizer = AutoTokenizer.from_pretrained(base_model_name, token=hf_token)
 
 
-    async def count_tokens(self, text: str) -> int:
-        tokenized: List[int] = self.tokenizer.encode(text)
-        return len(tokenized)
+    def num_tokens(self, text: str) -> int:
+        # page text may contain special token strings, count them as plain text
+        if isinstance(self.tokenizer, tiktoken.Encoding):
+            return len(self.tokenizer.encode(text, disallowed_special=()))
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
 
+    def token_offsets(self, text: str) -> Optional[List[int]]:
+        # the position in the text where each of its tokens starts, None if the tokenizer can't tell (slow tokenizers)
+        if isinstance(self.tokenizer, tiktoken.Encoding):
+            _, offsets = self.tokenizer.decode_with_offsets(self.tokenizer.encode(text, disallowed_special=()))
+            return offsets
+        if self.tokenizer.is_fast:
+            encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [start for start, _ in encoding["offset_mapping"]]
+        return None
 
-    async def complettion(self, prompt: str) -> str:
 
-        completion = await self.client.chat.completions.create(
-            model=self.model_name,
-            messages=[
-                {"role": "user", "content": prompt},
-            ],
-            top_p=0.5,
-            max_tokens=MAX_ANSWER_TOKEN_PER_PAGE,
-        )
+    def _cut_at_token(self, text: str, max_tokens: int) -> Tuple[Optional[str], int]:
+        # return the part of the text before its (max_tokens + 1)-th token, or None if the text fits, and the token count
+        if isinstance(self.tokenizer, tiktoken.Encoding):
+            tokens: List[int] = self.tokenizer.encode(text, disallowed_special=())
+            if len(tokens) <= max_tokens:
+                return None, len(tokens)
 
-        return completion.choices[0].message.content.strip()
-    
+            # a prefix of the tokens decodes to a prefix of the text, except maybe a partial character at the cut
+            return self.tokenizer.decode(tokens[:max_tokens]), len(tokens)
 
-    async def summarize_page(self, query: str, search_result: SearchResult) -> str:
+        if self.tokenizer.is_fast:
+            encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            if len(encoding["input_ids"]) <= max_tokens:
+                return None, len(encoding["input_ids"])
 
-        title = search_result.title
-        url = search_result.url
-        summary = search_result.content
-        details = search_result.details
+            return text[:encoding["offset_mapping"][max_tokens][0]], len(encoding["input_ids"])
+
+        # slow tokenizers don't give offsets: start from the length of the decoded prefix, which can be longer than
+        # the text it comes from (normalization, added spaces), and shorten it until it fits
+        tokens = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(tokens) <= max_tokens:
+            return None, len(tokens)
+
+        end = min(len(text), len(self.tokenizer.decode(tokens[:max_tokens])))
+        while end > 0:
+            num_prefix_tokens = len(self.tokenizer.encode(text[:end], add_special_tokens=False))
+            if num_prefix_tokens <= max_tokens:
+                break
+            end = min(end - 1, end * max_tokens // num_prefix_tokens)
+
+        return text[:end], len(tokens)
+
+
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """
+        Cut `text` to at most `max_tokens` tokens, tokenizing it once instead of line by line.
+        The cut snaps back to the last full line; if the first line alone is too long it's cut at the token boundary.
+        """
+        # only tokenize a prefix big enough to hold the budget, pages are usually much longer than it
+        window = max_tokens * 5
+        while True:
+            truncated, num_tokens = self._cut_at_token(text[:window], max_tokens)
+            if truncated is not None:
+                break
+            if window >= len(text):
+                return text
+
+            # the prefix was too short, grow it from the observed characters per token
+            window = max(window * 2, int(window * 1.2 * max_tokens / max(num_tokens, 1)))
+
+        last_line_end = truncated.rfind("\n")
+        if last_line_end == -1:
+            return truncated.rstrip("\ufffd")
+
+        return truncated[:last_line_end + 1]
 
-        # truncate MAX_PAGE_DETAILS_LENGTH tokens from the details
-        if details:
 
-            truncated = ""
-            current_num_tokens = 0
+    async def complettion(self, prompt: str, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> str:
 
-            for line in details.split("\n"):
+        if self.scheduler is None:
+            return await self._complettion(prompt, deadline)
 
-                line_num_tokens = await self.count_tokens(line)
+        async with self.scheduler.slot(priority, deadline):
+            return await self._complettion(prompt, deadline)
 
-                if current_num_tokens + line_num_tokens > MAX_PAGE_DETAILS_LENGTH:
-                    break
 
-                truncated += line + "\n"
-                current_num_tokens += line_num_tokens
+    async def _complettion(self, prompt: str, deadline: Deadline) -> str:
 
-            details = truncated
+        remaining = deadline.remaining()
+        if remaining is not None and remaining < self.min_completion_time:
+            raise asyncio.TimeoutError(f"Only {remaining:.2f} seconds left for the completion")
+
+        with STAGE_DURATION.labels("llm").time():
+            completion = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "user", "content": prompt},
+                ],
+                top_p=0.5,
+                max_tokens=MAX_ANSWER_TOKEN_PER_PAGE,
+                **({"timeout": remaining} if remaining is not None else {}),
+            )
+
+        if completion.usage:
+            LLM_TOKENS.labels("prompt").inc(completion.usage.prompt_tokens)
+            LLM_TOKENS.labels("completion").inc(completion.usage.completion_tokens)
+
+        return completion.choices[0].message.content.strip()
+    
+
+    async def truncate_details(self, details: Optional[str]) -> Optional[str]:
+        # truncate MAX_PAGE_DETAILS_LENGTH tokens from the details, off the event loop
+        if not details:
+            return details
+        return await asyncio.to_thread(self.truncate_to_tokens, details, MAX_PAGE_DETAILS_LENGTH)
+
+
+    async def summarize_page(self, query: str, search_result: SearchResult, truncated_details: Optional[str] = None, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> str:
+
+        title = search_result.title
+        url = search_result.url
+        summary = search_result.content
+
+        details = truncated_details
+        if details is None:
+            details = await self.truncate_details(search_result.details)
         
         prompt = CONCISE_ANSWER_PROMPT.format(
             title=title,
@@ -84,10 +177,4 @@ class LLMClient:
             query=query,
         )
 
-        return await self.complettion(prompt)
-
-
-
-
-
-    
\ No newline at end of file
+        return await self.complettion(prompt, deadline=deadline, priority=priority)
@@ -0,0 +1,198 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import redis.asyncio as redis
+
+from logs import logger
+from metrics import PROVIDER_THROTTLES
+from utils import NO_DEADLINE, Deadline
+
+
+# Token bucket and daily quota of a provider, checked and updated atomically with the Redis clock.
+# KEYS: bucket hash, daily counter. ARGV: tokens per second, bucket capacity, daily quota (0: none), counter ttl.
+# Returns {allowed, milliseconds to wait (-1: quota exhausted), tokens left, quota left}.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local quota = tonumber(ARGV[3])
+
+local used = 0
+if quota > 0 then
+    used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if used >= quota then
+        return {0, -1, 0, 0}
+    end
+end
+
+local tokens = capacity
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    if bucket[1] then
+        tokens = math.min(capacity, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    if tokens < 1 then
+        return {0, math.ceil((1 - tokens) / rate * 1000), 0, quota - used}
+    end
+    tokens = tokens - 1
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+end
+
+if quota > 0 then
+    used = redis.call('INCR', KEYS[2])
+    if used == 1 then
+        redis.call('EXPIRE', KEYS[2], ARGV[4])
+    end
+end
+return {1, 0, math.floor(tokens), quota - used}
+"""
+
+
+class RateLimitExceededError(Exception):
+    def __init__(self, provider: str, retry_after: Optional[float] = None):
+        super().__init__(f"Rate limit of the {provider} search provider exceeded")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderRateLimiter:
+    """
+    Rate limits the calls to the search providers across every worker, with a token bucket per provider
+    in Redis (`rate` calls per second, bursts of `rate * burst_seconds`) and an optional daily quota
+    (e.g. Google Custom Search), counted per day of `quota_timezone` as the provider does.
+    A call over the limit waits for a token at most `max_wait` seconds (or what's left of its deadline),
+    a call over the quota isn't let through until the next day. A slow or failing Redis lets the call
+    through, the provider is a better judge of its limits than no search at all.
+    Parameters:
+        client (redis.asyncio.Redis): Async Redis client, shared with the query cache
+        rates (Dict[str, float]): Calls per second of each provider, 0 or missing: not limited
+        daily_quotas (Dict[str, int]): Calls per day of each provider, 0 or missing: no quota
+        burst_seconds (float): Seconds of calls a provider can make at once after being idle
+        max_wait (float): Maximum seconds a call waits for a token
+        quota_timezone (str): Time zone of the day of the quotas
+        timeout (float): Maximum seconds of a Redis round-trip
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        rates: Optional[Dict[str, float]] = None,
+        daily_quotas: Optional[Dict[str, int]] = None,
+        burst_seconds: float = 5,
+        max_wait: float = 2,
+        quota_timezone: str = "America/Los_Angeles",
+        timeout: float = 0.25,
+    ):
+        self.client = client
+        self.rates = rates or {}
+        self.daily_quotas = daily_quotas or {}
+        self.burst_seconds = burst_seconds
+        self.max_wait = max_wait
+        self.quota_timezone = ZoneInfo(quota_timezone)
+        self.timeout = timeout
+
+        self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+
+        # provider -> tokens and quota left at its last call, for the stats
+        self._tokens: Dict[str, int] = {}
+        self._quota_left: Dict[str, int] = {}
+
+        self.allowed: Dict[str, int] = {}
+        self.waited: Dict[str, int] = {}
+        self.rejected: Dict[str, int] = {}
+        self.errors = 0
+
+
+    def limited(self, provider: str) -> bool:
+        return self.rates.get(provider, 0) > 0 or self.daily_quotas.get(provider, 0) > 0
+
+
+    def _quota_day(self):
+        # the day of the quota, and the seconds until it ends (plus a little, for clock skew)
+        now = datetime.now(self.quota_timezone)
+        tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return now.date().isoformat(), int((tomorrow - now).total_seconds()) + 60
+
+
+    async def _take(self, provider: str) -> Tuple[Optional[float], int]:
+        # seconds to wait for a token (0: taken) or None if the daily quota is exhausted, and the seconds left in the day
+        rate = self.rates.get(provider, 0)
+        quota = self.daily_quotas.get(provider, 0)
+        day, ttl = self._quota_day()
+
+        allowed, wait_ms, tokens, quota_left = await asyncio.wait_for(
+            self._script(
+                keys=[f"ratelimit:{provider}", f"ratelimit:{provider}:quota:{day}"],
+                args=[rate, max(1, rate * self.burst_seconds), quota, ttl],
+            ),
+            timeout=self.timeout,
+        )
+
+        if rate > 0:
+            self._tokens[provider] = tokens
+        if quota > 0:
+            self._quota_left[provider] = quota_left
+
+        if allowed:
+            return 0, ttl
+        return (None if wait_ms < 0 else wait_ms / 1000), ttl
+
+
+    async def acquire(self, provider: str, deadline: Deadline = NO_DEADLINE):
+        """
+        Take a call of `provider`, waiting for it if needed. Raises `RateLimitExceededError` if it's over
+        its quota, or if waiting for a token would take longer than `max_wait` or the deadline allows.
+        """
+        if not self.limited(provider):
+            return
+
+        start_time = time.monotonic()
+        budget = deadline.timeout(self.max_wait)
+        waited = False
+        while True:
+            try:
+                wait, day_left = await self._take(provider)
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Error checking the rate limit of {provider}, letting the call through: {e!r}")
+                return
+
+            if wait == 0:
+                self.allowed[provider] = self.allowed.get(provider, 0) + 1
+                return
+
+            if wait is None or time.monotonic() - start_time + wait > budget:
+                self.rejected[provider] = self.rejected.get(provider, 0) + 1
+                PROVIDER_THROTTLES.labels(provider, "quota" if wait is None else "rejected").inc()
+                raise RateLimitExceededError(provider, retry_after=day_left if wait is None else wait)
+
+            if not waited:
+                waited = True
+                self.waited[provider] = self.waited.get(provider, 0) + 1
+                PROVIDER_THROTTLES.labels(provider, "waited").inc()
+            await asyncio.sleep(wait)
+
+
+    def stats(self) -> dict:
+        providers = {
+            provider: {
+                "rate": self.rates.get(provider, 0),
+                "daily_quota": self.daily_quotas.get(provider, 0),
+                "quota_left": self._quota_left.get(provider),
+                "tokens_left": self._tokens.get(provider),
+                "allowed": self.allowed.get(provider, 0),
+                "waited": self.waited.get(provider, 0),
+                "rejected": self.rejected.get(provider, 0),
+            }
+            for provider in sorted(set(self.rates) | set(self.daily_quotas))
+            if self.limited(provider)
+        }
+        return {
+            "providers": providers,
+            "errors": self.errors,
+        }
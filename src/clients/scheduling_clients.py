@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Literal, Tuple
+
+from stats import LatencyStats
+from utils import NO_DEADLINE, Deadline
+
+
+Priority = Literal["interactive", "batch", "prefetch"]
+
+# lower runs first
+PRIORITIES: Dict[str, int] = {"interactive": 0, "batch": 1, "prefetch": 2}
+
+
+class SchedulerOverloadedError(Exception):
+    pass
+
+
+class AdmissionScheduler:
+    """
+    Admission control in front of an expensive backend, e.g. the LLM.
+    At most `max_concurrency` calls run at once, the others wait in a priority queue: interactive
+    requests are admitted before batch ones, and batch ones before prefetching. A call is shed
+    (`asyncio.TimeoutError`) once it has waited longer than its budget: `max_queue_wait`, or less
+    if its deadline leaves less than `min_run_time` to run after being admitted. When the queue
+    is full, a new call takes the place of the newest waiter of a lower priority, or is shed itself
+    (`SchedulerOverloadedError`).
+    The limits are per process: with several API workers, the backend sees up to `max_concurrency`
+    calls from each of them.
+    Parameters:
+        max_concurrency (int): Maximum number of calls running at once
+        max_queue_size (int): Maximum number of waiting calls
+        max_queue_wait (float): Maximum seconds a call waits to be admitted
+        min_run_time (float): Seconds a call needs to run once admitted, subtracted from its deadline
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_size: int = 1000,
+        max_queue_wait: float = 10,
+        min_run_time: float = 0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.min_run_time = min_run_time
+
+        # (priority, arrival order, future), futures of calls which gave up stay in the heap until popped
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._active = 0
+        self._waiting: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+
+        self.admitted: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.shed: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.wait_time: Dict[str, LatencyStats] = {priority: LatencyStats() for priority in PRIORITIES}
+
+
+    def _queue_size(self) -> int:
+        return sum(self._waiting.values())
+
+
+    def _wake(self):
+        # admit the waiters in priority order while there are free slots
+        while self._queue and self._active < self.max_concurrency:
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+
+    def _make_room(self, priority: str) -> bool:
+        # shed the newest waiter of the lowest priority, if it's lower than `priority`
+        waiters = [entry for entry in self._queue if not entry[2].done() and entry[0] > PRIORITIES[priority]]
+        if not waiters:
+            return False
+
+        _, _, future = max(waiters, key=lambda entry: (entry[0], entry[1]))
+        future.set_exception(SchedulerOverloadedError("Shed for a higher priority call"))
+        return True
+
+
+    async def acquire(self, priority: Priority = "interactive", deadline: Deadline = NO_DEADLINE):
+        if self._active < self.max_concurrency and not self._queue_size():
+            self._active += 1
+            self.admitted[priority] += 1
+            self.wait_time[priority].record(0)
+            return
+
+        if self._queue_size() >= self.max_queue_size and not self._make_room(priority):
+            self.shed[priority] += 1
+            raise SchedulerOverloadedError(f"{self._queue_size()} calls are already waiting")
+
+        # wait at most until there is just enough time left to run
+        budget = self.max_queue_wait
+        remaining = deadline.remaining()
+        if remaining is not None:
+            budget = min(budget, remaining - self.min_run_time)
+        if budget <= 0:
+            self.shed[priority] += 1
+            raise asyncio.TimeoutError("No time left to wait for a slot")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (PRIORITIES[priority], next(self._order), future))
+        self._waiting[priority] += 1
+
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, timeout=budget)
+        except BaseException as e:
+            # admitted right as the wait was given up, hand the slot over
+            if future.done() and not future.cancelled() and future.exception() is None:
+                self.release()
+            if isinstance(e, (asyncio.TimeoutError, SchedulerOverloadedError)):
+                self.shed[priority] += 1
+            self.wait_time[priority].record(time.perf_counter() - start_time, error=True)
+            raise
+        finally:
+            self._waiting[priority] -= 1
+
+        self.admitted[priority] += 1
+        self.wait_time[priority].record(time.perf_counter() - start_time)
+
+
+    def release(self):
+        self._active -= 1
+        self._wake()
+
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = "interactive", deadline: Deadline = NO_DEADLINE):
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queue_depth": self._queue_size(),
+            "waiting": dict(self._waiting),
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "wait_time": {priority: latency.to_dict() for priority, latency in self.wait_time.items()},
+        }
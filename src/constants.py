@@ -1,19 +1,87 @@
 import os
 from dotenv import load_dotenv
-from copy import deepcopy
-from trafilatura.settings import DEFAULT_CONFIG
 
 load_dotenv()
 
-# Trafilatura config
-tralifatura_config = deepcopy(DEFAULT_CONFIG)
-tralifatura_config['DEFAULT']['DOWNLOAD_TIMEOUT'] = '2'
+# uvicorn workers, each has its own process pools and schedulers
+NUM_WORKERS=int(os.getenv("NUM_WORKERS", 1))
+
+# HTTP fetcher, shared by the page fetcher and the search providers
+HTTP_MAX_CONNECTIONS=int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+HTTP_KEEPALIVE_EXPIRY=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_MAX_CONNECTIONS_PER_HOST=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 6))
+HTTP_DNS_CACHE_TTL=float(os.getenv("HTTP_DNS_CACHE_TTL", 300))
+HTTP_TIMEOUT=float(os.getenv("HTTP_TIMEOUT", 5))
+HTTP_MAX_PAGE_BYTES=int(os.getenv("HTTP_MAX_PAGE_BYTES", 10_000_000))
+
+# Failing pages: per-host circuit breaker, and URLs skipped by every worker (through Redis) for a while
+CIRCUIT_FAILURE_THRESHOLD=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_COOLDOWN=float(os.getenv("CIRCUIT_COOLDOWN", 60))
+CIRCUIT_MAX_COOLDOWN=float(os.getenv("CIRCUIT_MAX_COOLDOWN", 600))
+NEGATIVE_CACHE_EXPIRE_TIME=int(os.getenv("NEGATIVE_CACHE_EXPIRE_TIME", 300))
+
+# Extraction process pool, one per API worker
+EXTRACTION_MAX_WORKERS=int(os.getenv("EXTRACTION_MAX_WORKERS") or 0) or max(1, (os.cpu_count() or 1) // NUM_WORKERS)
+EXTRACTION_TIMEOUT=float(os.getenv("EXTRACTION_TIMEOUT", 5))
+EXTRACTION_START_METHOD=os.getenv("EXTRACTION_START_METHOD", "forkserver")
+
+# Batch search
+BATCH_MAX_QUERIES=int(os.getenv("BATCH_MAX_QUERIES", 20))
+BATCH_MAX_CONCURRENCY=int(os.getenv("BATCH_MAX_CONCURRENCY", 16))
+
+# Over-provisioned searches
+OVERFETCH_MAX_FACTOR=float(os.getenv("OVERFETCH_MAX_FACTOR", 3))
 
 # Redis
 REDIS_URL=os.getenv("REDIS_URL")
 EXPIRE_TIME=int(os.getenv("EXPIRE_TIME", 3600))
 SIM_THRESHOLD=float(os.getenv("SIM_THRESHOLD", 0.9))
 EMBEDDING_DIM=int(os.getenv("EMBEDDING_DIM", 512))
+REDIS_MAX_CONNECTIONS=int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+REDIS_POOL_TIMEOUT=float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+REDIS_SOCKET_TIMEOUT=float(os.getenv("REDIS_SOCKET_TIMEOUT", 5))
+REDIS_HEALTH_CHECK_INTERVAL=int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_INDEX_ALGORITHM=os.getenv("REDIS_INDEX_ALGORITHM", "HNSW")
+HNSW_M=int(os.getenv("HNSW_M", 16))
+HNSW_EF_CONSTRUCTION=int(os.getenv("HNSW_EF_CONSTRUCTION", 200))
+HNSW_EF_RUNTIME=int(os.getenv("HNSW_EF_RUNTIME", 10))
+
+# Query cache warming: entries are served CACHE_STALE_TIME seconds past EXPIRE_TIME while they're refreshed,
+# and the ones hit at least CACHE_REFRESH_MIN_HITS times (since their last refresh) are refreshed CACHE_REFRESH_AHEAD seconds before that
+CACHE_STALE_TIME=int(os.getenv("CACHE_STALE_TIME", 300))
+CACHE_WARMER_ENABLED=os.getenv("CACHE_WARMER_ENABLED", "true").lower() == "true"
+CACHE_WARMER_INTERVAL=float(os.getenv("CACHE_WARMER_INTERVAL", 30))
+CACHE_WARMER_BATCH_SIZE=int(os.getenv("CACHE_WARMER_BATCH_SIZE", 100))
+CACHE_REFRESH_AHEAD=float(os.getenv("CACHE_REFRESH_AHEAD", 120))
+CACHE_REFRESH_MIN_HITS=int(os.getenv("CACHE_REFRESH_MIN_HITS", 3))
+CACHE_REFRESH_CONCURRENCY=int(os.getenv("CACHE_REFRESH_CONCURRENCY", 2))
+CACHE_REFRESH_TIMEOUT=float(os.getenv("CACHE_REFRESH_TIMEOUT", 60))
+
+# Link lists of the search providers, per provider expiry (0: not cached)
+SERP_CACHE_EXPIRE_TIME=int(os.getenv("SERP_CACHE_EXPIRE_TIME", 3600))
+SERP_CACHE_EXPIRE_TIMES={
+    "google": int(os.getenv("SERP_CACHE_EXPIRE_TIME_GOOGLE", 86400)),
+    "duckduckgo": int(os.getenv("SERP_CACHE_EXPIRE_TIME_DUCKDUCKGO", SERP_CACHE_EXPIRE_TIME)),
+    "searxng": int(os.getenv("SERP_CACHE_EXPIRE_TIME_SEARXNG", SERP_CACHE_EXPIRE_TIME)),
+}
+SERP_CACHE_NUM_RESULTS=int(os.getenv("SERP_CACHE_NUM_RESULTS", 10))
+
+# In-process exact-match cache, in front of the Redis cache
+LOCAL_CACHE_MAX_ENTRIES=int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", 1024))
+LOCAL_CACHE_MAX_BYTES=int(os.getenv("LOCAL_CACHE_MAX_BYTES", 64_000_000))
+LOCAL_CACHE_TTL=min(float(os.getenv("LOCAL_CACHE_TTL", 300)), EXPIRE_TIME)
+
+# Request coalescing
+COALESCE_LEASE_TTL=float(os.getenv("COALESCE_LEASE_TTL", 60))
+COALESCE_WAIT_TIMEOUT=float(os.getenv("COALESCE_WAIT_TIMEOUT", 30))
+COALESCE_POLL_INTERVAL=float(os.getenv("COALESCE_POLL_INTERVAL", 0.25))
+
+# Per-page LLM answer cache
+SUMMARY_CACHE_ENABLED=os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+SUMMARY_CACHE_EXPIRE_TIME=int(os.getenv("SUMMARY_CACHE_EXPIRE_TIME", 86400))
+SUMMARY_CACHE_MAX_ENTRIES=int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", 100_000))
+SUMMARY_CACHE_SIM_THRESHOLD=float(os.getenv("SUMMARY_CACHE_SIM_THRESHOLD", 0))
 
 
 # Mongo
@@ -21,11 +89,27 @@ MONGO_URL=os.getenv("MONGO_URL")
 MONGO_DB_NAME=os.getenv("MONGO_DB_NAME")
 MONGO_COLLECTION_NAME=os.getenv("MONGO_COLLECTION_NAME")
 
+# Long-term page store
+LONG_TERM_CACHE_TTL=int(os.getenv("LONG_TERM_CACHE_TTL", 7 * 86400))
+LONG_TERM_CACHE_MAX_PAGES=int(os.getenv("LONG_TERM_CACHE_MAX_PAGES", 1_000_000))
+LONG_TERM_CACHE_COMPRESSION_LEVEL=int(os.getenv("LONG_TERM_CACHE_COMPRESSION_LEVEL", 3))
+LONG_TERM_CACHE_DICT_SIZE=int(os.getenv("LONG_TERM_CACHE_DICT_SIZE", 64 * 1024))
+LONG_TERM_CACHE_DICT_SAMPLES=int(os.getenv("LONG_TERM_CACHE_DICT_SAMPLES", 500))
+LONG_TERM_CACHE_SWEEP_INTERVAL=float(os.getenv("LONG_TERM_CACHE_SWEEP_INTERVAL", 3600))
+
+# Revalidation of stored pages: served as is while fresh, served and revalidated in the background while stale,
+# revalidated before being served after that
+PAGE_FRESH_TIME=int(os.getenv("PAGE_FRESH_TIME", 3600))
+PAGE_STALE_WHILE_REVALIDATE=int(os.getenv("PAGE_STALE_WHILE_REVALIDATE", 86400))
+
 
 # Embedding
 EMBEDDING_URL=os.getenv("EMBEDDING_URL")
 EMBEDDING_API_KEY=os.getenv("EMBEDDING_API_KEY")
 EMBEDDING_MODEL_NAME=os.getenv("EMBEDDING_MODEL_NAME")
+EMBEDDING_MAX_BATCH_SIZE=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", 32))
+EMBEDDING_MAX_WAIT_MS=float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+EMBEDDING_CACHE_SIZE=int(os.getenv("EMBEDDING_CACHE_SIZE", 1024))
 
 
 # LLM
@@ -33,10 +117,34 @@ LLM_URL=os.getenv("LLM_URL")
 LLM_API_KEY=os.getenv("LLM_API_KEY")
 LLM_MODEL_NAME=os.getenv("LLM_MODEL_NAME")
 LLM_BASE_MODEL_NAME=os.getenv("LLM_BASE_MODEL_NAME")
+LLM_MIN_COMPLETION_TIME=float(os.getenv("LLM_MIN_COMPLETION_TIME", 0.5))
+# per worker, the defaults share 32 completions and a queue of 512 between the workers
+LLM_MAX_CONCURRENCY=int(os.getenv("LLM_MAX_CONCURRENCY") or 0) or max(1, 32 // NUM_WORKERS)
+LLM_MAX_QUEUE_SIZE=int(os.getenv("LLM_MAX_QUEUE_SIZE") or 0) or max(1, 512 // NUM_WORKERS)
+LLM_MAX_QUEUE_WAIT=float(os.getenv("LLM_MAX_QUEUE_WAIT", 10))
 HF_TOKEN=os.getenv("HF_TOKEN")
 MAX_PAGE_DETAILS_LENGTH = int(os.getenv("MAX_PAGE_DETAILS_LENGTH", 2048))
 MAX_ANSWER_TOKEN_PER_PAGE = int(os.getenv("MAX_ANSWER_TOKEN_PER_PAGE", 512))
 
+# Query-relevant chunks of the page in the prompt instead of its first MAX_PAGE_DETAILS_LENGTH tokens
+CHUNK_SELECTION=os.getenv("CHUNK_SELECTION", "none")
+CHUNK_TOKENS=int(os.getenv("CHUNK_TOKENS", 128))
+CHUNK_MAX_CHUNKS=int(os.getenv("CHUNK_MAX_CHUNKS", 256))
+CHUNK_MAX_EMBEDDED_CHUNKS=int(os.getenv("CHUNK_MAX_EMBEDDED_CHUNKS", 64))
+CHUNK_BM25_WEIGHT=float(os.getenv("CHUNK_BM25_WEIGHT", 0.3))
+CHUNK_EMBEDDING_TIMEOUT=float(os.getenv("CHUNK_EMBEDDING_TIMEOUT", 2))
+
+# Auto provider: links from the first registered of AUTO_PROVIDERS, hedged with the next one after the
+# AUTO_HEDGE_PERCENTILE of its recent latency
+AUTO_PROVIDERS=[name.strip() for name in os.getenv("AUTO_PROVIDERS", "duckduckgo,searxng,google").split(",") if name.strip()]
+AUTO_HEDGE_PERCENTILE=float(os.getenv("AUTO_HEDGE_PERCENTILE", 90))
+AUTO_HEDGE_MIN_DELAY=float(os.getenv("AUTO_HEDGE_MIN_DELAY", 0.2))
+AUTO_HEDGE_MAX_DELAY=float(os.getenv("AUTO_HEDGE_MAX_DELAY", 3))
+AUTO_HEDGE_DEFAULT_DELAY=float(os.getenv("AUTO_HEDGE_DEFAULT_DELAY", 1))
+AUTO_HEDGE_MIN_SAMPLES=int(os.getenv("AUTO_HEDGE_MIN_SAMPLES", 20))
+AUTO_MERGE=os.getenv("AUTO_MERGE", "false").lower() == "true"
+AUTO_MERGE_WAIT=float(os.getenv("AUTO_MERGE_WAIT", 0.3))
+
 # Searxng
 SEARXNG_BASE_URL=os.getenv("SEARXNG_BASE_URL")
 
@@ -44,3 +152,22 @@ SEARXNG_BASE_URL=os.getenv("SEARXNG_BASE_URL")
 GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY")
 GOOGLE_SEARCH_ENGINE_ID=os.getenv("GOOGLE_SEARCH_ENGINE_ID")
 
+
+# Provider rate limits, shared by every worker through Redis (calls per second, 0: not limited, the default)
+PROVIDER_RATE_LIMITS={
+    "google": float(os.getenv("RATE_LIMIT_GOOGLE", 0)),
+    "duckduckgo": float(os.getenv("RATE_LIMIT_DUCKDUCKGO", 0)),
+    "searxng": float(os.getenv("RATE_LIMIT_SEARXNG", 0)),
+}
+# calls per day, 0: no quota, the default (Google Custom Search: 100 free, resetting at midnight Pacific time)
+PROVIDER_DAILY_QUOTAS={
+    "google": int(os.getenv("GOOGLE_DAILY_QUOTA", 0)),
+}
+RATE_LIMIT_BURST_SECONDS=float(os.getenv("RATE_LIMIT_BURST_SECONDS", 5))
+RATE_LIMIT_MAX_WAIT=float(os.getenv("RATE_LIMIT_MAX_WAIT", 2))
+# provider searched instead of a throttled one, if it is registered (unset: none, the call fails with a 429)
+RATE_LIMIT_FALLBACKS={
+    "google": os.getenv("RATE_LIMIT_FALLBACK_GOOGLE"),
+    "duckduckgo": os.getenv("RATE_LIMIT_FALLBACK_DUCKDUCKGO"),
+    "searxng": os.getenv("RATE_LIMIT_FALLBACK_SEARXNG"),
+}
@@ -0,0 +1,33 @@
+# Code here runs inside the extraction worker processes.
+# Keep imports minimal: workers unpickle `extract_html` by importing this module, and importing
+# anything from `clients` would build every client (LLM tokenizer, Redis, Mongo, ...) in each worker.
+
+import os
+import time
+from typing import Optional, Tuple
+
+from trafilatura import extract
+
+
+# queue on which the worker tells which process runs each task, so the API process can kill only a stuck one
+_started = None
+
+
+def init_worker(started):
+    global _started
+    _started = started
+
+
+def run_task(task_id: int, html: bytes) -> Tuple[Optional[str], float]:
+    if _started is not None:
+        _started.put((task_id, os.getpid()))
+    return extract_html(html)
+
+
+def extract_html(html: bytes) -> Tuple[Optional[str], float]:
+    """
+    Extract the main text of a page, returns the text and the time spent extracting it.
+    """
+    start_time = time.perf_counter()
+    details = extract(html)
+    return details, time.perf_counter() - start_time
@@ -0,0 +1,103 @@
+"""
+Prometheus metrics of the search pipeline, served on /metrics.
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers
+(before they start): each worker then writes its samples to memory-mapped files there and /metrics
+aggregates every worker, whichever one serves the scrape. It's required with NUM_WORKERS > 1, the image
+and docker-compose.yaml set it.
+"""
+
+import os
+from typing import Tuple
+
+# before prometheus_client, which picks its mode from the environment (and .env, loaded by constants) at import
+from constants import NUM_WORKERS
+
+# otherwise each scrape would only see the worker which serves it
+if NUM_WORKERS > 1 and not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    raise RuntimeError(f"PROMETHEUS_MULTIPROC_DIR must be set to run {NUM_WORKERS} workers, see metrics.py")
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+
+
+# from a local cache hit (sub-millisecond) to an LLM answer (seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+# query_cache, serp_cache, embedding, page_store, download, extraction, chunk_selection, llm
+STAGE_DURATION = Histogram(
+    "titan_sight_stage_duration_seconds",
+    "Duration of a search pipeline stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+SERP_DURATION = Histogram(
+    "titan_sight_serp_duration_seconds",
+    "Duration of a search provider call for the links of a query",
+    ["provider"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# tier: local, query, serp, page, answer
+CACHE_LOOKUPS = Counter(
+    "titan_sight_cache_lookups_total",
+    "Cache lookups per tier and result (hit or miss)",
+    ["tier", "result"],
+)
+
+STAGE_TIMEOUTS = Counter(
+    "titan_sight_stage_timeouts_total",
+    "Stages which ran out of time",
+    ["stage"],
+)
+
+# kind: prompt, completion
+LLM_TOKENS = Counter(
+    "titan_sight_llm_tokens_total",
+    "Tokens used by the LLM answers",
+    ["kind"],
+)
+
+# reason: circuit_open, negative_cache
+PAGE_SKIPS = Counter(
+    "titan_sight_page_skips_total",
+    "Page fetches skipped because the host or the URL failed recently",
+    ["reason"],
+)
+
+# outcome: waited (then went through), rejected (no token in time), quota (daily quota exhausted), fallback
+PROVIDER_THROTTLES = Counter(
+    "titan_sight_provider_throttles_total",
+    "Search provider calls held back by the rate limits",
+    ["provider", "outcome"],
+)
+
+# outcome: hedged (a second provider was asked), hedge_won (and answered first), merged
+SERP_HEDGES = Counter(
+    "titan_sight_serp_hedges_total",
+    "Hedged link list requests of the auto provider",
+    ["outcome"],
+)
+
+PAGE_BYTES_DOWNLOADED = Counter(
+    "titan_sight_page_bytes_downloaded_total",
+    "Bytes downloaded by the HTTP fetcher",
+)
+
+
+def record_cache_lookup(tier: str, hit: bool, count: int = 1):
+    if count > 0:
+        CACHE_LOOKUPS.labels(tier, "hit" if hit else "miss").inc(count)
+
+
+def render() -> Tuple[bytes, str]:
+    """
+    The metrics in the Prometheus text format, aggregated across workers in multiprocess mode, and their content type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry), CONTENT_TYPE_LATEST
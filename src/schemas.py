@@ -1,8 +1,23 @@
 # Code here is based on github.com/rashadphz/farfalle
 
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from constants import BATCH_MAX_QUERIES
+
+
+class PageDetails(BaseModel):
+    details: str
+    fetched_at: Optional[datetime] = None
+    # last time the server confirmed the details are current, at fetch time or by a 304
+    validated_at: Optional[datetime] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    # read from the page store as is, so there is nothing to write back
+    _from_store: bool = PrivateAttr(default=False)
 
 
 class SearchResult(BaseModel):
@@ -11,6 +26,9 @@ class SearchResult(BaseModel):
     content: str
     details: Optional[str] = None
     answer: Optional[str] = None
+
+    # where the details come from, kept for the page store but never serialized
+    _page: Optional[PageDetails] = PrivateAttr(default=None)
     
 
     def __str__(self):
@@ -21,3 +39,20 @@ class SearchResponse(BaseModel):
     query: str
     results: List[SearchResult] = Field(default_factory=list)
 
+    # the query-cache entry it was read from or written to, its search parameters, and whether it's past its fresh time
+    _cache_key: Optional[str] = PrivateAttr(default=None)
+    _search_params: Optional[dict] = PrivateAttr(default=None)
+    _stale: bool = PrivateAttr(default=False)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=BATCH_MAX_QUERIES)
+    provider: Literal["searxng", "google", "duckduckgo", "auto"] = "duckduckgo"
+    max_num_result: int = 3
+    enable_cache: bool = True
+    newest_first: bool = False
+    sumup_page_timeout: int = 15
+
+
+class BatchSearchResponse(BaseModel):
+    responses: List[SearchResponse] = Field(default_factory=list)
@@ -2,7 +2,8 @@ from .providers import (
     SearchProvider,
     SearxngSearchProvider,
     DuckDuckGoSearchProvider,
-    GoogleSearchProvider
+    GoogleSearchProvider,
+    AutoSearchProvider,
 )
 
 from fastapi import HTTPException
@@ -32,3 +33,46 @@ if not GOOGLE_API_KEY or not GOOGLE_SEARCH_ENGINE_ID:
     logger.warning("GOOGLE_API_KEY or GOOGLE_SEARCH_ENGINE_ID environment variables are not set.")
 else:
     PROVIDERS["google"] = GoogleSearchProvider(GOOGLE_API_KEY, GOOGLE_SEARCH_ENGINE_ID)
+
+
+# Search with another provider when one is throttled
+from constants import RATE_LIMIT_FALLBACKS
+for name, provider in PROVIDERS.items():
+    fallback_name = RATE_LIMIT_FALLBACKS.get(name)
+    if not fallback_name:
+        continue
+    fallback = PROVIDERS.get(fallback_name)
+    if fallback is None:
+        logger.warning(f"Fallback provider {fallback_name} of {name} is not registered, skipping it.")
+    elif fallback is not provider:
+        provider.fallback = fallback
+
+
+# Register the auto provider: hedged requests over the other providers
+from constants import AUTO_PROVIDERS, AUTO_HEDGE_PERCENTILE, AUTO_HEDGE_MIN_DELAY, AUTO_HEDGE_MAX_DELAY, AUTO_HEDGE_DEFAULT_DELAY, AUTO_HEDGE_MIN_SAMPLES, AUTO_MERGE, AUTO_MERGE_WAIT
+auto_providers = [PROVIDERS[name] for name in AUTO_PROVIDERS if name in PROVIDERS]
+if not auto_providers:
+    logger.warning("None of the AUTO_PROVIDERS is registered, the auto provider is disabled.")
+else:
+    PROVIDERS["auto"] = AutoSearchProvider(
+        auto_providers,
+        hedge_percentile=AUTO_HEDGE_PERCENTILE,
+        min_delay=AUTO_HEDGE_MIN_DELAY,
+        max_delay=AUTO_HEDGE_MAX_DELAY,
+        default_delay=AUTO_HEDGE_DEFAULT_DELAY,
+        min_samples=AUTO_HEDGE_MIN_SAMPLES,
+        merge=AUTO_MERGE,
+        merge_wait=AUTO_MERGE_WAIT,
+    )
+
+
+# Refresh the popular cached searches before they expire
+from constants import CACHE_WARMER_INTERVAL, CACHE_WARMER_BATCH_SIZE, CACHE_REFRESH_AHEAD, CACHE_REFRESH_MIN_HITS
+from .warmer import CacheWarmer
+cache_warmer = CacheWarmer(
+    PROVIDERS,
+    interval=CACHE_WARMER_INTERVAL,
+    refresh_ahead=CACHE_REFRESH_AHEAD,
+    min_hits=CACHE_REFRESH_MIN_HITS,
+    batch_size=CACHE_WARMER_BATCH_SIZE,
+)
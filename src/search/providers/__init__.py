@@ -1,4 +1,5 @@
 from .base import SearchProvider
 from .searxng import SearxngSearchProvider
 from .duckduckgo import DuckDuckGoSearchProvider
-from .google import GoogleSearchProvider
\ No newline at end of file
+from .google import GoogleSearchProvider
+from .auto import AutoSearchProvider
\ No newline at end of file
@@ -0,0 +1,182 @@
+import asyncio
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from schemas import SearchResult
+from ..providers.base import SearchProvider, serp_latencies
+from logs import logger
+from metrics import SERP_HEDGES
+from utils import NO_DEADLINE, Deadline
+
+
+def _url_key(url: str) -> str:
+    # the same page from two providers: scheme, host case, "www.", fragment and trailing slash aside
+    parts = urlsplit(url)
+    host = parts.netloc.lower().removeprefix("www.")
+    return f"{host}{parts.path.rstrip('/')}?{parts.query}"
+
+
+class AutoSearchProvider(SearchProvider):
+    """
+    Searches the links with the first of `providers`, and sends a hedged request to the next one if the
+    first hasn't answered within the `hedge_percentile` of its recent latency (clamped between `min_delay`
+    and `max_delay`, `default_delay` until `min_samples` calls were seen). A provider which fails or returns
+    no links hands over to the next one right away. The first non-empty link list wins and the other
+    requests are cancelled, or with `merge`, the lists which arrive within `merge_wait` seconds of the
+    first one are interleaved by rank and de-duplicated by URL.
+    Each provider goes through its own SERP cache, rate limiter and latency window, "auto" has none of them.
+    Parameters:
+        providers (List[SearchProvider]): Providers in order of preference
+        hedge_percentile (float): Latency percentile of the primary provider after which the request is hedged
+        min_delay (float): Minimum seconds before hedging
+        max_delay (float): Maximum seconds before hedging
+        default_delay (float): Seconds before hedging while the latency of the primary provider is unknown
+        min_samples (int): Calls of the primary provider needed to use its latency percentile
+        merge (bool): Merge the link lists instead of keeping the first one
+        merge_wait (float): Seconds the other requests are given to finish once the first list is in, with `merge`
+    """
+    name = "auto"
+
+    def __init__(
+        self,
+        providers: List[SearchProvider],
+        hedge_percentile: float = 90,
+        min_delay: float = 0.2,
+        max_delay: float = 3,
+        default_delay: float = 1,
+        min_samples: int = 20,
+        merge: bool = False,
+        merge_wait: float = 0.3,
+    ):
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.merge = merge
+        self.merge_wait = merge_wait
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.merged = 0
+        self.failures = 0
+
+
+    def hedge_delay(self, provider: SearchProvider) -> float:
+        latency = serp_latencies.get(provider.name)
+        if latency is None or len(latency.samples) < self.min_samples:
+            return self.default_delay
+        return min(self.max_delay, max(self.min_delay, latency.percentile(self.hedge_percentile)))
+
+
+    async def get_link_results(
+        self, query: str, num_results: int, newest_first: bool = False
+    ) -> list[SearchResult]:
+        return await self._get_link_results(query, num_results, newest_first)
+
+
+    async def _get_link_results(self, query: str, num_results: int, newest_first: bool = False, deadline: Deadline = NO_DEADLINE, fallback: bool = True) -> List[SearchResult]:
+        # not the SERP cache, rate limiter and latency window of the base provider: those of each provider apply
+        self.requests += 1
+
+        # task -> index of its provider
+        tasks: Dict[asyncio.Task, int] = {}
+        next_index = 0
+
+        def start_next():
+            nonlocal next_index
+            provider = self.providers[next_index]
+            # a throttled provider fails over to the next one here, not to its own fallback
+            task = asyncio.create_task(provider._get_link_results(query, num_results, newest_first, deadline, fallback=False))
+            tasks[task] = next_index
+            next_index += 1
+
+        start_next()
+        hedge_at = asyncio.get_running_loop().time() + self.hedge_delay(self.providers[0])
+        lists: Dict[int, List[SearchResult]] = {}
+        hedged = False
+
+        try:
+            while tasks and not lists:
+                # hedge once on time, any failure moves on to the next provider anyway
+                timeout = None
+                if next_index == 1 and next_index < len(self.providers):
+                    timeout = max(0.0, hedge_at - asyncio.get_running_loop().time())
+
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedged += 1
+                    SERP_HEDGES.labels("hedged").inc()
+                    logger.info(f"Links for '{query}' from {self.providers[0].name} are slow, hedging with {self.providers[next_index].name}")
+                    start_next()
+                    continue
+
+                for task in done:
+                    index = tasks.pop(task)
+                    if task.exception():
+                        logger.warning(f"Error getting links for '{query}' from {self.providers[index].name}: {task.exception()!r}")
+                    elif task.result():
+                        lists[index] = task.result()
+
+                # the next provider once none is left in flight
+                if not lists and not tasks and next_index < len(self.providers):
+                    start_next()
+
+            if not lists:
+                self.failures += 1
+                return []
+
+            if self.merge and tasks:
+                done, _ = await asyncio.wait(tasks, timeout=self.merge_wait)
+                for task in done:
+                    index = tasks.pop(task)
+                    if not task.exception() and task.result():
+                        lists[index] = task.result()
+        finally:
+            # the losers are cancelled (a provider call running in a thread still runs to its end)
+            for task in tasks:
+                task.cancel()
+
+        winner = min(lists)
+        if hedged and winner > 0 and len(lists) == 1:
+            self.hedge_wins += 1
+            SERP_HEDGES.labels("hedge_won").inc()
+
+        if len(lists) == 1:
+            return lists[winner]
+
+        self.merged += 1
+        SERP_HEDGES.labels("merged").inc()
+        return self._merge([lists[index] for index in sorted(lists)], num_results)
+
+
+    @staticmethod
+    def _merge(link_lists: List[List[SearchResult]], num_results: int) -> List[SearchResult]:
+        # interleave the lists by rank, the preferred provider first, keeping the first of each page
+        merged, seen = [], set()
+        for rank in range(max(len(links) for links in link_lists)):
+            for links in link_lists:
+                if rank < len(links) and _url_key(links[rank].url) not in seen:
+                    seen.add(_url_key(links[rank].url))
+                    merged.append(links[rank])
+        return merged[:num_results]
+
+
+    def stats(self) -> dict:
+        return {
+            "providers": [provider.name for provider in self.providers],
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "merged": self.merged,
+            "failures": self.failures,
+            "hedge_delay_ms": round(self.hedge_delay(self.providers[0]) * 1000, 1),
+            "latency": {
+                provider.name: serp_latencies[provider.name].to_dict()
+                for provider in self.providers
+                if provider.name in serp_latencies
+            },
+        }
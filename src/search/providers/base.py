@@ -1,88 +1,601 @@
 from abc import ABC, abstractmethod
-from schemas import SearchResponse, SearchResult
-from typing import List
-from trafilatura import fetch_url, extract
-from constants import tralifatura_config
+from schemas import PageDetails, SearchResponse, SearchResult
+from typing import AsyncIterator, Awaitable, Dict, List, Literal, Optional
 import asyncio
-from clients import short_term_cache_client, long_term_cache_client, llm_client
+import math
+from clients.scheduling_clients import Priority
+from clients.rate_limit_clients import RateLimitExceededError
+from clients import local_cache_client, short_term_cache_client, long_term_cache_client, summary_cache_client, negative_cache_client, serp_cache_client, provider_rate_limiter, circuit_breaker, llm_client, chunk_selector, http_fetcher, extraction_client, embedding_client, request_coalescer
 from logs import logger
+from stats import LatencyWindow
+from utils import NO_DEADLINE, Deadline, normalize_query, make_key
+from metrics import PAGE_SKIPS, PROVIDER_THROTTLES, SERP_DURATION, STAGE_TIMEOUTS, record_cache_lookup
+from constants import BATCH_MAX_CONCURRENCY, CACHE_REFRESH_CONCURRENCY, CACHE_REFRESH_TIMEOUT, SUMMARY_CACHE_ENABLED, MAX_PAGE_DETAILS_LENGTH, PAGE_FRESH_TIME, PAGE_STALE_WHILE_REVALIDATE
 import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# URL -> background revalidation in flight, shared by every provider
+_revalidations: Dict[str, asyncio.Task] = {}
+
+# query-cache entry key -> background refresh in flight, and the refreshes allowed to run at once
+_refreshes: Dict[str, asyncio.Task] = {}
+_refresh_slots = asyncio.Semaphore(CACHE_REFRESH_CONCURRENCY)
+
+# provider name -> latency of its recent link list calls, which sets the hedge delay of the "auto" provider
+serp_latencies: Dict[str, LatencyWindow] = {}
 
 class SearchProvider(ABC):
+    name: str
+    # searched instead when this provider is throttled, set by the registry
+    fallback: Optional["SearchProvider"] = None
+
     @abstractmethod
-    async def search(self, query: str, max_num_result: int) -> SearchResponse:
+    async def get_link_results(self, query: str, num_results: int, newest_first: bool = False) -> List[SearchResult]:
         raise NotImplementedError
+
+    async def search(self, query: str, max_num_result: int, newest_first: bool = False, sumup_page_timeout: int = 15, overfetch_factor: float = 1.0, result_order: Literal["rank", "completion"] = "rank", deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> SearchResponse:
+
+        start_time = time.time()
+
+        # Get link results, with extra candidates to replace the pages which fail or are slow
+        num_candidates = self._num_candidates(max_num_result, overfetch_factor)
+        try:
+            link_results = await asyncio.wait_for(
+                self._get_link_results(query, num_results=num_candidates, newest_first=newest_first, deadline=deadline),
+                timeout=deadline.timeout(),
+            )
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels("serp").inc()
+            logger.warning(f"Search links for '{query}' ran out of time")
+            return SearchResponse(query=query)
+
+        logger.info(f"Search links for '{query}' returned {len(link_results)} links in {time.time() - start_time:.2f} seconds")
+
+        # Fetch details for each result
+        if link_results:
+            if num_candidates > max_num_result:
+                link_results = await self.fetch_first_details_and_generate_consise_answer(query, link_results, sumup_page_timeout, max_num_result, result_order, deadline=deadline, priority=priority)
+            else:
+                link_results = await self.fetch_details_and_generate_consise_answer(query, link_results, sumup_page_timeout, deadline=deadline, priority=priority)
+
+        return SearchResponse(query=query, results=link_results)
+
+    async def _get_link_results(self, query: str, num_results: int, newest_first: bool = False, deadline: Deadline = NO_DEADLINE, fallback: bool = True) -> List[SearchResult]:
+        # the same links serve any number of results, up to the number cached
+        link_results = await serp_cache_client.get(self.name, query, num_results, newest_first)
+        record_cache_lookup("serp", link_results is not None)
+        if link_results is not None:
+            return link_results
+
+        # wait for our turn with the provider (across every worker), or search with the fallback provider
+        try:
+            await provider_rate_limiter.acquire(self.name, deadline)
+        except RateLimitExceededError:
+            if not fallback or self.fallback is None:
+                raise
+            PROVIDER_THROTTLES.labels(self.name, "fallback").inc()
+            logger.warning(f"{self.name} is throttled, searching links for '{query}' with {self.fallback.name}")
+            return await self.fallback._get_link_results(query, num_results, newest_first, deadline, fallback=False)
+
+        # fetch enough links for the smaller requests too
+        num_fetched = max(num_results, serp_cache_client.num_results) if serp_cache_client.enabled(self.name) else num_results
+        with SERP_DURATION.labels(self.name).time(), serp_latencies.setdefault(self.name, LatencyWindow()).measure():
+            link_results = await self.get_link_results(query, num_results=num_fetched, newest_first=newest_first)
+
+        asyncio.create_task(serp_cache_client.set(self.name, query, newest_first, link_results, complete=len(link_results) < num_fetched))
+        return link_results[:num_results]
+
+    @staticmethod
+    def _num_candidates(max_num_result: int, overfetch_factor: float) -> int:
+        return max(max_num_result, math.ceil(max_num_result * overfetch_factor))
     
     async def search_without_cache(self, query: str, max_num_result: int, sumup_page_timeout: int) -> SearchResponse:
         response = await self.search(query, max_num_result)
         return response
 
-    async def search_in_cache(self, query: str, max_num_result: int, newest_first: bool, sumup_page_timeout: int) -> SearchResponse:
-        cached_response = await short_term_cache_client.get(query)
+    def _cache_key(self, query: str, max_num_result: int, newest_first: bool) -> str:
+        return make_key(normalize_query(query), self.name, max_num_result, newest_first)
+
+    def _search_params(self, max_num_result: int, newest_first: bool, sumup_page_timeout: int, overfetch_factor: float = 1.0) -> dict:
+        # stored with the query-cache entry, to search again when refreshing it
+        return {
+            "provider": self.name,
+            "max_num_result": max_num_result,
+            "newest_first": newest_first,
+            "sumup_page_timeout": sumup_page_timeout,
+            "overfetch_factor": overfetch_factor,
+        }
+
+    async def _get_cached_response(self, query: str, key: str, deadline: Deadline = NO_DEADLINE) -> Optional[SearchResponse]:
+        # Exact match in this worker first, then a similar query in Redis
+        cached_response = local_cache_client.get(key)
+        record_cache_lookup("local", cached_response is not None)
         if cached_response:
+            # still a hit of the Redis entry, for the cache warmer
+            if cached_response._cache_key:
+                short_term_cache_client.count_hit(cached_response._cache_key)
             return cached_response
 
-        response = await self.search(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout)
+        cached_response, ttl = await short_term_cache_client.get_with_ttl(query, deadline=deadline)
+        record_cache_lookup("query", cached_response is not None)
+        if cached_response:
+            # never serve it locally for longer than Redis would (-1: the entry has no expiry), stale entries not at all
+            local_cache_client.set(key, cached_response, ttl=ttl if ttl >= 0 else None)
 
-        asyncio.create_task(short_term_cache_client.set(response))
-        asyncio.create_task(long_term_cache_client.set(response))
+            # serve a stale entry as is, and refresh it for the next requests
+            if cached_response._stale and cached_response._search_params:
+                self.refresh_in_background(cached_response.query, cached_response._cache_key, cached_response._search_params)
 
-        return response
+        return cached_response
+
+    async def search_in_cache(self, query: str, max_num_result: int, newest_first: bool, sumup_page_timeout: int, overfetch_factor: float = 1.0, result_order: Literal["rank", "completion"] = "rank", deadline: Deadline = NO_DEADLINE) -> SearchResponse:
+        key = self._cache_key(query, max_num_result, newest_first)
 
-    async def fetch_details_and_generate_consise_answer(self, query: str, results_without_details: List[SearchResult], sumup_page_timeout: int) -> List[SearchResult]:
-        async def fetch_details_for_result(result: SearchResult):
+        cached_response = await self._get_cached_response(query, key, deadline)
+        if cached_response:
+            return cached_response
+
+        # Share the search with concurrent misses for the same (or a similar) query and the same parameters
+        group = (self.name, max_num_result, newest_first, sumup_page_timeout, overfetch_factor, result_order)
+        compute = lambda: self._search_and_cache(query, key, max_num_result, newest_first, sumup_page_timeout, overfetch_factor, result_order, deadline)
+
+        async def shared_search() -> SearchResponse:
+            # memoized by the cache lookup above, unless that lookup gave up at the deadline
             try:
-                start_time = time.time()
-                await asyncio.sleep(0.1)
+                query_embedding = await embedding_client.get_embedding(query)
+            except Exception as e:
+                logger.error(f"Error embedding '{query}', searching without coalescing: {e}")
+                return await compute()
+            return await request_coalescer.run(key, group, query_embedding, compute)
 
-                # Create tasks for both cache lookup and URL fetching
-                cached_details = await asyncio.wait_for(
-                    long_term_cache_client.get(result.url),
-                    timeout=5  # 5 seconds timeout for cache lookup
-                )
+        # The shared search runs on the deadline of the request which started it, don't wait for it (or for the
+        # embedding) past ours (plus a little, the search returns its partial results right at the deadline)
+        timeout = deadline.timeout()
+        try:
+            return await asyncio.wait_for(shared_search(), timeout=timeout + 0.1 if timeout is not None else None)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shared search for '{query}' ran out of time")
+            return SearchResponse(query=query)
 
-                if cached_details:
-                    result.details = cached_details
-                else:
-                    # Fetch and extract with timeout
-                    html = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: fetch_url(result.url, config=tralifatura_config)
-                        ),
-                        timeout=10  # 10 seconds timeout for fetching
-                    )
-                    
-                    details = await asyncio.wait_for(
-                        asyncio.get_event_loop().run_in_executor(
-                            None, lambda: extract(html)
-                        ),
-                        timeout=5  # 5 seconds timeout for extraction
-                    )
-                    result.details = details
-
-                logger.info(f"Fetched details for {result.url} in {time.time() - start_time:.2f} seconds")
-                start_time = time.time()
+    async def _search_and_cache(self, query: str, key: str, max_num_result: int, newest_first: bool, sumup_page_timeout: int, overfetch_factor: float = 1.0, result_order: Literal["rank", "completion"] = "rank", deadline: Deadline = NO_DEADLINE) -> SearchResponse:
+        # Let one worker compute, the others wait for its result in the cache
+        lease = await request_coalescer.acquire(key)
+        if lease is None:
+            cached_response = await request_coalescer.wait_for_remote(key, lambda: self._get_cached_response(query, key, deadline), deadline)
+            if cached_response:
+                return cached_response
+            lease = await request_coalescer.acquire(key)
+
+        try:
+            response = await self.search(query, max_num_result, newest_first=newest_first, sumup_page_timeout=sumup_page_timeout, overfetch_factor=overfetch_factor, result_order=result_order, deadline=deadline)
+        except BaseException:
+            await request_coalescer.release(key, lease)
+            raise
+
+        # A response cut short by the deadline still fills the page store, but isn't served to later requests
+        partial = deadline.remaining() is not None and len(response.results) < max_num_result
+        search_params = self._search_params(max_num_result, newest_first, sumup_page_timeout, overfetch_factor)
+        asyncio.create_task(self._populate_caches(response, key, lease, query_cache=not partial, search_params=search_params))
+
+        return response
+
+    async def _populate_caches(self, response: SearchResponse, key: str, lease: Optional[str] = None, query_cache: bool = True, search_params: Optional[dict] = None, replaces: Optional[str] = None):
+        if query_cache:
+            local_cache_client.set(key, response)
+
+        try:
+            await asyncio.gather(
+                short_term_cache_client.set(response, search_params=search_params, replaces=replaces) if query_cache else asyncio.sleep(0),
+                long_term_cache_client.set(response),
+                return_exceptions=True,
+            )
+        finally:
+            # release once the result is in the cache, so waiting workers find it
+            await request_coalescer.release(key, lease)
+
+    async def search_stream(self, query: str, max_num_result: int, newest_first: bool, sumup_page_timeout: int, enable_cache: bool, overfetch_factor: float = 1.0) -> AsyncIterator[dict]:
+        """
+        Search and yield events as soon as they are ready: the link list, then each result once its details
+        and answer are done (in completion order), then a summary. With `overfetch_factor` above 1, extra
+        candidates are processed and the stream ends once `max_num_result` of them are done.
+        """
+        start_time = time.time()
+        key = self._cache_key(query, max_num_result, newest_first)
+
+        if enable_cache:
+            cached_response = await self._get_cached_response(query, key)
+            if cached_response:
+                yield {"event": "links", "data": [result.model_dump(include={"title", "url", "content"}) for result in cached_response.results]}
+                for result in cached_response.results:
+                    yield {"event": "result", "data": result.model_dump()}
+                yield {"event": "summary", "data": {"query": cached_response.query, "num_links": len(cached_response.results), "num_results": len(cached_response.results), "cached": True, "elapsed": time.time() - start_time}}
+                return
+
+        # Get link results
+        num_candidates = self._num_candidates(max_num_result, overfetch_factor)
+        link_results = await self._get_link_results(query, num_results=num_candidates, newest_first=newest_first)
+        yield {"event": "links", "data": [result.model_dump(include={"title", "url", "content"}) for result in link_results]}
+
+        # Emit each result as it completes. With extra candidates, the results whose page could not be fetched
+        # are held back, and only emitted at the end if there aren't enough results with details
+        completed, without_details = [], []
+        report = self._new_summary_cache_report()
+        results = self.iter_details_and_generate_consise_answer(query, link_results, sumup_page_timeout, report)
+        try:
+            async for result in results:
+                if num_candidates > max_num_result and not result.details:
+                    without_details.append(result)
+                    continue
+                completed.append(result)
+                yield {"event": "result", "data": result.model_dump()}
+                if len(completed) >= max_num_result:
+                    break
+        finally:
+            # cancels the remaining candidates
+            await results.aclose()
+
+        for result in without_details[:max_num_result - len(completed)]:
+            completed.append(result)
+            yield {"event": "result", "data": result.model_dump()}
+
+        # Cache in provider order, like the non-streaming search
+        completed_ids = {id(result) for result in completed}
+        response = SearchResponse(query=query, results=[result for result in link_results if id(result) in completed_ids])
+        if enable_cache:
+            search_params = self._search_params(max_num_result, newest_first, sumup_page_timeout, overfetch_factor)
+            asyncio.create_task(self._populate_caches(response, key, search_params=search_params))
+
+        yield {"event": "summary", "data": {"query": query, "num_links": len(link_results), "num_results": len(completed), "cached": False, "answer_cache": report, "elapsed": time.time() - start_time}}
+
+    async def search_batch(self, queries: List[str], max_num_result: int, newest_first: bool, sumup_page_timeout: int, enable_cache: bool) -> List[SearchResponse]:
+        """
+        Search several queries at once. Provider searches and page fetches share a concurrency budget, and each
+        unique URL is fetched and extracted only once across the batch; answers are still generated per (query, page).
+        """
+        start_time = time.time()
+        semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+        async def bounded(awaitable: Awaitable):
+            async with semaphore:
+                return await awaitable
+
+        # Identical queries are only searched once
+        canonical_queries: Dict[str, str] = {}
+        for query in queries:
+            canonical_queries.setdefault(normalize_query(query), query)
+        unique_queries = list(canonical_queries.values())
+        responses: Dict[str, SearchResponse] = {}
+
+        if enable_cache:
+            cached_responses = await asyncio.gather(
+                *[bounded(self._get_cached_response(query, self._cache_key(query, max_num_result, newest_first))) for query in unique_queries],
+                return_exceptions=True,
+            )
+            for query, cached_response in zip(unique_queries, cached_responses):
+                if isinstance(cached_response, SearchResponse):
+                    responses[query] = cached_response
+
+        # Get link results for the remaining queries
+        missing_queries = [query for query in unique_queries if query not in responses]
+        link_results_per_query = await asyncio.gather(
+            *[bounded(self._get_link_results(query, num_results=max_num_result, newest_first=newest_first)) for query in missing_queries],
+            return_exceptions=True,
+        )
+
+        link_results: Dict[str, List[SearchResult]] = {}
+        for query, results in zip(missing_queries, link_results_per_query):
+            if isinstance(results, BaseException):
+                logger.error(f"Error getting links for '{query}': {results}")
+                results = []
+            link_results[query] = results
+
+        # Fetch and extract every unique URL once
+        unique_urls = list(dict.fromkeys(result.url for results in link_results.values() for result in results))
+        cached_details_by_url = await self._lookup_cached_details(f"batch of {len(missing_queries)} queries", unique_urls)
+        details_tasks = {
+            url: asyncio.create_task(bounded(self._get_details(url, cached_details_by_url.get(url))))
+            for url in unique_urls
+        }
+
+        logger.info(f"Batch of {len(queries)} queries: {len(responses)} cached, {sum(len(results) for results in link_results.values())} links, {len(unique_urls)} unique URLs")
+
+        # Generate answers per (query, page), shielding the shared fetch from a timeout of one of its users
+        reports = {query: self._new_summary_cache_report() for query in link_results}
+        successes = await asyncio.gather(*[
+            asyncio.gather(*[
+                self._fetch_details_for_result(query, result, asyncio.shield(details_tasks[result.url]), sumup_page_timeout, reports[query], priority="batch")
+                for result in results
+            ])
+            for query, results in link_results.items()
+        ])
+
+        for (query, results), success in zip(link_results.items(), successes):
+            responses[query] = SearchResponse(query=query, results=[result for result, ok in zip(results, success) if ok])
+            logger.info(f"Answer cache for '{query}': {reports[query]['hits']} hits, {reports[query]['misses']} misses")
+
+        if enable_cache:
+            asyncio.create_task(self._populate_batch_caches(
+                [responses[query] for query in link_results],
+                [result for results in link_results.values() for result in results if result._page is not None and not result._page._from_store],
+                max_num_result,
+                newest_first,
+                sumup_page_timeout,
+            ))
+
+        logger.info(f"Batch of {len(queries)} queries done in {time.time() - start_time:.2f} seconds")
 
-                await asyncio.sleep(0.1)
+        return [responses[canonical_queries[normalize_query(query)]] for query in queries]
 
-                # Generate concise answer with timeout
-                result.answer = await asyncio.wait_for(
-                    llm_client.summarize_page(query, result),
-                    timeout=sumup_page_timeout  # sumup_page_timeout seconds timeout for LLM
+    async def _populate_batch_caches(self, responses: List[SearchResponse], fetched_results: List[SearchResult], max_num_result: int, newest_first: bool, sumup_page_timeout: int):
+        for response in responses:
+            local_cache_client.set(self._cache_key(response.query, max_num_result, newest_first), response)
+
+        # One query-cache entry per query, but each newly fetched page is written to the page cache once
+        search_params = self._search_params(max_num_result, newest_first, sumup_page_timeout)
+        await asyncio.gather(
+            *[short_term_cache_client.set(response, search_params=search_params) for response in responses if response.results],
+            long_term_cache_client.set(SearchResponse(query="", results=fetched_results)),
+            return_exceptions=True,
+        )
+
+    def refresh_in_background(self, query: str, entry_key: str, search_params: dict):
+        """
+        Search `query` again with the parameters of the query-cache entry `entry_key` and replace the entry, once per entry
+        across the workers, with at most CACHE_REFRESH_CONCURRENCY refreshes at once per worker.
+        """
+        if entry_key in _refreshes:
+            return
+        task = _refreshes[entry_key] = asyncio.create_task(self._refresh(query, entry_key, search_params))
+        task.add_done_callback(lambda _: _refreshes.pop(entry_key, None))
+
+    async def _refresh(self, query: str, entry_key: str, search_params: dict):
+        max_num_result = search_params["max_num_result"]
+        newest_first = search_params["newest_first"]
+
+        # live requests first: a few refreshes at a time, with the lowest LLM priority. The lease is only taken
+        # once there is a free slot, its timeout is the time the refresh itself may take
+        async with _refresh_slots:
+            try:
+                lease = await short_term_cache_client.acquire_lease(f"refresh:{entry_key}", CACHE_REFRESH_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error acquiring the refresh lease of '{query}': {e}")
+                return
+            if lease is None:
+                return
+
+            try:
+                start_time = time.time()
+                response = await self.search(
+                    query,
+                    max_num_result,
+                    newest_first=newest_first,
+                    sumup_page_timeout=search_params["sumup_page_timeout"],
+                    overfetch_factor=search_params.get("overfetch_factor", 1.0),
+                    deadline=Deadline(CACHE_REFRESH_TIMEOUT),
+                    priority="prefetch",
                 )
 
-                logger.info(f"Generated concise answer for {result.url} in {time.time() - start_time:.2f} seconds")
-                return True
+                # keep serving the old entry rather than a partial one until it expires, the new entry replaces it
+                # once written
+                complete = len(response.results) >= max_num_result
+                await self._populate_caches(response, self._cache_key(query, max_num_result, newest_first), query_cache=complete, search_params=search_params, replaces=entry_key)
 
-            except asyncio.TimeoutError:
-                logger.warning(f"Timeout while processing {result.url}")
-                return False
+                logger.info(f"Refreshed cached search for '{query}' in {time.time() - start_time:.2f} seconds ({len(response.results)} results)")
             except Exception as e:
-                logger.error(f"Error fetching details for {result.url}: {e}")
-                return False
+                logger.warning(f"Error refreshing cached search for '{query}': {e!r}")
+            finally:
+                try:
+                    await short_term_cache_client.release_lease(f"refresh:{entry_key}", lease)
+                except Exception as e:
+                    logger.error(f"Error releasing the refresh lease of '{query}': {e}")
+
+    async def _lookup_cached_details(self, query: str, urls: List[str], deadline: Deadline = NO_DEADLINE) -> Dict[str, PageDetails]:
+        # Look up cached details for every result in a single round-trip
+        try:
+            pages = await asyncio.wait_for(
+                long_term_cache_client.get_pages(urls, deadline=deadline),
+                timeout=deadline.timeout(5)  # 5 seconds timeout for cache lookup
+            )
+            record_cache_lookup("page", True, len(pages))
+            record_cache_lookup("page", False, len(set(urls)) - len(pages))
+            return pages
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels("page_store").inc()
+            logger.warning(f"Timeout while looking up cached details for '{query}'")
+        except Exception as e:
+            logger.error(f"Error looking up cached details for '{query}': {e}")
+        return {}
+
+    async def _get_details(self, url: str, cached_page: Optional[PageDetails], deadline: Deadline = NO_DEADLINE) -> Optional[PageDetails]:
+        if not cached_page:
+            return await self._fetch_page_details(url, deadline=deadline)
+
+        # Serve fresh pages as is, stale ones while revalidating them in the background, and revalidate older ones first
+        validated_at = cached_page.validated_at or cached_page.fetched_at
+        age = (datetime.now(timezone.utc) - validated_at).total_seconds() if validated_at else None
+
+        if age is not None and age < PAGE_FRESH_TIME:
+            return cached_page
+
+        if age is None or age < PAGE_FRESH_TIME + PAGE_STALE_WHILE_REVALIDATE:
+            if url not in _revalidations:
+                task = _revalidations[url] = asyncio.create_task(self._revalidate_in_background(url, cached_page))
+                task.add_done_callback(lambda _: _revalidations.pop(url, None))
+            return cached_page
+
+        try:
+            return await self._fetch_page_details(url, cached_page, deadline) or cached_page
+        except Exception as e:
+            # better a stale page than none
+            logger.warning(f"Error revalidating {url}, serving the stored page: {e!r}")
+            return cached_page
+
+    async def _revalidate_in_background(self, url: str, cached_page: PageDetails):
+        try:
+            page = await self._fetch_page_details(url, cached_page)
+            if page:
+                await long_term_cache_client.set_pages({url: page})
+        except Exception as e:
+            logger.warning(f"Error revalidating {url} in the background: {e!r}")
+
+    async def _fetch_page_details(self, url: str, cached_page: Optional[PageDetails] = None, deadline: Deadline = NO_DEADLINE) -> Optional[PageDetails]:
+        # Skip the URLs which just failed (in any worker) and the hosts whose circuit is open
+        host = urlsplit(url).hostname or ""
+        if await negative_cache_client.contains(url, deadline):
+            PAGE_SKIPS.labels("negative_cache").inc()
+            return None
+        if not circuit_breaker.allow(host):
+            PAGE_SKIPS.labels("circuit_open").inc()
+            return None
+
+        try:
+            page = await self._download_page_details(url, cached_page, deadline)
+        except asyncio.CancelledError:
+            circuit_breaker.release(host)
+            raise
+        except Exception as e:
+            # running out of request time says nothing about the host
+            if isinstance(e, asyncio.TimeoutError) and deadline.expired():
+                circuit_breaker.release(host)
+            else:
+                self._record_page_failure(url, host)
+            raise
+
+        if page is None:
+            self._record_page_failure(url, host)
+        else:
+            circuit_breaker.record_success(host)
+        return page
+
+    def _record_page_failure(self, url: str, host: str):
+        circuit_breaker.record_failure(host)
+        asyncio.create_task(negative_cache_client.add(url))
+
+    async def _download_page_details(self, url: str, cached_page: Optional[PageDetails] = None, deadline: Deadline = NO_DEADLINE) -> Optional[PageDetails]:
+        # Fetch with timeout, conditionally when there is a stored page
+        fetched_at = datetime.now(timezone.utc)
+        try:
+            page = await asyncio.wait_for(
+                http_fetcher.fetch_page(
+                    url,
+                    etag=cached_page.etag if cached_page else None,
+                    last_modified=cached_page.last_modified if cached_page else None,
+                ),
+                timeout=deadline.timeout(10)  # 10 seconds timeout for fetching
+            )
+        except asyncio.TimeoutError:
+            STAGE_TIMEOUTS.labels("download").inc()
+            raise
+        if page is None:
+            return None
+
+        # Unchanged, no download and no extraction
+        if page.not_modified:
+            logger.info(f"Page {url} not modified since {cached_page.fetched_at}")
+            revalidated_page = cached_page.model_copy(update={"validated_at": fetched_at, "etag": page.etag, "last_modified": page.last_modified})
+            revalidated_page._from_store = False
+            return revalidated_page
+
+        # Extract in the process pool, which enforces its own timeout, unless there is no time left for it
+        if deadline.expired():
+            raise asyncio.TimeoutError(f"No time left to extract {url}")
+        details = await extraction_client.extract(page.content)
+        if not details:
+            return None
+
+        return PageDetails(details=details, fetched_at=fetched_at, validated_at=fetched_at, etag=page.etag, last_modified=page.last_modified)
+
+
+    async def _fetch_details_for_result(self, query: str, result: SearchResult, page: Awaitable[Optional[PageDetails]], sumup_page_timeout: int, report: Optional[Dict[str, int]] = None, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> bool:
+        stage = "page"
+        try:
+            start_time = time.time()
+
+            # Each stage gets what remains of the request deadline
+            result._page = await asyncio.wait_for(page, timeout=deadline.timeout())
+            result.details = result._page.details if result._page else None
+
+            logger.info(f"Fetched details for {result.url} in {time.time() - start_time:.2f} seconds")
+            start_time = time.time()
+
+            # Generate concise answer with timeout, unless this page already answered the same (or a similar) query
+            stage = "llm"
+            result.answer = await asyncio.wait_for(
+                self._summarize_page(query, result, report, deadline, priority),
+                timeout=deadline.timeout(sumup_page_timeout)  # sumup_page_timeout seconds timeout for LLM
+            )
+
+            logger.info(f"Generated concise answer for {result.url} in {time.time() - start_time:.2f} seconds")
+            return True
+
+        except asyncio.TimeoutError:
+            if stage == "llm":
+                STAGE_TIMEOUTS.labels("llm").inc()
+            logger.warning(f"Timeout while processing {result.url}")
+            return False
+        except Exception as e:
+            logger.error(f"Error fetching details for {result.url}: {e}")
+            return False
+
+    async def _summarize_page(self, query: str, result: SearchResult, report: Optional[Dict[str, int]] = None, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> str:
+        # Answers are cached per page content: the truncated details, or the whole page when the prompt gets
+        # the chunks relevant to the query, which are only selected on a miss
+        if chunk_selector.enabled:
+            cache_details, prompt_details = result.details, None
+        else:
+            cache_details = prompt_details = await llm_client.truncate_details(result.details)
+
+        if SUMMARY_CACHE_ENABLED:
+            answer = await self._get_cached_answer(query, result.url, cache_details, report, deadline)
+            if answer:
+                return answer
+
+        if prompt_details is None:
+            prompt_details = await chunk_selector.select(query, result.details, MAX_PAGE_DETAILS_LENGTH, deadline)
+
+        answer = await llm_client.summarize_page(query, result, truncated_details=prompt_details, deadline=deadline, priority=priority)
+        if SUMMARY_CACHE_ENABLED:
+            asyncio.create_task(self._cache_answer(query, result.url, cache_details, answer))
+
+        return answer
+
+    async def _get_cached_answer(self, query: str, url: str, details: Optional[str], report: Optional[Dict[str, int]] = None, deadline: Deadline = NO_DEADLINE) -> Optional[str]:
+        # A cache error or a slow cache is a miss, it never fails the result
+        try:
+            answer = await asyncio.wait_for(
+                summary_cache_client.get(query, url, details, deadline=deadline),
+                timeout=deadline.timeout(1)  # 1 second timeout for cache lookup
+            )
+        except Exception as e:
+            logger.warning(f"Error looking up cached answer for {url}: {e!r}")
+            answer = None
+
+        record_cache_lookup("answer", bool(answer))
+        if report is not None:
+            report["hits" if answer else "misses"] += 1
+
+        return answer
+
+    async def _cache_answer(self, query: str, url: str, details: Optional[str], answer: str):
+        try:
+            await summary_cache_client.set(query, url, details, answer)
+        except Exception as e:
+            logger.error(f"Error caching answer for {url}: {e}")
+
+    @staticmethod
+    def _new_summary_cache_report() -> Dict[str, int]:
+        return {"hits": 0, "misses": 0}
+
+    async def fetch_details_and_generate_consise_answer(self, query: str, results_without_details: List[SearchResult], sumup_page_timeout: int, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> List[SearchResult]:
+        cached_details_by_url = await self._lookup_cached_details(query, [result.url for result in results_without_details], deadline)
 
         # Create tasks with gather and return_exceptions=True to handle failures
-        tasks = [fetch_details_for_result(result) for result in results_without_details]
+        report = self._new_summary_cache_report()
+        tasks = [
+            self._fetch_details_for_result(query, result, self._get_details(result.url, cached_details_by_url.get(result.url), deadline), sumup_page_timeout, report, deadline, priority)
+            for result in results_without_details
+        ]
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
         # Filter out failed results
@@ -92,4 +605,64 @@ class SearchProvider(ABC):
         ]
 
         logger.info(f"Successfully processed {len(successful_results)} out of {len(results_without_details)} results")
-        return successful_results
\ No newline at end of file
+        logger.info(f"Answer cache for '{query}': {report['hits']} hits, {report['misses']} misses")
+        return successful_results
+
+    async def fetch_first_details_and_generate_consise_answer(self, query: str, candidates: List[SearchResult], sumup_page_timeout: int, num_results: int, result_order: Literal["rank", "completion"] = "rank", deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> List[SearchResult]:
+        """
+        Process every candidate concurrently and return as soon as `num_results` of them succeed, cancelling the others.
+        A result whose page could not be fetched (only its snippet was summarized) doesn't count: it is only returned,
+        after the others, when there aren't enough results with details. Results are in provider rank or completion order.
+        """
+        completed, without_details = [], []
+        results = self.iter_details_and_generate_consise_answer(query, candidates, sumup_page_timeout, deadline=deadline, priority=priority)
+        try:
+            async for result in results:
+                (completed if result.details else without_details).append(result)
+                if len(completed) >= num_results:
+                    break
+        finally:
+            await results.aclose()
+
+        logger.info(f"Got {len(completed)} results with details out of {len(candidates)} candidates for '{query}'")
+
+        if result_order == "rank":
+            rank = {id(result): index for index, result in enumerate(candidates)}
+            completed.sort(key=lambda result: rank[id(result)])
+            without_details.sort(key=lambda result: rank[id(result)])
+
+        return (completed + without_details)[:num_results]
+
+    async def iter_details_and_generate_consise_answer(self, query: str, results_without_details: List[SearchResult], sumup_page_timeout: int, report: Optional[Dict[str, int]] = None, deadline: Deadline = NO_DEADLINE, priority: Priority = "interactive") -> AsyncIterator[SearchResult]:
+        """
+        Same as fetch_details_and_generate_consise_answer, but yields each successful result as soon as it completes.
+        Answer cache hits and misses are counted into `report` when given.
+        """
+        if report is None:
+            report = self._new_summary_cache_report()
+
+        cached_details_by_url = await self._lookup_cached_details(query, [result.url for result in results_without_details], deadline)
+
+        tasks = {
+            asyncio.create_task(
+                self._fetch_details_for_result(query, result, self._get_details(result.url, cached_details_by_url.get(result.url), deadline), sumup_page_timeout, report, deadline, priority)
+            ): result
+            for result in results_without_details
+        }
+
+        num_successful = 0
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result():
+                        num_successful += 1
+                        yield tasks[task]
+        finally:
+            # the consumer went away (e.g. the client disconnected), stop the remaining work
+            for task in pending:
+                task.cancel()
+
+        logger.info(f"Successfully processed {num_successful} out of {len(results_without_details)} results")
+        logger.info(f"Answer cache for '{query}': {report['hits']} hits, {report['misses']} misses")
@@ -1,40 +1,21 @@
-import asyncio
-
-import httpx
-
-from schemas import SearchResponse, SearchResult
+from schemas import SearchResult
 from ..providers.base import SearchProvider
-
-from logs import logger
-import time
+from clients import http_fetcher
 
 
 class SearxngSearchProvider(SearchProvider):
+    name = "searxng"
+
     def __init__(self, host: str):
         self.host = host
-    
-    async def search(self, query: str, max_num_result: int) -> SearchResponse:
-
-        start_time = time.time()
-
-        # Get link results
-        async with httpx.AsyncClient() as client:
-            link_results = await self.get_link_results(client, query, num_results=max_num_result)
-
-        logger.info(f"Search links for '{query}' returned {len(link_results)} links in {time.time() - start_time:.2f} seconds")
-
-        # Fetch details for each result
-        if link_results:
-            link_results = await self.fetch_details_and_generate_consise_answer(query, link_results)
-
-        return SearchResponse(query=query, results=link_results)
 
     async def get_link_results(
-        self, client: httpx.AsyncClient, query: str, num_results: int
+        self, query: str, num_results: int, newest_first: bool = False
     ) -> list[SearchResult]:
-        response = await client.get(
+        response = await http_fetcher.get(
             f"{self.host}/search",
             params={"q": query, "format": "json"},
+            limit_per_host=False,
         )
         results = response.json()
 
@@ -48,11 +29,12 @@ class SearxngSearchProvider(SearchProvider):
         ]
 
     async def get_image_results(
-        self, client: httpx.AsyncClient, query: str, num_results: int = 4
+        self, query: str, num_results: int = 4
     ) -> list[str]:
-        response = await client.get(
+        response = await http_fetcher.get(
             f"{self.host}/search",
             params={"q": query, "format": "json", "categories": "images"},
+            limit_per_host=False,
         )
         results = response.json()
         return [result["img_src"] for result in results["results"][:num_results]]
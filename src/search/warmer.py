@@ -0,0 +1,105 @@
+import asyncio
+from typing import Dict, Optional
+
+from clients import short_term_cache_client
+from logs import logger
+
+from .providers import SearchProvider
+
+
+class CacheWarmer:
+    """
+    Keeps the popular queries of the query cache fresh. Every `interval` seconds it flushes the hits counted
+    on the local cache, then looks for the entries expiring within `refresh_ahead` seconds which were hit at
+    least `min_hits` times, and searches them again in the background with the provider and parameters they
+    were cached with. Refreshes are deduplicated across the workers by a lease on the entry.
+    Parameters:
+        providers (Dict[str, SearchProvider]): Registered search providers, by name
+        interval (float): Seconds between two scans of the query cache
+        refresh_ahead (float): Seconds before its expiry an entry is refreshed
+        min_hits (int): Minimum hits of an entry to be refreshed
+        batch_size (int): Maximum number of entries refreshed per scan
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, SearchProvider],
+        interval: float = 30,
+        refresh_ahead: float = 120,
+        min_hits: int = 3,
+        batch_size: int = 100,
+    ):
+        self.providers = providers
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.min_hits = min_hits
+        self.batch_size = batch_size
+
+        self._task: Optional[asyncio.Task] = None
+
+        self.scans = 0
+        self.candidates = 0
+        self.scheduled = 0
+        self.errors = 0
+
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.scan()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error scanning the query cache for refreshes: {e}")
+
+
+    async def scan(self) -> int:
+        """
+        Schedule the refresh of the popular entries about to expire, returns how many were scheduled.
+        """
+        self.scans += 1
+
+        # the hits of the local cache first, so they count in this scan
+        await short_term_cache_client.flush_hits()
+        candidates = await short_term_cache_client.refresh_candidates(self.refresh_ahead, self.min_hits, limit=self.batch_size)
+        self.candidates += len(candidates)
+
+        scheduled = 0
+        for key, query, search_params in candidates:
+            provider = self.providers.get(search_params.get("provider"))
+            if provider is None:
+                continue
+            provider.refresh_in_background(query, key, search_params)
+            scheduled += 1
+
+        self.scheduled += scheduled
+        if scheduled:
+            logger.info(f"Scheduled the refresh of {scheduled} cached searches")
+        return scheduled
+
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "scans": self.scans,
+            "candidates": self.candidates,
+            "scheduled": self.scheduled,
+            "errors": self.errors,
+        }
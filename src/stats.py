@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class LatencyStats:
+    """
+    Running latency statistics for a single operation.
+    Keeps count, total, max and last duration (in seconds) without storing samples,
+    so it is cheap enough to record on every call.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, duration: float, error: bool = False):
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        if duration > self.max:
+            self.max = duration
+        if error:
+            self.errors += 1
+
+    @contextmanager
+    def measure(self):
+        start_time = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(time.perf_counter() - start_time, error=error)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "last_ms": round(self.last * 1000, 3),
+        }
+
+
+class LatencyWindow:
+    """
+    Latencies of the last `size` calls of an operation, for percentiles which follow recent behaviour
+    (e.g. the hedge delay of a search provider). The calls which fail are recorded too, leaving out the slow
+    failures (e.g. timeouts) would make the operation look faster. Cancelled calls (e.g. the loser of a hedged
+    request) are not: they were stopped, not done.
+    Parameters:
+        size (int): Number of recent samples kept
+    """
+
+    def __init__(self, size: int = 256):
+        self.samples: deque = deque(maxlen=size)
+
+    def record(self, duration: float):
+        self.samples.append(duration)
+
+    @contextmanager
+    def measure(self):
+        start_time = time.perf_counter()
+        cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if not cancelled:
+                self.record(time.perf_counter() - start_time)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "samples": len(self.samples),
+            "p50_ms": round((self.percentile(50) or 0.0) * 1000, 3),
+            "p90_ms": round((self.percentile(90) or 0.0) * 1000, 3),
+            "p99_ms": round((self.percentile(99) or 0.0) * 1000, 3),
+        }
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import time
+from typing import Optional
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for exact-match lookups: case-folded, with whitespace collapsed.
+    """
+    return " ".join(query.casefold().split())
+
+
+def make_key(*parts) -> str:
+    """
+    Build a stable key from JSON-serializable parts, identical across processes and restarts.
+    """
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class Deadline:
+    """
+    The point in time a request must be answered by, passed down the pipeline so each stage gets what remains.
+    A deadline without a budget never expires.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds is not None else None
+
+    @classmethod
+    def from_ms(cls, milliseconds: Optional[float]) -> "Deadline":
+        return cls(milliseconds / 1000 if milliseconds is not None else None)
+
+    def remaining(self) -> Optional[float]:
+        """
+        Seconds left (never negative), or None without a budget.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """
+        Timeout for a stage: the time left, at most `cap` seconds (None if neither bounds it, as `asyncio.wait_for` expects).
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if cap is None:
+            return remaining
+        return min(remaining, cap)
+
+
+NO_DEADLINE = Deadline()
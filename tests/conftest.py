@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# read by constants.py when `clients` is imported: the clients are created (without connecting) and the
+# tests give the ones they exercise in-memory Redis and Mongo instead
+os.environ.update({
+    "LLM_URL": "http://127.0.0.1:1/v1",
+    "LLM_API_KEY": "test",
+    "LLM_MODEL_NAME": "test-llm",
+    "EMBEDDING_URL": "http://127.0.0.1:1/v1",
+    "EMBEDDING_API_KEY": "test",
+    "REDIS_URL": "redis://127.0.0.1:1/0",
+    "MONGO_URL": "mongodb://127.0.0.1:1",
+    "MONGO_DB_NAME": "titan_sight_test",
+    "MONGO_COLLECTION_NAME": "pages",
+    "NUM_WORKERS": "1",
+})
+os.environ.setdefault("LLM_BASE_MODEL_NAME", "gpt-4o")
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+# one token per byte: offline, tiktoken can't download its vocabulary, count bytes instead, as the benchmarks do
+import tiktoken
+
+BYTES_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+
+try:
+    tiktoken.encoding_for_model(os.environ["LLM_BASE_MODEL_NAME"])
+except Exception:
+    tiktoken.encoding_for_model = lambda model_name: BYTES_ENCODING
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def redis_client():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.fixture
+def llm_client():
+    # token counts don't depend on the vocabulary tiktoken can load
+    from clients.llm_clients import LLMClient
+
+    client = LLMClient("http://127.0.0.1:1/v1", "test", "test-llm", "gpt-4o")
+    client.tokenizer = BYTES_ENCODING
+    return client
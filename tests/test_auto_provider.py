@@ -0,0 +1,148 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import pytest
+
+from clients.cache_clients import SerpCacheClient
+from schemas import SearchResult
+from search.providers import base
+from search.providers.auto import AutoSearchProvider
+from search.providers.base import SearchProvider
+from stats import LatencyWindow
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeProvider(SearchProvider):
+    def __init__(self, name: str, urls: List[str], delay: float = 0, error: Optional[Exception] = None):
+        self.name = name
+        self.urls = urls
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    async def get_link_results(self, query: str, num_results: int, newest_first: bool = False) -> List[SearchResult]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return [SearchResult(title=f"{self.name} {i}", url=url, content="") for i, url in enumerate(self.urls[:num_results])]
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch, redis_client):
+    # no SERP cache between the calls, and fresh latency windows
+    monkeypatch.setattr(base, "serp_cache_client", SerpCacheClient(redis_client, default_expire_time=0))
+    base.serp_latencies.clear()
+    yield
+    base.serp_latencies.clear()
+
+
+def urls(prefix: str, count: int = 3) -> List[str]:
+    return [f"https://{prefix}.com/{i}" for i in range(count)]
+
+
+async def test_fast_primary_isnt_hedged():
+    primary, secondary = FakeProvider("primary", urls("a")), FakeProvider("secondary", urls("b"))
+    auto = AutoSearchProvider([primary, secondary], default_delay=0.2)
+
+    links = await auto.get_link_results("query", 3)
+
+    assert [link.url for link in links] == urls("a")
+    assert secondary.calls == 0
+    assert auto.stats()["hedged"] == 0
+
+
+async def test_slow_primary_is_hedged():
+    primary, secondary = FakeProvider("primary", urls("a"), delay=5), FakeProvider("secondary", urls("b"), delay=0.05)
+    auto = AutoSearchProvider([primary, secondary], default_delay=0.1)
+
+    start_time = time.monotonic()
+    links = await auto.get_link_results("query", 3)
+
+    assert [link.url for link in links] == urls("b")
+    assert time.monotonic() - start_time < 1
+    assert (auto.hedged, auto.hedge_wins) == (1, 1)
+    # the loser is cancelled, and left out of the latency of its provider
+    await asyncio.sleep(0)
+    assert primary.cancelled == 1
+    assert len(base.serp_latencies["primary"].samples) == 0
+    assert len(base.serp_latencies["secondary"].samples) == 1
+
+
+@pytest.mark.parametrize("primary", [
+    FakeProvider("primary", urls("a"), error=ConnectionError("provider down")),
+    FakeProvider("primary", []),
+])
+async def test_failed_or_empty_primary_hands_over_right_away(primary):
+    secondary = FakeProvider("secondary", urls("b"))
+    auto = AutoSearchProvider([primary, secondary], default_delay=5)
+
+    links = await asyncio.wait_for(auto.get_link_results("query", 3), timeout=1)
+
+    assert [link.url for link in links] == urls("b")
+    assert auto.hedged == 0
+
+
+async def test_failed_call_is_in_the_latency_window():
+    primary = FakeProvider("primary", urls("a"), delay=0.05, error=ConnectionError("provider down"))
+    auto = AutoSearchProvider([primary, FakeProvider("secondary", urls("b"))])
+
+    await auto.get_link_results("query", 3)
+
+    assert base.serp_latencies["primary"].samples[0] >= 0.05
+
+
+async def test_every_provider_fails():
+    auto = AutoSearchProvider([FakeProvider("primary", []), FakeProvider("secondary", urls("b"), error=ValueError())])
+
+    assert await auto.get_link_results("query", 3) == []
+    assert auto.failures == 1
+
+
+async def test_merge_the_lists_which_arrive_in_time():
+    primary = FakeProvider("primary", ["https://a.com/1", "https://www.shared.com/page/", "https://a.com/2"], delay=0.2)
+    secondary = FakeProvider("secondary", ["https://shared.com/page", "https://b.com/1"], delay=0.05)
+    late = FakeProvider("late", ["https://c.com/1"], delay=5)
+    auto = AutoSearchProvider([primary, secondary, late], default_delay=0.01, merge=True, merge_wait=0.5)
+
+    links = await auto.get_link_results("query", 10)
+
+    # by rank, the preferred provider first, the same page once
+    assert [link.url for link in links] == ["https://a.com/1", "https://shared.com/page", "https://b.com/1", "https://a.com/2"]
+    assert auto.merged == 1
+    assert late.calls == 0
+
+
+def test_merge_keeps_num_results():
+    lists = [
+        [SearchResult(title="", url=url, content="") for url in urls("a")],
+        [SearchResult(title="", url=url, content="") for url in urls("b")],
+    ]
+
+    merged = AutoSearchProvider._merge(lists, 4)
+
+    assert [link.url for link in merged] == ["https://a.com/0", "https://b.com/0", "https://a.com/1", "https://b.com/1"]
+
+
+def test_hedge_delay_follows_the_primary_latency():
+    primary = FakeProvider("primary", urls("a"))
+    auto = AutoSearchProvider([primary], hedge_percentile=90, min_delay=0.2, max_delay=3, default_delay=1, min_samples=10)
+
+    assert auto.hedge_delay(primary) == 1
+
+    window = base.serp_latencies.setdefault("primary", LatencyWindow())
+    for i in range(10):
+        window.record(0.1 * (i + 1))
+    assert auto.hedge_delay(primary) == pytest.approx(1.0)
+
+    for _ in range(100):
+        window.record(10)
+    assert auto.hedge_delay(primary) == 3
@@ -0,0 +1,279 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import redis.asyncio as redis
+
+from clients import cache_clients
+from clients.cache_clients import LocalCacheClient, LongTermCacheClient, SerpCacheClient
+from schemas import PageDetails, SearchResponse, SearchResult
+
+
+pytestmark = pytest.mark.anyio
+
+
+def links(count: int, prefix: str = "page"):
+    return [SearchResult(title=f"{prefix} {i}", url=f"https://example.com/{prefix}/{i}", content=f"snippet {i}") for i in range(count)]
+
+
+# Local cache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_clients.time, "monotonic", lambda: now[0])
+    return now
+
+
+def response(query: str, num_results: int = 3) -> SearchResponse:
+    return SearchResponse(query=query, results=links(num_results, prefix=query))
+
+
+def test_local_cache_hit_then_expired(clock):
+    cache = LocalCacheClient(max_entries=10, max_bytes=1 << 20, ttl=60)
+    cache.set("key", response("query"))
+
+    assert cache.get("key").query == "query"
+    clock[0] += 61
+    assert cache.get("key") is None
+    assert cache.get("other") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "entries": 0, "bytes": 0}
+
+
+def test_local_cache_never_outlives_the_redis_entry(clock):
+    cache = LocalCacheClient(max_entries=10, max_bytes=1 << 20, ttl=60)
+    cache.set("key", response("query"), ttl=5)
+    cache.set("expired", response("query"), ttl=0)
+
+    clock[0] += 6
+    assert cache.get("key") is None
+    assert "expired" not in cache._entries
+
+
+def test_local_cache_evicts_the_least_recently_used(clock):
+    cache = LocalCacheClient(max_entries=2, max_bytes=1 << 20, ttl=60)
+    cache.set("a", response("a"))
+    cache.set("b", response("b"))
+    cache.get("a")
+    cache.set("c", response("c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_local_cache_bytes_budget(clock):
+    size = len(response("a").model_dump_json())
+    cache = LocalCacheClient(max_entries=10, max_bytes=2 * size, ttl=60)
+    for key in ["a", "b", "c"]:
+        cache.set(key, response(key))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.size <= 2 * size
+    # bigger than the whole budget: not cached
+    cache.set("big", response("big", num_results=50))
+    assert cache.get("big") is None
+
+
+def test_local_cache_replaced_entry_is_counted_once(clock):
+    cache = LocalCacheClient(max_entries=10, max_bytes=1 << 20, ttl=60)
+    cache.set("key", response("query"))
+    cache.set("key", response("query", num_results=1))
+
+    assert cache.stats()["entries"] == 1
+    assert cache.size == len(response("query", num_results=1).model_dump_json())
+
+
+# SERP cache
+
+async def test_serp_cache_miss_then_hit(redis_client):
+    cache = SerpCacheClient(redis_client, num_results=10)
+
+    assert await cache.get("google", "Python asyncio", 5, False) is None
+    await cache.set("google", "Python asyncio", False, links(10), complete=False)
+
+    results = await cache.get("google", "  python   ASYNCIO ", 5, False)
+    assert [result.url for result in results] == [result.url for result in links(5)]
+    assert (cache.hits, cache.misses, cache.stored) == (1, 1, 1)
+
+
+async def test_serp_cache_serves_up_to_the_number_stored(redis_client):
+    cache = SerpCacheClient(redis_client)
+    await cache.set("google", "query", False, links(10), complete=False)
+
+    assert len(await cache.get("google", "query", 10, False)) == 10
+    # the provider may have more links than were stored
+    assert await cache.get("google", "query", 20, False) is None
+
+
+async def test_serp_cache_complete_list_serves_any_number(redis_client):
+    cache = SerpCacheClient(redis_client)
+    await cache.set("google", "rare query", False, links(3), complete=True)
+
+    assert len(await cache.get("google", "rare query", 20, False)) == 3
+
+
+async def test_serp_cache_keys(redis_client):
+    cache = SerpCacheClient(redis_client)
+    await cache.set("google", "query", False, links(10), complete=False)
+
+    assert await cache.get("google", "query", 5, True) is None
+    assert await cache.get("duckduckgo", "query", 5, False) is None
+
+
+async def test_serp_cache_expire_time_per_provider(redis_client):
+    cache = SerpCacheClient(redis_client, expire_times={"google": 86400, "searxng": 0}, default_expire_time=600)
+    await cache.set("google", "query", False, links(10), complete=False)
+    await cache.set("duckduckgo", "query", False, links(10), complete=False)
+    await cache.set("searxng", "query", False, links(10), complete=False)
+
+    assert await redis_client.ttl(cache._key("google", "query", False)) == 86400
+    assert await redis_client.ttl(cache._key("duckduckgo", "query", False)) == 600
+    assert not cache.enabled("searxng")
+    assert await redis_client.exists(cache._key("searxng", "query", False)) == 0
+    assert await cache.get("searxng", "query", 5, False) is None
+
+
+async def test_serp_cache_failing_redis_is_a_miss():
+    cache = SerpCacheClient(redis.Redis(port=1), timeout=0.5)
+
+    await cache.set("google", "query", False, links(10), complete=False)
+    assert await cache.get("google", "query", 5, False) is None
+    assert cache.misses == 1
+
+
+# Long-term cache (page store)
+
+@pytest.fixture
+def page_store():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+
+    def make(**kwargs) -> LongTermCacheClient:
+        kwargs.setdefault("dict_size", 0)
+        kwargs.setdefault("sweep_interval", 0)
+        store = LongTermCacheClient("mongodb://127.0.0.1:1", "titan_sight_test", "pages", **kwargs)
+        db = mongomock_motor.AsyncMongoMockClient()["titan_sight_test"]
+        store.collection, store.contents, store.dictionaries = db["pages"], db["pages_contents"], db["pages_dictionaries"]
+        return store
+
+    return make
+
+
+async def test_set_pages_round_trip(page_store):
+    store = page_store()
+    await store.set_pages({
+        "https://a.com": PageDetails(details="first page", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT"),
+        "https://b.com": PageDetails(details="second page"),
+    })
+
+    pages = await store.get_pages(["https://a.com", "https://b.com", "https://c.com"])
+
+    assert pages["https://a.com"].details == "first page"
+    assert pages["https://a.com"].etag == '"v1"'
+    assert pages["https://a.com"].fetched_at is not None
+    assert pages["https://b.com"].details == "second page"
+    assert "https://c.com" not in pages
+    assert (store.hits, store.misses) == (2, 1)
+
+
+async def test_set_pages_deduplicates_contents(page_store):
+    store = page_store()
+    await store.set_pages({"https://a.com": PageDetails(details="same"), "https://b.com": PageDetails(details="same")})
+
+    assert await store.collection.count_documents({}) == 2
+    assert await store.contents.count_documents({}) == 1
+    assert store.deduplicated == 1
+
+
+async def test_set_pages_deletes_replaced_contents(page_store):
+    store = page_store()
+    await store.set_pages({"https://a.com": PageDetails(details="old"), "https://b.com": PageDetails(details="old")})
+    await store.contents.update_many({}, {"$unset": {"written_at": ""}})
+
+    # still used by b.com
+    await store.set_pages({"https://a.com": PageDetails(details="new")})
+    assert await store.contents.count_documents({}) == 2
+
+    await store.set_pages({"https://b.com": PageDetails(details="new")})
+    assert await store.contents.count_documents({}) == 1
+    assert store.orphans_deleted == 1
+    assert (await store.get("https://b.com")) == "new"
+
+
+async def test_recently_written_contents_are_not_orphans(page_store):
+    store = page_store()
+    await store.set_pages({"https://a.com": PageDetails(details="old")})
+    await store.set_pages({"https://a.com": PageDetails(details="new")})
+
+    # the old content was written a moment ago, a page pointing to it may still be on its way
+    assert await store.contents.count_documents({}) == 2
+
+
+async def test_sweep_deletes_unreferenced_contents(page_store):
+    store = page_store(sweep_interval=1)
+    await store.set_pages({"https://a.com": PageDetails(details="kept")})
+    await store.contents.insert_one({"_id": "orphan", "data": b"", "dict_id": 0, "size": 0, "compressed_size": 0})
+
+    store._last_sweep = time.monotonic() - 2
+    await store.set_pages({"https://b.com": PageDetails(details="other")})
+
+    assert await store.contents.find_one({"_id": "orphan"}) is None
+    assert await store.contents.count_documents({}) == 2
+
+
+async def test_evict_least_recently_validated(page_store):
+    store = page_store(max_pages=2)
+    store._last_eviction = time.monotonic()
+    for i in range(4):
+        await store.set_pages({f"https://{i}.com": PageDetails(details=f"page {i}")})
+    await store.contents.update_many({}, {"$unset": {"written_at": ""}})
+
+    store._last_eviction = 0
+    await store._evict()
+
+    assert sorted(doc["url"] for doc in await store.collection.find({}).to_list(None)) == ["https://2.com", "https://3.com"]
+    assert await store.contents.count_documents({}) == 2
+    assert store.evicted == 2
+
+
+async def test_expired_pages_are_misses(page_store):
+    store = page_store(ttl=60)
+    await store.set_pages({"https://a.com": PageDetails(details="page")})
+    await store.collection.update_many({}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+    # before the TTL monitor removes it
+    assert await store.get_pages(["https://a.com"]) == {}
+    assert store.misses == 1
+
+
+async def test_dictionary_compression(page_store):
+    store = page_store(dict_size=1024, dict_samples=50)
+    pages = {f"https://example.com/{i}": PageDetails(details=f"Example page {i}. " + "Lorem ipsum dolor sit amet. " * 20) for i in range(50)}
+    await store.set_pages(pages)
+    # trained in the background
+    while store._training:
+        await asyncio.sleep(0.01)
+
+    assert store._dict_id
+    await store.set_pages({"https://example.com/new": PageDetails(details="Another page. " + "Lorem ipsum dolor sit amet. " * 20)})
+    assert (await store.get("https://example.com/new")).startswith("Another page.")
+    assert (await store.get("https://example.com/0")).startswith("Example page 0.")
+
+
+async def test_concurrent_round_trips(page_store):
+    store = page_store(dict_size=1024, dict_samples=50)
+    await store.set_pages({f"https://example.com/{i}": PageDetails(details=f"Example page {i}. " + "Lorem ipsum dolor sit amet. " * 20) for i in range(50)})
+    while store._training:
+        await asyncio.sleep(0.01)
+
+    # the worker threads compress and decompress at the same time
+    batches = [
+        {f"https://example.com/{batch}/{i}": PageDetails(details=f"Page {batch}/{i}. " + "Lorem ipsum dolor sit amet. " * 200) for i in range(20)}
+        for batch in range(16)
+    ]
+    await asyncio.gather(*[store.set_pages(batch) for batch in batches])
+    results = await asyncio.gather(*[store.get_pages(list(batch)) for batch in batches] * 2)
+
+    for batch, pages in zip(batches * 2, results):
+        assert {url: page.details for url, page in pages.items()} == {url: page.details for url, page in batch.items()}
@@ -0,0 +1,121 @@
+import pytest
+
+from clients.chunking_clients import ChunkSelector
+
+
+pytestmark = pytest.mark.anyio
+
+
+FILLER = "The weather was mild and the market was quiet that day."
+
+
+class FakeEmbeddingClient:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.texts = []
+
+    async def get_embedding(self, text: str, cache: bool = True):
+        self.texts.append(text)
+        if self.fail:
+            raise ConnectionError("embedding server down")
+        return [1.0, 0.0] if "asyncio" in text.lower() else [0.0, 1.0]
+
+
+@pytest.fixture
+def selector(llm_client):
+    def make(embedding_client=None, **kwargs) -> ChunkSelector:
+        return ChunkSelector(llm_client, embedding_client or FakeEmbeddingClient(), **kwargs)
+
+    return make
+
+
+def page(relevant_at: int, num_lines: int = 40) -> str:
+    lines = [f"{i}. {FILLER}" for i in range(num_lines)]
+    lines[relevant_at] = "Python asyncio runs coroutines on an event loop, asyncio tasks wrap them."
+    return "\n".join(lines)
+
+
+def test_split_groups_lines_up_to_the_chunk_size(selector):
+    chunks = selector(chunk_tokens=200)._split(page(0))
+
+    assert all(num_tokens <= 200 for _, num_tokens in chunks)
+    assert all(num_tokens == len(chunk.replace("\n", "").encode()) for chunk, num_tokens in chunks)
+    assert "\n".join(chunk for chunk, _ in chunks) == page(0)
+
+
+def test_split_matches_line_by_line_counts(selector):
+    details = "Première ligne, accentuée\n\n" + page(3) + "\n  \nx" + "y" * 500
+    chunk_selector = selector(chunk_tokens=150)
+
+    chunks = chunk_selector._split(details)
+    # as without offsets (slow tokenizers)
+    chunk_selector.llm_client.token_offsets = lambda text: None
+
+    assert chunk_selector._split(details) == chunks
+    # a line longer than a chunk is a chunk on its own
+    assert chunks[-1] == ("x" + "y" * 500, 501)
+
+
+def test_split_stops_at_max_chunks(selector):
+    assert len(selector(chunk_tokens=60, max_chunks=5)._split(page(0))) == 5
+
+
+def test_bm25_ranks_the_chunk_with_the_query_terms_first(selector):
+    scores = ChunkSelector._bm25("python asyncio", ["the market was quiet", "python asyncio event loop", "python"])
+
+    assert scores.argmax() == 1
+    assert scores[0] == 0
+
+
+async def test_short_details_are_kept(selector):
+    assert await selector(method="bm25").select("python asyncio", "short page", 100) == "short page"
+
+
+async def test_bm25_selects_the_relevant_part(selector):
+    chunk_selector = selector(method="bm25", chunk_tokens=150)
+
+    selected = await chunk_selector.select("python asyncio", page(30), 400)
+
+    assert "Python asyncio runs coroutines" in selected
+    assert selected.startswith("0. ")
+    # the chunks in between are left out
+    assert "\n[...]\n" in selected
+    assert chunk_selector.llm_client.num_tokens(selected.replace("\n[...]\n", "\n")) <= 400
+    assert chunk_selector.stats()["selected_pages"] == 1
+
+
+async def test_embedding_selects_the_relevant_part(selector):
+    chunk_selector = selector(method="embedding", chunk_tokens=150)
+
+    selected = await chunk_selector.select("asyncio", page(30), 150)
+
+    assert "Python asyncio runs coroutines" in selected
+
+
+async def test_failing_embeddings_fall_back_to_the_first_tokens(selector):
+    chunk_selector = selector(FakeEmbeddingClient(fail=True), method="embedding", chunk_tokens=150)
+
+    selected = await chunk_selector.select("asyncio", page(30), 150)
+
+    assert selected == chunk_selector.llm_client.truncate_to_tokens(page(30), 150)
+    assert chunk_selector.embedding_fallbacks == 1
+
+
+async def test_failing_embeddings_fall_back_to_bm25_in_hybrid_mode(selector):
+    chunk_selector = selector(FakeEmbeddingClient(fail=True), method="hybrid", chunk_tokens=150)
+
+    selected = await chunk_selector.select("python asyncio", page(30), 150)
+
+    assert "Python asyncio runs coroutines" in selected
+    assert chunk_selector.embedding_fallbacks == 1
+
+
+async def test_hybrid_only_embeds_the_best_bm25_candidates(selector):
+    embedding_client = FakeEmbeddingClient()
+    chunk_selector = selector(embedding_client, method="hybrid", chunk_tokens=150, max_embedded_chunks=2)
+
+    selected = await chunk_selector.select("python asyncio", page(30), 150)
+
+    assert "Python asyncio runs coroutines" in selected
+    # the query and two chunks
+    assert len(embedding_client.texts) == 3
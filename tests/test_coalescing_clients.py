@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+
+from clients.cache_clients import ShortTermCacheClient
+from clients.coalescing_clients import RequestCoalescer
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def coalescer(redis_client):
+    def make(**kwargs) -> RequestCoalescer:
+        cache_client = ShortTermCacheClient("redis://127.0.0.1:1/0", expire_time=60, sim_threshold=0.95, embedding_client=None, embedding_dim=3)
+        cache_client.client = redis_client
+        kwargs.setdefault("sim_threshold", 0.95)
+        return RequestCoalescer(cache_client, **kwargs)
+
+    return make
+
+
+class Compute:
+    def __init__(self, result: str = "response", delay: float = 0.05):
+        self.result = result
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.result
+
+
+async def test_identical_requests_share_one_computation(coalescer):
+    requests = coalescer()
+    compute = Compute()
+
+    results = await asyncio.gather(*[requests.run("key", "group", None, compute) for _ in range(5)])
+
+    assert results == ["response"] * 5
+    assert compute.calls == 1
+    assert (requests.leaders, requests.coalesced) == (1, 4)
+    assert requests.stats()["inflight"] == 0
+
+
+async def test_parameter_groups_are_not_shared(coalescer):
+    requests = coalescer()
+    compute = Compute()
+
+    await asyncio.gather(requests.run("key", 3, None, compute), requests.run("key", 5, None, compute))
+
+    assert compute.calls == 2
+
+
+async def test_similar_queries_share_one_computation(coalescer):
+    requests = coalescer()
+    compute = Compute()
+
+    await asyncio.gather(
+        requests.run("python asyncio", "group", [1.0, 0.0, 0.0], compute),
+        requests.run("asyncio in python", "group", [0.99, 0.05, 0.0], compute),
+        requests.run("rust tokio", "group", [0.0, 1.0, 0.0], compute),
+        requests.run("tokio for rust", "other group", [0.0, 1.0, 0.0], compute),
+    )
+
+    assert compute.calls == 3
+    assert requests.semantic_coalesced == 1
+
+
+async def test_cancelled_caller_doesnt_cancel_the_others(coalescer):
+    requests = coalescer()
+    compute = Compute(delay=0.1)
+
+    first = asyncio.create_task(requests.run("key", "group", None, compute))
+    second = asyncio.create_task(requests.run("key", "group", None, compute))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "response"
+    assert compute.calls == 1
+
+
+async def test_done_computation_isnt_shared(coalescer):
+    requests = coalescer()
+    compute = Compute(delay=0)
+
+    await requests.run("key", "group", None, compute)
+    await requests.run("key", "group", None, compute)
+
+    assert compute.calls == 2
+
+
+async def test_lease_is_held_by_one_worker(coalescer):
+    pytest.importorskip("lupa")
+    first, second = coalescer(), coalescer()
+
+    token = await first.acquire("search:key")
+    assert token
+    assert await second.acquire("search:key") is None
+
+    await first.release("search:key", token)
+    assert await second.acquire("search:key")
+
+
+async def test_wait_for_the_remote_result(coalescer):
+    pytest.importorskip("lupa")
+    first, second = coalescer(poll_interval=0.01), coalescer(poll_interval=0.01)
+    cache = {}
+
+    async def get_cached():
+        return cache.get("key")
+
+    token = await first.acquire("search:key")
+    waiter = asyncio.create_task(second.wait_for_remote("search:key", get_cached))
+    await asyncio.sleep(0.05)
+    cache["key"] = "response"
+    await first.release("search:key", token)
+
+    assert await waiter == "response"
+    assert second.remote_coalesced == 1
+
+
+async def test_wait_for_a_lease_times_out(coalescer):
+    first, second = coalescer(), coalescer(wait_timeout=0.05, poll_interval=0.01)
+
+    async def get_cached():
+        return "response"
+
+    await first.acquire("search:key")
+
+    assert await second.wait_for_remote("search:key", get_cached) is None
+    assert second.lease_timeouts == 1
+
+
+async def test_failing_redis_computes_locally():
+    cache_client = ShortTermCacheClient("redis://127.0.0.1:1/0", expire_time=60, sim_threshold=0.95, embedding_client=None, embedding_dim=3, socket_timeout=0.5)
+    requests = RequestCoalescer(cache_client, sim_threshold=0.95)
+
+    token = await requests.acquire("search:key")
+
+    # not None: the caller doesn't wait for another worker, it computes
+    assert token == ""
+    await requests.release("search:key", token)
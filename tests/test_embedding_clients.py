@@ -0,0 +1,113 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from clients.embedding_clients import EmbeddingClient
+
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeEmbeddings:
+    """The `embeddings` resource of the OpenAI client: one embedding per text, from its length."""
+
+    def __init__(self, fail: bool = False, drop_last: bool = False):
+        self.fail = fail
+        self.drop_last = drop_last
+        self.batches = []
+
+    async def create(self, model: str, input: list):
+        self.batches.append(list(input))
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise ConnectionError("embedding server down")
+        texts = input[:-1] if self.drop_last else input
+        return SimpleNamespace(data=[SimpleNamespace(index=index, embedding=[float(len(text)), 1.0]) for index, text in enumerate(texts)])
+
+
+@pytest.fixture
+def embedding_client():
+    def make(embeddings: FakeEmbeddings, **kwargs) -> EmbeddingClient:
+        client = EmbeddingClient("http://127.0.0.1:1/v1", "test", "test-embedding", **kwargs)
+        client.client = SimpleNamespace(embeddings=embeddings)
+        return client
+
+    return make
+
+
+async def test_concurrent_texts_are_batched(embedding_client):
+    embeddings = FakeEmbeddings()
+    client = embedding_client(embeddings, max_batch_size=32, max_wait_ms=20)
+
+    results = await asyncio.gather(*[client.get_embedding("x" * i) for i in range(1, 11)])
+
+    assert results == [[float(i), 1.0] for i in range(1, 11)]
+    assert len(embeddings.batches) == 1
+    assert client.stats()["avg_batch_size"] == 10
+
+
+async def test_full_batch_is_sent_right_away(embedding_client):
+    embeddings = FakeEmbeddings()
+    # would wait a minute for the batch to fill
+    client = embedding_client(embeddings, max_batch_size=4, max_wait_ms=60000)
+
+    await asyncio.wait_for(asyncio.gather(*[client.get_embedding(f"text {i}") for i in range(8)]), timeout=1)
+
+    assert [len(batch) for batch in embeddings.batches] == [4, 4]
+
+
+async def test_identical_texts_share_one_request(embedding_client):
+    embeddings = FakeEmbeddings()
+    client = embedding_client(embeddings)
+
+    await asyncio.gather(*[client.get_embedding("same query") for _ in range(3)])
+
+    assert embeddings.batches == [["same query"]]
+    assert client.coalesced == 2
+
+
+async def test_recent_embeddings_are_cached(embedding_client):
+    embeddings = FakeEmbeddings()
+    client = embedding_client(embeddings, cache_size=2)
+
+    await client.get_embedding("first")
+    await client.get_embedding("second")
+    assert await client.get_embedding("first") == [5.0, 1.0]
+    assert client.cache_hits == 1
+
+    # the least recently used one is evicted
+    await client.get_embedding("third")
+    await client.get_embedding("second")
+    assert len(embeddings.batches) == 4
+
+
+async def test_uncached_texts_dont_evict_the_others(embedding_client):
+    embeddings = FakeEmbeddings()
+    client = embedding_client(embeddings, cache_size=1)
+
+    await client.get_embedding("query")
+    await client.get_embedding("page chunk", cache=False)
+    await client.get_embedding("query")
+
+    assert client.cache_hits == 1
+
+
+async def test_failed_batch_fails_every_text(embedding_client):
+    client = embedding_client(FakeEmbeddings(fail=True))
+
+    results = await asyncio.gather(client.get_embedding("a"), client.get_embedding("b"), return_exceptions=True)
+
+    assert all(isinstance(result, ConnectionError) for result in results)
+    # not stuck in flight: the next call sends the text again
+    client.client.embeddings.fail = False
+    assert await client.get_embedding("a") == [1.0, 1.0]
+
+
+async def test_missing_embedding_is_an_error(embedding_client):
+    client = embedding_client(FakeEmbeddings(drop_last=True))
+
+    first, second = await asyncio.gather(client.get_embedding("a"), client.get_embedding("b"), return_exceptions=True)
+
+    assert first == [1.0, 1.0]
+    assert isinstance(second, ValueError)
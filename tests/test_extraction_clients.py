@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import extraction_worker
+from clients import extraction_clients
+from clients.extraction_clients import ExtractionClient
+
+
+pytestmark = [
+    pytest.mark.anyio,
+    # forked workers, and /proc to tell a killed process
+    pytest.mark.skipif(sys.platform != "linux", reason="Linux only"),
+]
+
+
+def run_task(task_id: int, html: bytes):
+    # in place of extraction_worker.run_task, in the (forked) worker processes
+    if extraction_worker._started is not None:
+        extraction_worker._started.put((task_id, os.getpid()))
+    if html == b"stuck":
+        time.sleep(60)
+    if html.startswith(b"slow"):
+        time.sleep(float(html[4:]))
+    if html == b"crash":
+        os._exit(1)
+    return f"{html.decode()} from {os.getpid()}", 0.0
+
+
+@pytest.fixture
+def extraction_client():
+    clients = []
+
+    def make(fake: bool = True, **kwargs) -> ExtractionClient:
+        if fake:
+            extraction_clients.run_task = run_task
+        # forked workers find the fake task in this module
+        client = ExtractionClient(start_method="fork", **kwargs)
+        clients.append(client)
+        return client
+
+    yield make
+
+    extraction_clients.run_task = extraction_worker.run_task
+    for client in clients:
+        client.close()
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # a killed child stays a zombie until the pool reaps it
+    with open(f"/proc/{pid}/stat") as stat:
+        return stat.read().split(") ")[1][0] != "Z"
+
+
+async def test_extracts_the_main_text(extraction_client):
+    client = extraction_client(fake=False, max_workers=1)
+    paragraph = "Asyncio is a library to write concurrent code using the async and await syntax. " * 5
+    html = f"<html><body><nav>Home | About</nav><article><h1>Asyncio</h1><p>{paragraph}</p></article></body></html>"
+
+    details = await client.extract(html.encode())
+
+    assert "Asyncio is a library" in details
+    assert client.stats()["extraction_time"]["count"] == 1
+
+
+async def test_empty_page(extraction_client):
+    assert await extraction_client().extract(b"") is None
+
+
+async def test_stuck_task_retires_the_pool(extraction_client):
+    client = extraction_client(max_workers=2, task_timeout=1)
+    await client.extract(b"warm")
+
+    async def slow_task_on_the_same_pool():
+        # still running when the stuck task times out
+        await asyncio.sleep(0.5)
+        return await client.extract(b"slow0.8")
+
+    stuck, slow = await asyncio.gather(client.extract(b"stuck"), slow_task_on_the_same_pool(), return_exceptions=True)
+
+    assert isinstance(stuck, asyncio.TimeoutError)
+    # the other task of the retired pool ran to its end
+    assert slow.startswith("slow0.8")
+    assert client.stats()["restarts"] == 1
+
+    # new tasks go to a fresh pool
+    assert (await client.extract(b"fresh")).startswith("fresh")
+
+    for _ in range(50):
+        if not client.stats()["retired_pools"]:
+            break
+        await asyncio.sleep(0.1)
+    assert client.stats()["retired_pools"] == 0
+
+
+async def test_stuck_process_is_killed(extraction_client):
+    client = extraction_client(max_workers=1, task_timeout=0.5)
+    pid = int((await client.extract(b"warm")).split()[-1])
+
+    with pytest.raises(asyncio.TimeoutError):
+        await client.extract(b"stuck")
+
+    for _ in range(50):
+        if not alive(pid):
+            break
+        await asyncio.sleep(0.1)
+    assert not alive(pid)
+
+
+async def test_crashed_pool_is_replaced(extraction_client):
+    client = extraction_client(max_workers=1)
+
+    # retried once on a fresh pool, which crashes as well
+    with pytest.raises(BrokenProcessPool):
+        await client.extract(b"crash")
+
+    assert client.stats()["restarts"] == 2
+    assert (await client.extract(b"next")).startswith("next")
@@ -0,0 +1,103 @@
+import pytest
+
+from clients import health_clients
+from clients.health_clients import DomainCircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(health_clients.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(health_clients.time, "time", lambda: now[0])
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=3, cooldown=60)
+
+    for _ in range(2):
+        assert breaker.allow("slow.com")
+        breaker.record_failure("slow.com")
+    assert breaker.state("slow.com") == "closed"
+
+    breaker.record_failure("slow.com")
+    assert breaker.state("slow.com") == "open"
+    assert not breaker.allow("slow.com")
+    assert breaker.allow("other.com")
+    assert breaker.stats()["opened"] == 1
+    assert breaker.stats()["skipped"] == 1
+
+
+def test_success_resets_the_failures(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=2)
+
+    breaker.record_failure("flaky.com")
+    breaker.record_success("flaky.com")
+    breaker.record_failure("flaky.com")
+
+    assert breaker.state("flaky.com") == "closed"
+
+
+def test_single_probe_after_the_cooldown(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.record_failure("down.com")
+
+    clock[0] += 61
+    assert breaker.allow("down.com")
+    assert breaker.state("down.com") == "half_open"
+    # one probe at a time
+    assert not breaker.allow("down.com")
+
+    breaker.record_success("down.com")
+    assert breaker.state("down.com") == "closed"
+    assert breaker.allow("down.com")
+
+
+def test_failed_probe_doubles_the_cooldown(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=1, cooldown=60, max_cooldown=100)
+    breaker.record_failure("down.com")
+
+    clock[0] += 61
+    assert breaker.allow("down.com")
+    breaker.record_failure("down.com")
+    assert breaker.state("down.com") == "open"
+    assert breaker.circuits()["down.com"]["retry_in"] == 100
+
+    clock[0] += 99
+    assert not breaker.allow("down.com")
+    clock[0] += 2
+    assert breaker.allow("down.com")
+
+
+def test_released_probe_lets_another_through(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=1, cooldown=60)
+    breaker.record_failure("down.com")
+
+    clock[0] += 61
+    assert breaker.allow("down.com")
+    breaker.release("down.com")
+
+    assert breaker.state("down.com") == "open"
+    assert breaker.allow("down.com")
+
+
+def test_disabled(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=0)
+
+    for _ in range(10):
+        breaker.record_failure("down.com")
+
+    assert breaker.allow("down.com")
+    assert breaker.stats()["tracked_hosts"] == 0
+
+
+def test_tracked_hosts_are_bounded(clock):
+    breaker = DomainCircuitBreaker(failure_threshold=5, max_hosts=10)
+
+    for i in range(25):
+        clock[0] += 1
+        breaker.record_failure(f"host{i}.com")
+
+    assert breaker.stats()["tracked_hosts"] <= 10
+    # the most recent failure is kept
+    assert "host24.com" in breaker.circuits()
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from clients.http_clients import HTTPFetcher
+
+
+pytestmark = pytest.mark.anyio
+
+
+PAGE = b"<html><body><p>Asyncio is a library to write concurrent code.</p></body></html>"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+
+        if self.path == "/slow":
+            with server.lock:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+            time.sleep(0.2)
+            with server.lock:
+                server.active -= 1
+            return self.send_body(PAGE)
+        if self.path == "/missing":
+            return self.send_body(b"not found", status=404)
+        if self.path == "/large":
+            return self.send_body(b"x" * 100_000)
+
+        validators = {"ETag": server.etag, "Last-Modified": server.last_modified}
+        if self.headers.get("If-None-Match") == server.etag or self.headers.get("If-Modified-Since") == server.last_modified:
+            return self.send_body(b"", validators, status=304)
+        return self.send_body(PAGE, validators)
+
+    def send_body(self, body: bytes, headers: dict = {}, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    server.lock = threading.Lock()
+    server.active = server.max_active = 0
+    server.etag = '"v1"'
+    server.last_modified = "Mon, 05 Oct 2026 10:00:00 GMT"
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+async def fetcher(monkeypatch):
+    fetchers = []
+    # straight to the local server, whatever the proxies of the environment
+    for name in ("NO_PROXY", "no_proxy"):
+        monkeypatch.setenv(name, "127.0.0.1,localhost")
+
+    def make(**kwargs) -> HTTPFetcher:
+        fetcher = HTTPFetcher(**kwargs)
+        fetchers.append(fetcher)
+        return fetcher
+
+    yield make
+
+    for fetcher in fetchers:
+        await fetcher.close()
+
+
+async def test_fetch_page_with_its_validators(server, fetcher):
+    http_fetcher = fetcher()
+
+    page = await http_fetcher.fetch_page(f"{server.url}/page")
+
+    assert page.content == PAGE
+    assert (page.etag, page.last_modified) == (server.etag, server.last_modified)
+    assert not page.not_modified
+    assert http_fetcher.stats()["bytes_downloaded"] == len(PAGE)
+    assert http_fetcher.stats()["conditional_requests"] == 0
+    assert "If-None-Match" not in server.requests[0][1]
+
+
+async def test_connections_are_reused(server, fetcher):
+    http_fetcher = fetcher()
+
+    for _ in range(3):
+        await http_fetcher.fetch_page(f"{server.url}/page")
+
+    # one connection kept alive, not one per page
+    assert len(http_fetcher.client._transport.pool.connections) == 1
+
+
+async def test_error_status_is_none(server, fetcher):
+    assert await fetcher().fetch_page(f"{server.url}/missing") is None
+
+
+async def test_large_page_is_dropped(server, fetcher):
+    http_fetcher = fetcher(max_page_bytes=10_000)
+
+    assert await http_fetcher.fetch_page(f"{server.url}/large") is None
+    assert http_fetcher.stats()["bytes_downloaded"] == 0
+
+
+async def test_requests_per_host_are_limited(server, fetcher):
+    http_fetcher = fetcher(max_connections_per_host=2)
+
+    pages = await asyncio.gather(*[http_fetcher.fetch_page(f"{server.url}/slow") for _ in range(6)])
+
+    assert all(page.content == PAGE for page in pages)
+    assert server.max_active == 2
+    # the semaphores of idle hosts are dropped
+    assert http_fetcher.stats()["active_hosts"] == 0
+
+
+async def test_api_calls_arent_limited_per_host(server, fetcher):
+    http_fetcher = fetcher(max_connections_per_host=1)
+
+    await asyncio.gather(*[http_fetcher.get(f"{server.url}/slow", limit_per_host=False) for _ in range(3)])
+
+    assert server.max_active == 3
+
+
+async def test_unchanged_page_is_not_modified(server, fetcher):
+    http_fetcher = fetcher()
+
+    page = await http_fetcher.fetch_page(f"{server.url}/page", etag='"v1"', last_modified=server.last_modified)
+
+    assert page.not_modified
+    assert page.content == b""
+    assert (page.etag, page.last_modified) == (server.etag, server.last_modified)
+    assert server.requests[0][1]["If-None-Match"] == '"v1"'
+    assert server.requests[0][1]["If-Modified-Since"] == server.last_modified
+    assert http_fetcher.stats()["conditional_requests"] == 1
+    assert http_fetcher.stats()["not_modified"] == 1
+    assert http_fetcher.stats()["bytes_downloaded"] == 0
+
+
+async def test_last_modified_alone_is_enough(server, fetcher):
+    page = await fetcher().fetch_page(f"{server.url}/page", last_modified=server.last_modified)
+
+    assert page.not_modified
+    assert "If-None-Match" not in server.requests[0][1]
+
+
+async def test_changed_page_is_downloaded_again(server, fetcher):
+    http_fetcher = fetcher()
+    server.etag = '"v2"'
+
+    page = await http_fetcher.fetch_page(f"{server.url}/page", etag='"v1"')
+
+    assert not page.not_modified
+    assert page.content == PAGE
+    assert page.etag == '"v2"'
+    assert http_fetcher.stats()["conditional_requests"] == 1
+    assert http_fetcher.stats()["not_modified"] == 0
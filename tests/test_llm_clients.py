@@ -0,0 +1,77 @@
+class SlowTokenizer:
+    """A tokenizer without offsets, one token per non-space character, decoded with a space between tokens."""
+
+    is_fast = False
+
+    def encode(self, text: str, add_special_tokens: bool = True):
+        return [ord(char) for char in text if not char.isspace()]
+
+    def decode(self, tokens):
+        return " ".join(chr(token) for token in tokens)
+
+
+def test_short_text_is_unchanged(llm_client):
+    assert llm_client.truncate_to_tokens("one line\nanother line\n", 100) == "one line\nanother line\n"
+
+
+def test_cut_at_the_last_full_line(llm_client):
+    text = "".join(f"line number {i}\n" for i in range(100))
+
+    truncated = llm_client.truncate_to_tokens(text, 50)
+
+    assert truncated == "line number 0\nline number 1\nline number 2\n"
+    assert llm_client.num_tokens(truncated) <= 50
+
+
+def test_long_first_line_is_cut_at_a_token(llm_client):
+    truncated = llm_client.truncate_to_tokens("x" * 1000 + "\nnext line", 64)
+
+    assert truncated == "x" * 64
+
+
+def test_partial_character_is_dropped(llm_client):
+    # two tokens per character: the 5th token is half of the 3rd character
+    truncated = llm_client.truncate_to_tokens("é" * 10, 5)
+
+    assert truncated == "éé"
+
+
+def test_long_page_matches_line_by_line_truncation(llm_client):
+    # much longer than the prefix tokenized first
+    lines = [f"{i} " + "word " * (i % 17) + "\n" for i in range(5000)]
+    text = "".join(lines)
+
+    expected, num_tokens = "", 0
+    for line in lines:
+        if num_tokens + llm_client.num_tokens(line) > 3000:
+            break
+        expected += line
+        num_tokens += llm_client.num_tokens(line)
+
+    assert llm_client.truncate_to_tokens(text, 3000) == expected
+
+
+def test_special_token_strings_are_plain_text(llm_client):
+    assert llm_client.truncate_to_tokens("<|endoftext|> is text\n", 100) == "<|endoftext|> is text\n"
+
+
+def test_slow_tokenizer_stays_within_the_limit(llm_client):
+    llm_client.tokenizer = SlowTokenizer()
+    text = "".join(f"line {i} of the page\n" for i in range(50))
+
+    truncated = llm_client.truncate_to_tokens(text, 40)
+
+    assert text.startswith(truncated)
+    assert truncated.endswith("\n")
+    assert len(llm_client.tokenizer.encode(truncated)) <= 40
+    # 14 tokens per line: the decoded prefix is much longer than the text it comes from, it's shortened to fit
+    assert truncated == "".join(f"line {i} of the page\n" for i in range(2))
+
+
+def test_slow_tokenizer_long_first_line(llm_client):
+    llm_client.tokenizer = SlowTokenizer()
+
+    truncated = llm_client.truncate_to_tokens("a b c d e f g h i j k l", 5)
+
+    assert len(llm_client.tokenizer.encode(truncated)) <= 5
+    assert truncated.startswith("a b c d")
@@ -0,0 +1,132 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import pytest
+
+from clients.cache_clients import NegativeCacheClient
+from clients.health_clients import DomainCircuitBreaker
+from clients.http_clients import FetchedPage
+from schemas import PageDetails, SearchResult
+from search.providers import base
+from search.providers.base import SearchProvider
+
+
+pytestmark = pytest.mark.anyio
+
+
+URL = "https://example.com/page"
+
+
+class FakeFetcher:
+    def __init__(self, changed: bool = False):
+        self.changed = changed
+        self.calls = []
+
+    async def fetch_page(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[FetchedPage]:
+        self.calls.append((etag, last_modified))
+        if etag == '"v1"' and not self.changed:
+            return FetchedPage(content=b"", etag='"v1"', last_modified=last_modified, not_modified=True)
+        return FetchedPage(content=b"<p>new details</p>", etag='"v2"')
+
+
+class FakeExtractionClient:
+    def __init__(self):
+        self.pages = []
+
+    async def extract(self, html: bytes) -> Optional[str]:
+        self.pages.append(html)
+        return "new details"
+
+
+class FakePageStore:
+    def __init__(self):
+        self.pages = {}
+
+    async def set_pages(self, pages: dict):
+        self.pages.update(pages)
+
+
+class Provider(SearchProvider):
+    name = "test"
+
+    async def get_link_results(self, query: str, num_results: int, newest_first: bool = False) -> List[SearchResult]:
+        return []
+
+
+@pytest.fixture
+def clients(monkeypatch, redis_client):
+    fetcher, extraction_client, page_store = FakeFetcher(), FakeExtractionClient(), FakePageStore()
+    monkeypatch.setattr(base, "http_fetcher", fetcher)
+    monkeypatch.setattr(base, "extraction_client", extraction_client)
+    monkeypatch.setattr(base, "long_term_cache_client", page_store)
+    monkeypatch.setattr(base, "negative_cache_client", NegativeCacheClient(redis_client))
+    monkeypatch.setattr(base, "circuit_breaker", DomainCircuitBreaker())
+    monkeypatch.setattr(base, "PAGE_FRESH_TIME", 3600)
+    monkeypatch.setattr(base, "PAGE_STALE_WHILE_REVALIDATE", 86400)
+    return fetcher, extraction_client, page_store
+
+
+def cached_page(age: timedelta) -> PageDetails:
+    validated_at = datetime.now(timezone.utc) - age
+    page = PageDetails(details="stored details", fetched_at=validated_at, validated_at=validated_at, etag='"v1"', last_modified="Mon, 05 Oct 2026 10:00:00 GMT")
+    page._from_store = True
+    return page
+
+
+async def test_fresh_page_is_served_as_is(clients):
+    fetcher, _, _ = clients
+    page = cached_page(timedelta(minutes=10))
+
+    assert await Provider()._get_details(URL, page) is page
+    assert fetcher.calls == []
+
+
+async def test_expired_unchanged_page_is_revalidated(clients):
+    fetcher, extraction_client, _ = clients
+    page = cached_page(timedelta(days=3))
+
+    revalidated = await Provider()._get_details(URL, page)
+
+    assert fetcher.calls == [('"v1"', page.last_modified)]
+    # a 304 skips the extraction, and the page is written back with its new validation time
+    assert extraction_client.pages == []
+    assert revalidated.details == "stored details"
+    assert revalidated.fetched_at == page.fetched_at
+    assert revalidated.validated_at > page.validated_at
+    assert not revalidated._from_store
+
+
+async def test_expired_changed_page_is_extracted_again(clients):
+    fetcher, extraction_client, _ = clients
+    fetcher.changed = True
+
+    revalidated = await Provider()._get_details(URL, cached_page(timedelta(days=3)))
+
+    assert extraction_client.pages == [b"<p>new details</p>"]
+    assert revalidated.details == "new details"
+    assert revalidated.etag == '"v2"'
+
+
+async def test_stale_page_is_revalidated_in_the_background(clients):
+    fetcher, _, page_store = clients
+    page = cached_page(timedelta(hours=2))
+
+    assert await Provider()._get_details(URL, page) is page
+    # one revalidation per URL at a time
+    assert await Provider()._get_details(URL, page) is page
+
+    await asyncio.gather(*base._revalidations.values())
+    assert len(fetcher.calls) == 1
+    assert page_store.pages[URL].validated_at > page.validated_at
+    assert URL not in base._revalidations
+
+
+async def test_failed_revalidation_serves_the_stored_page(clients, monkeypatch):
+    async def fetch_page(url, etag=None, last_modified=None):
+        raise ConnectionError("host down")
+
+    monkeypatch.setattr(clients[0], "fetch_page", fetch_page)
+    page = cached_page(timedelta(days=3))
+
+    assert await Provider()._get_details(URL, page) is page
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+import redis.asyncio as redis
+
+from clients.rate_limit_clients import ProviderRateLimiter, RateLimitExceededError
+from utils import Deadline
+
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def lua():
+    # the token bucket is a Lua script
+    pytest.importorskip("lupa")
+
+
+async def test_unlimited_provider_is_not_checked():
+    # no Redis behind this client: a call would fail
+    limiter = ProviderRateLimiter(redis.Redis(port=1), rates={"google": 0})
+
+    await limiter.acquire("google")
+    await limiter.acquire("duckduckgo")
+
+    assert limiter.errors == 0
+    assert limiter.stats()["providers"] == {}
+
+
+async def test_burst_then_rejected(redis_client):
+    limiter = ProviderRateLimiter(redis_client, rates={"google": 1}, burst_seconds=2, max_wait=0)
+
+    await limiter.acquire("google")
+    await limiter.acquire("google")
+    with pytest.raises(RateLimitExceededError) as error:
+        await limiter.acquire("google")
+
+    assert error.value.provider == "google"
+    assert 0 < error.value.retry_after <= 1
+    assert limiter.allowed["google"] == 2
+    assert limiter.rejected["google"] == 1
+
+
+async def test_waits_for_a_token(redis_client):
+    limiter = ProviderRateLimiter(redis_client, rates={"searxng": 20}, burst_seconds=0, max_wait=1)
+
+    await limiter.acquire("searxng")
+    await limiter.acquire("searxng")
+
+    assert limiter.allowed["searxng"] == 2
+    assert limiter.waited["searxng"] == 1
+
+
+async def test_deadline_bounds_the_wait(redis_client):
+    limiter = ProviderRateLimiter(redis_client, rates={"searxng": 1}, burst_seconds=0, max_wait=5)
+
+    await limiter.acquire("searxng")
+    with pytest.raises(RateLimitExceededError):
+        await limiter.acquire("searxng", Deadline(0.1))
+
+
+async def test_shared_between_workers(redis_client):
+    rates = {"duckduckgo": 1}
+    first = ProviderRateLimiter(redis_client, rates=rates, burst_seconds=1, max_wait=0)
+    second = ProviderRateLimiter(redis_client, rates=rates, burst_seconds=1, max_wait=0)
+
+    await first.acquire("duckduckgo")
+    with pytest.raises(RateLimitExceededError):
+        await second.acquire("duckduckgo")
+
+
+async def test_daily_quota(redis_client):
+    limiter = ProviderRateLimiter(redis_client, daily_quotas={"google": 2})
+
+    await limiter.acquire("google")
+    await limiter.acquire("google")
+    with pytest.raises(RateLimitExceededError) as error:
+        await limiter.acquire("google")
+
+    # retry once the day of the quota is over
+    assert error.value.retry_after > 60
+    assert limiter.stats()["providers"]["google"]["quota_left"] == 0
+
+
+async def test_failing_redis_lets_the_call_through():
+    limiter = ProviderRateLimiter(redis.Redis(port=1), rates={"google": 1}, timeout=0.5)
+
+    await limiter.acquire("google")
+
+    assert limiter.errors == 1
+
+
+async def test_concurrent_calls_share_the_bucket(redis_client):
+    limiter = ProviderRateLimiter(redis_client, rates={"google": 1}, burst_seconds=3, max_wait=0)
+
+    results = await asyncio.gather(*[limiter.acquire("google") for _ in range(5)], return_exceptions=True)
+
+    assert sum(result is None for result in results) == 3
+    assert sum(isinstance(result, RateLimitExceededError) for result in results) == 2
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from clients.scheduling_clients import AdmissionScheduler, SchedulerOverloadedError
+from utils import Deadline
+
+
+pytestmark = pytest.mark.anyio
+
+
+async def wait_for_queue(scheduler: AdmissionScheduler, size: int):
+    while scheduler.stats()["queue_depth"] < size:
+        await asyncio.sleep(0)
+
+
+async def test_admits_up_to_max_concurrency():
+    scheduler = AdmissionScheduler(max_concurrency=2)
+
+    await scheduler.acquire()
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire())
+    await wait_for_queue(scheduler, 1)
+    assert scheduler.stats()["active"] == 2
+
+    scheduler.release()
+    await waiter
+    assert scheduler.stats()["active"] == 2
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+async def test_waiters_are_admitted_by_priority():
+    scheduler = AdmissionScheduler(max_concurrency=1)
+    admitted = []
+
+    async def call(priority: str):
+        async with scheduler.slot(priority):
+            admitted.append(priority)
+
+    await scheduler.acquire()
+    tasks = [asyncio.create_task(call(priority)) for priority in ["prefetch", "batch", "prefetch", "interactive"]]
+    await wait_for_queue(scheduler, 4)
+
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+    assert admitted == ["interactive", "batch", "prefetch", "prefetch"]
+    assert scheduler.stats()["active"] == 0
+
+
+async def test_shed_after_the_max_queue_wait():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue_wait=0.05)
+    await scheduler.acquire()
+
+    with pytest.raises(asyncio.TimeoutError):
+        await scheduler.acquire("batch")
+
+    assert scheduler.shed["batch"] == 1
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+async def test_deadline_leaves_no_time_to_run():
+    scheduler = AdmissionScheduler(max_concurrency=1, min_run_time=1)
+    await scheduler.acquire()
+
+    # shed right away rather than after waiting
+    with pytest.raises(asyncio.TimeoutError):
+        await scheduler.acquire(deadline=Deadline(0.5))
+    assert scheduler.shed["interactive"] == 1
+
+
+async def test_full_queue_sheds_the_newest_lower_priority_waiter():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue_size=2)
+    await scheduler.acquire()
+
+    older = asyncio.create_task(scheduler.acquire("prefetch"))
+    newer = asyncio.create_task(scheduler.acquire("prefetch"))
+    await wait_for_queue(scheduler, 2)
+
+    interactive = asyncio.create_task(scheduler.acquire("interactive"))
+    with pytest.raises(SchedulerOverloadedError):
+        await newer
+    assert not older.done()
+
+    scheduler.release()
+    await interactive
+    assert not older.done()
+    older.cancel()
+
+
+async def test_full_queue_sheds_a_call_without_lower_priority_waiters():
+    scheduler = AdmissionScheduler(max_concurrency=1, max_queue_size=1)
+    await scheduler.acquire()
+    waiter = asyncio.create_task(scheduler.acquire("interactive"))
+    await wait_for_queue(scheduler, 1)
+
+    with pytest.raises(SchedulerOverloadedError):
+        await scheduler.acquire("prefetch")
+    assert scheduler.shed["prefetch"] == 1
+
+    waiter.cancel()
+
+
+async def test_cancelled_waiter_gives_its_turn_away():
+    scheduler = AdmissionScheduler(max_concurrency=1)
+    await scheduler.acquire()
+
+    cancelled = asyncio.create_task(scheduler.acquire())
+    waiter = asyncio.create_task(scheduler.acquire())
+    await wait_for_queue(scheduler, 2)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+
+    scheduler.release()
+    await waiter
+    assert scheduler.stats()["active"] == 1